@@ -1,28 +1,2886 @@
 import os
+import re
+import shlex
+import socket
+import asyncio
+import ipaddress
 import subprocess
 import sys
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext, simpledialog
-from time import sleep
-from threading import Thread
+from time import sleep, perf_counter
+from threading import Thread, Lock, Event
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from collections import Counter, OrderedDict, defaultdict, deque
 import webbrowser
-from PIL import Image, ImageTk
+import tempfile
+from PIL import Image, ImageTk, ImageChops, ImageDraw, ImageFilter, ImageStat
 import requests
 from io import BytesIO
 import json
+import sqlite3
+import queue
+import gzip
+import zlib
+import tarfile
+import hashlib
+import heapq
+import mmap
+import struct
+from array import array
+import bisect
+import codecs
 from datetime import datetime
 
 # Check and install required packages
 def install_packages():
-    required = ['pillow', 'requests']
-    for package in required:
+    required = {'pillow': 'PIL', 'requests': 'requests'}
+    for package, module in required.items():
         try:
-            __import__(package)
+            __import__(module)
         except ImportError:
             subprocess.check_call([sys.executable, "-m", "pip", "install", "--break-system-packages", package])
 
 install_packages()
 
+def list_devices():
+    """Return serials of connected devices that are ready for commands"""
+    try:
+        output = subprocess.check_output(['adb', 'devices'], text=True, stderr=subprocess.DEVNULL)
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return []
+
+    serials = []
+    for line in output.splitlines()[1:]:
+        parts = line.split()
+        if len(parts) >= 2 and parts[1] == 'device':
+            serials.append(parts[0])
+    return serials
+
+class DeviceTracker:
+    """Follows `adb track-devices` and reports the ready serials whenever they change.
+
+    `on_change(serials)` is called from the tracker thread, once with the
+    initial list and again after every connect, disconnect or state change.
+    The stream is reopened when the server goes away or restart() is called
+    (e.g. after switching ADB servers).
+    """
+
+    def __init__(self, on_change):
+        self.on_change = on_change
+        self.serials = None
+        self.process = None
+        self.running = False
+        self.thread = None
+
+    def _frames(self):
+        stream = self.process.stdout
+        while True:
+            size = stream.read(4)
+            try:
+                length = int(size, 16)
+            except ValueError:
+                return
+            yield stream.read(length).decode(errors='replace')
+
+    def _run(self):
+        delay = 1.0
+        while self.running:
+            try:
+                self.process = subprocess.Popen(['adb', 'track-devices'], stdout=subprocess.PIPE,
+                                                stderr=subprocess.DEVNULL)
+            except OSError:
+                return
+            for payload in self._frames():
+                delay = 1.0
+                serials = sorted(fields[0] for fields in (line.split() for line in payload.splitlines())
+                                 if len(fields) >= 2 and fields[1] == 'device')
+                if serials != self.serials:
+                    self.serials = serials
+                    self.on_change(serials)
+            self.process.wait()
+            # Back off while no server answers
+            for _ in range(int(delay * 10)):
+                if not self.running:
+                    return
+                sleep(0.1)
+            delay = min(30.0, delay * 2)
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.thread = Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def restart(self):
+        """Drop the current stream so the next one talks to the server now configured"""
+        self.serials = None
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+
+    def stop(self):
+        self.running = False
+        self.restart()
+
+def adb_args(serial=None):
+    """Return the adb argument prefix targeting a device"""
+    return ['adb', '-s', serial] if serial else ['adb']
+
+def device_key(serial=None):
+    """Return a cache key for the device adb would talk to, including the ADB server"""
+    return os.environ.get('ADB_SERVER_SOCKET', ''), serial or os.environ.get('ANDROID_SERIAL') or ''
+
+def forget_device_caches():
+    """Drop cached per-device probes, for when devices were replaced or rebooted"""
+    _shell_tools.clear()
+    _device_features.clear()
+
+FAST_TOOLS = {'pm': 'package', 'am': 'activity', 'settings': 'settings'}
+_shell_tools = {}
+
+def shell_tools(serial=None):
+    """Return the command prefix for pm, am and settings on a device.
+
+    `cmd <service>` talks to the system service over binder without starting
+    an app_process VM; it is used wherever `cmd -l` lists the service.
+    Detection runs once per device and ADB server and is cached until
+    forget_device_caches() is called.
+    """
+    key = device_key(serial)
+    tools = _shell_tools.get(key)
+    if tools is None:
+        try:
+            output = subprocess.run(adb_args(serial) + ['shell', 'cmd -l 2>/dev/null'], stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL, text=True, timeout=10).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            return dict((tool, tool) for tool in FAST_TOOLS)
+        services = set(output.split())
+        tools = {tool: f"cmd {service}" if service in services else tool for tool, service in FAST_TOOLS.items()}
+        _shell_tools[key] = tools
+    return tools
+
+def fast_command(command, serial=None):
+    """Rewrite a pm/am/settings shell command to its `cmd` equivalent when the device supports it"""
+    tool, _, rest = command.partition(' ')
+    if tool in FAST_TOOLS:
+        return f"{shell_tools(serial)[tool]} {rest}".rstrip()
+    return command
+
+def get_apk_paths(package, serial=None):
+    """Return device paths of the base and split APKs of a package"""
+    output = subprocess.check_output(adb_args(serial) + ['shell', shell_tools(serial)['pm'], 'path', package], text=True)
+    return [line[len('package:'):].strip() for line in output.splitlines() if line.startswith('package:')]
+
+COMPRESSED_EXTENSIONS = ('.apk', '.apks', '.aab', '.jar', '.zip', '.gz', '.tgz', '.xz', '.bz2', '.7z', '.zst',
+                         '.br', '.lz4', '.jpg', '.jpeg', '.png', '.webp', '.gif', '.heic', '.mp3', '.aac',
+                         '.ogg', '.opus', '.m4a', '.mp4', '.mkv', '.webm', '.3gp', '.mov')
+SYNC_COMPRESSION = ('zstd', 'lz4', 'brotli')
+_device_features = {}
+
+def device_features(serial=None):
+    """Return the transport features both adb and adbd support, cached per device"""
+    key = device_key(serial)
+    features = _device_features.get(key)
+    if features is None:
+        try:
+            output = subprocess.run(adb_args(serial) + ['features'], stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL, text=True, timeout=10).stdout
+        except (OSError, subprocess.TimeoutExpired):
+            return set()
+        features = set(output.replace(',', ' ').split())
+        probe = subprocess.run(adb_args(serial) + ['shell', 'command -v gzip >/dev/null && echo gzip'],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        features.update(probe.stdout.split())
+        _device_features[key] = features
+    return features
+
+def compression_ratio(path, samples=3, chunk=65536):
+    """Estimate compressed/original size of a local file from a few fast-deflated samples"""
+    if path.lower().endswith(COMPRESSED_EXTENSIONS):
+        return 1.0
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            original = packed = 0
+            for i in range(samples):
+                f.seek(size * i // samples)
+                data = f.read(chunk)
+                original += len(data)
+                packed += len(zlib.compress(data, 1))
+    except OSError:
+        return 1.0
+    return packed / original if original else 1.0
+
+class TransferStats:
+    """Per-device throughput of plain and compressed transfers, as moving averages.
+
+    Rates are in original bytes per second. Plain transfers measure the link;
+    compressed ones measure how fast the two ends compress, which caps the
+    gain on fast USB links. Every `probe`-th decision tries the other mode so
+    the estimates follow a link that changes speed.
+    """
+
+    def __init__(self, weight=0.3, probe=10):
+        self.weight = weight
+        self.probe = probe
+        self.rates = {}
+        self.ratios = {}
+        self.decisions = Counter()
+        self.lock = Lock()
+
+    def _average(self, table, key, value):
+        old = table.get(key)
+        table[key] = value if old is None else old + self.weight * (value - old)
+
+    def record(self, serial, mode, size, seconds, ratio=None):
+        if size < 256 << 10 or seconds <= 0:
+            return
+        with self.lock:
+            self._average(self.rates, (serial, mode), size / seconds)
+            if ratio is not None:
+                self._average(self.ratios, serial, ratio)
+
+    def pull_ratio(self, serial, default=0.5):
+        with self.lock:
+            return self.ratios.get(serial, default)
+
+    def should_compress(self, serial, ratio):
+        """Compress when the predicted rate beats sending the bytes as they are"""
+        if ratio > 0.9:
+            return False
+        with self.lock:
+            plain = self.rates.get((serial, 'plain'))
+            codec = self.rates.get((serial, 'compressed'))
+            self.decisions[serial] += 1
+            probing = self.decisions[serial] % self.probe == 0
+        if plain is None or codec is None:
+            return codec is None
+        choice = min(plain / max(ratio, 0.05), codec) > plain * 1.1
+        return not choice if probing else choice
+
+TRANSFER_STATS = TransferStats()
+
+def _local_size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+def transfer_file(direction, source, target, serial=None, stats=TRANSFER_STATS):
+    """Push or pull one path, compressing when content and link make it worthwhile.
+
+    Uses `adb push/pull -z` when adb and adbd share a sync compression
+    method, otherwise a gzip stream through exec-in/exec-out for single
+    files, otherwise a plain sync transfer. Returns (mode, bytes, seconds).
+    Raises subprocess.CalledProcessError on failure.
+    """
+    features = device_features(serial)
+    methods = [method for method in SYNC_COMPRESSION if f"sendrecv_v2_{method}" in features]
+    if direction == 'push':
+        ratio = compression_ratio(source) if os.path.isfile(source) else 0.5
+    else:
+        ratio = 1.0 if source.lower().endswith(COMPRESSED_EXTENSIONS) else stats.pull_ratio(serial)
+    compress = bool(methods or 'gzip' in features) and stats.should_compress(serial, ratio)
+    if direction == 'push':
+        directory = os.path.isdir(source)
+    elif compress and not methods:
+        # gzip streams single files only; device directories go through a plain pull
+        probe = subprocess.run(adb_args(serial) + ['shell', f"[ -d {shlex.quote(source)} ] && echo dir"],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        directory = probe.stdout.strip() == 'dir'
+    else:
+        directory = False
+
+    measured = None
+    start = perf_counter()
+    if compress and methods:
+        mode = 'compressed'
+        subprocess.run(adb_args(serial) + [direction, '-z', methods[0], source, target], check=True,
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    elif compress and not directory:
+        mode = 'compressed'
+        if direction == 'push':
+            name = shlex.quote(os.path.basename(source))
+            script = f"t={shlex.quote(target)}; [ -d \"$t\" ] && t=\"$t/\"{name}; gzip -d > \"$t\""
+            process = subprocess.Popen(adb_args(serial) + ['exec-in', script], stdin=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            with open(source, 'rb') as f, gzip.GzipFile(fileobj=process.stdin, mode='wb', compresslevel=1) as stream:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    stream.write(block)
+            process.stdin.close()
+            if process.wait():
+                raise subprocess.CalledProcessError(process.returncode, 'exec-in', stderr=process.stderr.read())
+        else:
+            if os.path.isdir(target):
+                target = os.path.join(target, os.path.basename(source.rstrip('/')))
+            process = subprocess.Popen(adb_args(serial) + ['exec-out', f"gzip -c -1 {shlex.quote(source)}"],
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            decoder = zlib.decompressobj(31)
+            packed = 0
+            try:
+                with open(target, 'wb') as f:
+                    for block in iter(lambda: process.stdout.read(1 << 20), b''):
+                        packed += len(block)
+                        f.write(decoder.decompress(block))
+                    f.write(decoder.flush())
+                if process.wait() or not decoder.eof:
+                    raise subprocess.CalledProcessError(process.returncode or 1, 'exec-out',
+                                                        stderr=process.stderr.read())
+            except (OSError, zlib.error, subprocess.CalledProcessError):
+                process.kill()
+                if os.path.exists(target):
+                    os.remove(target)
+                raise
+            measured = packed / max(os.path.getsize(target), 1)
+    else:
+        mode = 'plain'
+        subprocess.run(adb_args(serial) + [direction, source, target], check=True,
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    seconds = perf_counter() - start
+    size = _local_size(source if direction == 'push' else
+                       (os.path.join(target, os.path.basename(source.rstrip('/'))) if os.path.isdir(target) else target))
+    stats.record(serial, mode, size, seconds, measured)
+    return mode, size, seconds
+
+class InstallError(Exception):
+    """Raised when a package installer session fails"""
+
+def group_apks(paths):
+    """Group APK files into install sessions; base.apk and split_*.apk of one directory go together"""
+    splits = {}
+    sessions = []
+    for path in paths:
+        name = os.path.basename(path)
+        if name == 'base.apk' or name.startswith('split_'):
+            splits.setdefault(os.path.dirname(path), []).append(path)
+        else:
+            sessions.append([path])
+    return list(splits.values()) + sessions
+
+def _install_write(serial, session, index, apk, chunk_size=1 << 20):
+    """Stream one APK into an install session over stdin, return seconds taken"""
+    start = perf_counter()
+    size = os.path.getsize(apk)
+    name = f"{index}_{os.path.basename(apk)}"
+    process = subprocess.Popen(
+        adb_args(serial) + ['shell', shell_tools(serial)['pm'], 'install-write', '-S', str(size), session, name, '-'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+    with open(apk, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            process.stdin.write(chunk)
+    process.stdin.close()
+    output = process.stdout.read().decode(errors='replace')
+    process.wait()
+    if 'Success' not in output:
+        raise InstallError(f"install-write {name} failed: {output.strip()}")
+    return perf_counter() - start
+
+def install_apk_session(apks, serial=None, replace=True):
+    """Install base and split APKs in one pm session without staging them on the device.
+
+    Returns per-phase timings in seconds: create, write (wall time of the
+    concurrent writes), write_per_apk, commit and total.
+    """
+    timings = {}
+    start = perf_counter()
+    total_size = sum(os.path.getsize(apk) for apk in apks)
+    create = subprocess.run(
+        adb_args(serial) + ['shell', shell_tools(serial)['pm'], 'install-create']
+        + (['-r'] if replace else []) + ['-S', str(total_size)],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    match = re.search(r'\[(\d+)\]', create.stdout)
+    if not match:
+        raise InstallError(f"install-create failed: {create.stdout.strip()}")
+    session = match.group(1)
+    timings['create'] = perf_counter() - start
+
+    try:
+        phase = perf_counter()
+        with ThreadPoolExecutor(max_workers=min(4, len(apks))) as pool:
+            durations = pool.map(lambda item: _install_write(serial, session, *item), enumerate(apks))
+            timings['write_per_apk'] = dict(zip((os.path.basename(apk) for apk in apks), durations))
+        timings['write'] = perf_counter() - phase
+
+        phase = perf_counter()
+        commit = subprocess.run(
+            adb_args(serial) + ['shell', shell_tools(serial)['pm'], 'install-commit', session],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        if 'Success' not in commit.stdout:
+            raise InstallError(f"install-commit failed: {commit.stdout.strip()}")
+        timings['commit'] = perf_counter() - phase
+    except Exception:
+        subprocess.run(adb_args(serial) + ['shell', shell_tools(serial)['pm'], 'install-abandon', session],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        raise
+
+    timings['total'] = perf_counter() - start
+    timings['bytes'] = total_size
+    return timings
+
+def get_package_version(package, serial=None):
+    """Return (versionCode, versionName) of an installed package"""
+    output = subprocess.check_output(adb_args(serial) + ['shell', 'dumpsys', 'package', package], text=True)
+    code = re.search(r'versionCode=(\d+)', output)
+    name = re.search(r'versionName=(\S+)', output)
+    return (code.group(1) if code else '0'), (name.group(1) if name else '')
+
+class ApkStore:
+    """Content-addressed APK backups.
+
+    APK files live once under objects/<sha256[:2]>/<sha256>; every backup
+    writes manifests/<serial>/<package>/<versionCode>.json pointing at them.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+
+    def object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def manifest_path(self, serial, package, version_code):
+        return os.path.join(self.root, 'manifests', serial, package, f"{version_code}.json")
+
+    def remote_hashes(self, paths, serial=None):
+        """Hash APKs on the device in one call; empty if sha256sum is unavailable"""
+        try:
+            output = subprocess.check_output(adb_args(serial) + ['shell', 'sha256sum'] + paths,
+                                             text=True, stderr=subprocess.DEVNULL)
+        except subprocess.CalledProcessError:
+            return {}
+        hashes = {}
+        for line in output.splitlines():
+            parts = line.split(None, 1)
+            if len(parts) == 2 and re.fullmatch(r'[0-9a-f]{64}', parts[0]):
+                hashes[parts[1].strip()] = parts[0]
+        return hashes
+
+    def pull(self, path, serial=None, expected=None, chunk_size=1 << 20):
+        """Stream a device file into the store, return (digest, size).
+
+        With `expected`, a transfer whose sha256 differs from the on-device
+        digest is discarded instead of being stored under the wrong content.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                process = subprocess.Popen(adb_args(serial) + ['exec-out', 'cat', path], stdout=subprocess.PIPE)
+                for chunk in iter(lambda: process.stdout.read(chunk_size), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+                if process.wait() != 0:
+                    raise subprocess.CalledProcessError(process.returncode, f"exec-out cat {path}")
+            if expected and digest.hexdigest() != expected:
+                raise ValueError(f"{path} changed in transfer: sha256 {digest.hexdigest()}, device has {expected}")
+            target = self.object_path(digest.hexdigest())
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(temp, target)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        return digest.hexdigest(), size
+
+    def _store_apk(self, path, remote_digest, serial):
+        """Return (manifest entry, pulled) for one APK, skipping the pull if it is already stored"""
+        if remote_digest and os.path.exists(self.object_path(remote_digest)):
+            digest, size, pulled = remote_digest, os.path.getsize(self.object_path(remote_digest)), False
+        else:
+            digest, size = self.pull(path, serial, remote_digest)
+            pulled = True
+        return {'path': path, 'name': os.path.basename(path), 'sha256': digest, 'size': size}, pulled
+
+    def backup_package(self, package, serial, workers=4):
+        """Back up every APK of a package, return (manifest, number of APKs pulled)"""
+        paths = get_apk_paths(package, serial)
+        if not paths:
+            raise ValueError(f"{package} is not installed on {serial}")
+        version_code, version_name = get_package_version(package, serial)
+        remote = self.remote_hashes(paths, serial)
+        with ThreadPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            results = list(pool.map(lambda path: self._store_apk(path, remote.get(path), serial), paths))
+
+        manifest = {
+            'serial': serial,
+            'package': package,
+            'version_code': version_code,
+            'version_name': version_name,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'apks': [entry for entry, _ in results],
+        }
+        target = self.manifest_path(serial, package, version_code)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        return manifest, sum(1 for _, pulled in results if pulled)
+
+    def backup_packages(self, packages, serial, workers=4):
+        """Back up many packages of one device, yielding (package, manifest, pulled, error)"""
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(self.backup_package, package, serial): package for package in packages}
+            for future in as_completed(futures):
+                try:
+                    manifest, pulled = future.result()
+                    yield futures[future], manifest, pulled, None
+                except Exception as e:
+                    yield futures[future], None, 0, e
+
+PARTITION_DIR = "/dev/block/bootdevice/by-name"
+
+def _partition_read(serial, device_path, offset, length, block_size):
+    """Start a dd of part of a partition streamed to the host over exec-out"""
+    command = (f"su -c 'dd if={device_path} bs={block_size} skip={offset // block_size} "
+               f"count={-(-length // block_size)} 2>/dev/null'")
+    return subprocess.Popen(adb_args(serial) + ['exec-out', command], stdout=subprocess.PIPE)
+
+def _rehash_image(filename, compress, limit, chunk_size=1 << 20):
+    """Return a sha256 object over the first `limit` raw bytes of an existing image"""
+    digest = hashlib.sha256()
+    opener = gzip.open if compress else open
+    remaining = limit
+    with opener(filename, 'rb') as f:
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            digest.update(data)
+            remaining -= len(data)
+    return digest
+
+def image_partition(partition, filename, serial=None, compress=True, chunk_size=64 << 20,
+                    block_size=1 << 20, progress=None):
+    """Image a partition straight into a host file and return its sha256.
+
+    The partition is read in chunks of `chunk_size` over exec-out. Each chunk
+    becomes one gzip member when compressing; otherwise zero blocks are
+    skipped, leaving a sparse file. Finished chunks are recorded in
+    `<filename>.progress`, so an interrupted run resumes where it stopped.
+    `progress(done, total, bytes_per_second)` is called as data arrives.
+    """
+    device_path = f"{PARTITION_DIR}/{partition}"
+    size = int(subprocess.check_output(
+        adb_args(serial) + ['shell', f"su -c 'blockdev --getsize64 {device_path}'"], text=True).strip())
+    state_file = filename + '.progress'
+    state = {'device_path': device_path, 'size': size, 'chunk_size': chunk_size,
+             'compress': compress, 'chunks_done': 0, 'out_offset': 0}
+    if os.path.exists(state_file) and os.path.exists(filename):
+        with open(state_file) as f:
+            saved = json.load(f)
+        if all(saved.get(key) == state[key] for key in ('device_path', 'size', 'chunk_size', 'compress')):
+            state = saved
+
+    done = state['chunks_done'] * chunk_size
+    digest = _rehash_image(filename, compress, done) if done else hashlib.sha256()
+    zero_block = bytes(block_size)
+    start, transferred = perf_counter(), 0
+    with open(filename, 'r+b' if done else 'wb') as out:
+        out.truncate(state['out_offset'])
+        out.seek(state['out_offset'] if compress else done)
+        while done < size:
+            length = min(chunk_size, size - done)
+            process = _partition_read(serial, device_path, done, length, block_size)
+            compressor = zlib.compressobj(1, zlib.DEFLATED, 31) if compress else None
+            received = 0
+            while received < length:
+                block = process.stdout.read(min(block_size, length - received))
+                if not block:
+                    break
+                digest.update(block)
+                received += len(block)
+                if compressor:
+                    out.write(compressor.compress(block))
+                elif block == zero_block[:len(block)]:
+                    out.seek(len(block), os.SEEK_CUR)
+                else:
+                    out.write(block)
+                if progress:
+                    progress(done + received, size, (transferred + received) / max(perf_counter() - start, 1e-6))
+            process.stdout.close()
+            process.wait()
+            if received != length:
+                raise IOError(f"Short read from {device_path} at offset {done}: {received} of {length} bytes")
+            done += length
+            transferred += length
+            if compressor:
+                out.write(compressor.flush())
+            else:
+                out.truncate(done)
+            out.flush()
+            state.update(chunks_done=state['chunks_done'] + 1, out_offset=out.tell())
+            with open(state_file, 'w') as f:
+                json.dump(state, f)
+
+    os.remove(state_file)
+    with open(filename + '.sha256', 'w') as f:
+        f.write(f"{digest.hexdigest()}  {partition}.img\n")
+    return digest.hexdigest()
+
+def device_partition_hash(partition, serial=None):
+    """Return the sha256 of a partition computed on the device"""
+    output = subprocess.check_output(
+        adb_args(serial) + ['shell', f"su -c 'sha256sum {PARTITION_DIR}/{partition}'"], text=True)
+    return output.split()[0] if output.strip() else None
+
+class AndroidBackupReader:
+    """File-like reader over the tar payload of an Android .ab backup.
+
+    The header is parsed on open and the zlib payload is inflated as it is
+    read, so memory stays constant regardless of the backup size.
+    """
+
+    MAGIC = b"ANDROID BACKUP"
+
+    def __init__(self, f, chunk_size=1 << 16):
+        self.file = f
+        self.chunk_size = chunk_size
+        if f.readline().rstrip(b"\n") != self.MAGIC:
+            raise ValueError("Not an Android backup file")
+        self.version = int(f.readline().strip() or 0)
+        self.compressed = f.readline().strip() == b"1"
+        self.encryption = f.readline().strip().decode()
+        if self.encryption != "none":
+            raise ValueError(f"Encrypted backups ({self.encryption}) are not supported")
+        self.decompressor = zlib.decompressobj() if self.compressed else None
+        self.buffer = bytearray()
+        self.finished = False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = float('inf')
+        while len(self.buffer) < size and not self.finished:
+            if self.decompressor is None:
+                data = self.file.read(self.chunk_size)
+                if not data:
+                    self.finished = True
+                self.buffer += data
+                continue
+            data = self.decompressor.unconsumed_tail or self.file.read(self.chunk_size)
+            if not data:
+                self.buffer += self.decompressor.flush()
+                self.finished = True
+                continue
+            self.buffer += self.decompressor.decompress(data, self.chunk_size * 4)
+            if self.decompressor.eof:
+                self.finished = True
+        if size == float('inf'):
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def complete(self):
+        """Return True if the compressed stream ended with a valid checksum"""
+        return self.decompressor is None or self.decompressor.eof
+
+def ab_members(reader):
+    """Yield (tarfile, member) for each entry of an opened backup, in stream order"""
+    with tarfile.open(fileobj=reader, mode='r|') as tar:
+        for member in tar:
+            yield tar, member
+
+def ab_package_of(member_name):
+    """Return the package an .ab tar entry belongs to (entries are apps/<package>/...)"""
+    parts = member_name.split('/')
+    return parts[1] if len(parts) > 2 and parts[0] == 'apps' else None
+
+def ab_list(path):
+    """Yield (name, size) for every entry of a backup"""
+    with open(path, 'rb') as f:
+        for _, member in ab_members(AndroidBackupReader(f)):
+            yield member.name, member.size
+
+def ab_extract_package(path, package, destination):
+    """Extract the entries of one app from a backup, return how many were written"""
+    count = 0
+    with open(path, 'rb') as f:
+        for tar, member in ab_members(AndroidBackupReader(f)):
+            if ab_package_of(member.name) == package:
+                if hasattr(tarfile, 'data_filter'):
+                    tar.extract(member, destination, filter='data')
+                else:
+                    tar.extract(member, destination)
+                count += 1
+    return count
+
+def ab_to_tar(path, tar_path, chunk_size=1 << 20):
+    """Convert a backup into a plain tar file, return bytes written"""
+    written = 0
+    with open(path, 'rb') as f, open(tar_path, 'wb') as out:
+        reader = AndroidBackupReader(f)
+        for data in iter(lambda: reader.read(chunk_size), b''):
+            out.write(data)
+            written += len(data)
+        if not reader.complete():
+            raise IOError("Backup is truncated")
+    return written
+
+def ab_verify(path):
+    """Read a whole backup through tar and zlib, return (entries, payload bytes, packages)"""
+    entries, total, packages = 0, 0, set()
+    with open(path, 'rb') as f:
+        reader = AndroidBackupReader(f)
+        for tar, member in ab_members(reader):
+            entries += 1
+            total += member.size
+            packages.add(ab_package_of(member.name))
+            if member.isfile():
+                data = tar.extractfile(member)
+                while data.read(1 << 20):
+                    pass
+        if not reader.complete():
+            raise IOError("Backup is truncated or its checksum does not match")
+    packages.discard(None)
+    return entries, total, sorted(packages)
+
+LOGCAT_HEADER = re.compile(r'^\S+\s+\S+\s+(\d+)\s+\d+\s+([VDIWEFA])\s+(.*?)\s*: ')
+LOGCAT_MAX_LINES = 100000
+
+def _literal_trie_pattern(words):
+    """Build a regex matching any of the words, factored as a trie so matching cost does not grow per word"""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+class LogcatRuleEngine:
+    """Matches many logcat rules against each line in a single pass.
+
+    Rules are dicts with a name, a type (substring, regex, tag, level or pid),
+    a pattern, and an optional action (highlight with a color, console) and
+    callback. A trie-shaped regex finds the positions where any substring
+    starts, and a walk of the same trie from each of them reports every
+    substring there, including ones that overlap or prefix each other.
+    Regexes without groups or global flags are combined into one alternation
+    used as a prefilter, and lines it accepts are searched with each of them
+    on its own. Regexes with groups or flags, which cannot be safely joined,
+    are searched on every line. Tag, level and pid rules
+    are dictionary lookups on the parsed threadtime header. Each matching
+    rule is reported once per line.
+    """
+
+    TYPES = ('substring', 'regex', 'tag', 'level', 'pid')
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self.counts = Counter()
+        self.literals = defaultdict(list)
+        self.predicates = {'tag': defaultdict(list), 'level': defaultdict(list), 'pid': defaultdict(list)}
+        regex_parts = []
+        self.regexes = []
+        self.unfiltered = []
+        for index, rule in enumerate(self.rules):
+            kind, pattern = rule.get('type', 'substring'), str(rule['pattern'])
+            if kind not in self.TYPES:
+                raise ValueError(f"Unknown rule type '{kind}' in rule {rule.get('name', index)}")
+            if kind == 'substring':
+                self.literals[pattern].append(index)
+            elif kind == 'regex':
+                try:
+                    regex = re.compile(pattern)
+                except re.error as e:
+                    raise ValueError(f"Invalid rule regex in rule {rule.get('name', index)}: {e}")
+                # Group names, backreference numbers and global flags would change meaning in a joined alternation
+                if regex.groups or regex.flags & ~re.UNICODE:
+                    self.unfiltered.append((index, regex))
+                else:
+                    regex_parts.append(f"(?:{pattern})")
+                    self.regexes.append((index, regex))
+            else:
+                self.predicates[kind][pattern].append(index)
+        self.literal_trie = {}
+        for word, indices in self.literals.items():
+            node = self.literal_trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[None] = indices
+        self.literal_matcher = (re.compile(f"(?={_literal_trie_pattern(self.literals)})")
+                                if self.literals else None)
+        self.regex_matcher = re.compile('|'.join(regex_parts)) if regex_parts else None
+        self.needs_header = any(self.predicates.values())
+
+    def match(self, line):
+        """Return indices of the rules matching a line"""
+        hits = set()
+        if self.literal_matcher:
+            for found in self.literal_matcher.finditer(line):
+                # Walk the trie from this start to collect every substring ending along the way
+                node = self.literal_trie
+                for char in line[found.start():]:
+                    node = node.get(char)
+                    if node is None:
+                        break
+                    if None in node:
+                        hits.update(node[None])
+        if self.regex_matcher and self.regex_matcher.search(line):
+            hits.update(index for index, regex in self.regexes if regex.search(line))
+        hits.update(index for index, regex in self.unfiltered if regex.search(line))
+        if self.needs_header:
+            header = LOGCAT_HEADER.match(line)
+            if header:
+                pid, level, tag = header.groups()
+                hits.update(self.predicates['tag'].get(tag, ()))
+                hits.update(self.predicates['level'].get(level, ()))
+                hits.update(self.predicates['pid'].get(pid, ()))
+        return sorted(hits)
+
+    def process(self, line):
+        """Match a line, update counters and run callbacks"""
+        hits = self.match(line)
+        if hits:
+            self.counts.update(hits)
+            for index in hits:
+                callback = self.rules[index].get('callback')
+                if callback:
+                    callback(self.rules[index], line)
+        return hits
+
+    def summary(self):
+        """Return (rule name, match count) pairs"""
+        return [(rule.get('name', f"rule {index}"), self.counts[index]) for index, rule in enumerate(self.rules)]
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "adbhelper")
+
+def _dumpsys_node(title, start):
+    return {'title': title, 'start': start, 'end': start, 'children': []}
+
+def index_dumpsys(lines, out, max_depth=8):
+    """Copy dumpsys output lines (bytes) to `out` and index its sections in the same pass.
+
+    Returns the root node. Each node has a title, byte offsets start/end into
+    the written file and child nodes: `DUMP OF SERVICE name:` sections at the
+    top, then any line ending in ':' that is followed by more indented lines.
+    """
+    root = _dumpsys_node('dumpsys', 0)
+    stack = [(-2, root)]
+    pending = None
+    offset = 0
+
+    def close(to_indent):
+        while len(stack) > 1 and stack[-1][0] >= to_indent:
+            stack.pop()[1]['end'] = offset
+
+    for line in lines:
+        out.write(line)
+        stripped = line.strip()
+        if stripped:
+            if stripped.startswith(b'DUMP OF SERVICE '):
+                close(-1)
+                node = _dumpsys_node(stripped.decode(errors='replace'), offset)
+                root['children'].append(node)
+                stack.append((-1, node))
+                pending = None
+            else:
+                indent = len(line) - len(line.lstrip(b' \t'))
+                if pending and indent > pending[0] and len(stack) < max_depth:
+                    node = _dumpsys_node(pending[1], pending[2])
+                    stack[-1][1]['children'].append(node)
+                    stack.append((pending[0], node))
+                pending = None
+                close(max(indent, 0))
+                if stripped.endswith(b':') and len(stripped) < 160:
+                    pending = (indent, stripped.decode(errors='replace'), offset)
+        offset += len(line)
+    close(-1)
+    root['end'] = offset
+    return root
+
+def dumpsys_to_cache(args, name, serial=None):
+    """Stream `dumpsys <args>` into a cache file, return (path, section index).
+
+    The output goes to a fresh file that replaces the old one, so viewers
+    still mapping the previous dump keep reading their own copy.
+    """
+    directory = os.path.join(CACHE_DIR, 'dumpsys')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, re.sub(r'[^\w.-]+', '_', name) + '.txt')
+    fd, temp = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            process = subprocess.Popen(adb_args(serial) + ['shell', 'dumpsys'] + args, stdout=subprocess.PIPE)
+            index = index_dumpsys(process.stdout, out)
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, f"dumpsys {' '.join(args)}")
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+    return path, index
+
+def find_dumpsys_sections(node, title):
+    """Yield every node below `node` with the given title"""
+    for child in node['children']:
+        if child['title'] == title:
+            yield child
+        yield from find_dumpsys_sections(child, title)
+
+def read_dumpsys_section(path, node, limit=None):
+    """Read the text of an indexed section"""
+    with open(path, 'rb') as f:
+        f.seek(node['start'])
+        size = node['end'] - node['start']
+        return f.read(size if limit is None else min(size, limit)).decode(errors='replace')
+
+CRASH_FILTER = ["AndroidRuntime:E", "ActivityManager:E", "DEBUG:*", "tombstoned:*", "*:S"]
+CRASH_START = re.compile(r'FATAL EXCEPTION|^ANR in |^\*\*\* \*\*\* \*\*\*')
+CRASH_NOISE = [(re.compile(r'0x[0-9a-fA-F]+|\b[0-9a-f]{8,}\b'), '<hex>'), (re.compile(r'\d+'), '<n>'),
+               (re.compile(r'"[^"]*"|\'[^\']*\''), '<str>')]
+
+def _normalize_frame(line):
+    line = line.strip()
+    line = re.sub(r'\((\w+\.(?:java|kt)):\d+\)', r'(\1)', line)
+    line = re.sub(r'\$\$?Lambda\$?[\w$]*', '$Lambda', line)
+    native = re.match(r'#\d+ pc [0-9a-f]+\s+(\S+)(?:.*\((\S+?)(?:\+\d+)?\))?', line)
+    if native:
+        return f"{native.group(1)} {native.group(2) or ''}".strip()
+    for pattern, replacement in CRASH_NOISE:
+        line = pattern.sub(replacement, line)
+    return line
+
+class CrashCollector:
+    """Groups crashes, ANRs and native crashes from logcat by a normalized stack hash.
+
+    Lines are fed from `logcat -b crash,main,system` filtered on the device to
+    the few tags that report crashes. An event lasts while lines keep coming
+    from the pid and tag that started it; its signature is the exception or
+    signal line plus the top frames with line numbers, addresses and ids
+    stripped. Only the first occurrence of a group keeps its full text and
+    pulls the tombstone or ANR trace it names.
+    """
+
+    def __init__(self, report_dir, serial=None, frames=8):
+        self.report_dir = report_dir
+        self.serial = serial
+        self.frames = frames
+        self.groups = {}
+        self.current = None
+        self.pulled = set()
+        self.process = None
+        self.thread = None
+        self.on_group = None
+        self.latest = None
+        self.lock = Lock()
+
+    def feed(self, line):
+        with self.lock:
+            self._feed(line)
+
+    def _feed(self, line):
+        header = LOGCAT_HEADER.match(line)
+        if not header:
+            return
+        pid, level, tag = header.groups()
+        message = line[header.end():].rstrip('\n')
+        if self.current and (pid, tag) == self.current['source'] and not CRASH_START.search(message):
+            self.current['lines'].append(message)
+            self.current['updated'] = perf_counter()
+            return
+        self._finish()
+        if tag == 'tombstoned' and 'Tombstone written to:' in message:
+            self._attach(message.split(':', 1)[1].strip())
+        elif CRASH_START.search(message):
+            kind = 'anr' if message.startswith('ANR in') else 'java' if 'FATAL EXCEPTION' in message else 'native'
+            self.current = {'source': (pid, tag), 'kind': kind, 'lines': [message],
+                            'time': ' '.join(line.split()[:2]), 'updated': perf_counter()}
+
+    def finish(self, idle=0.0):
+        """Close the event being assembled, if quiet for `idle` seconds, and account it to its group"""
+        with self.lock:
+            if self.current and perf_counter() - self.current['updated'] >= idle:
+                self._finish()
+
+    def _finish(self):
+        event, self.current = self.current, None
+        if not event:
+            return
+        kind, lines = event['kind'], event['lines']
+        package, signature, frames = '', lines[0], []
+        for text in lines[1:]:
+            stripped = text.strip()
+            native_name = re.search(r'>>> (\S+) <<<', stripped)
+            if native_name:
+                package = native_name.group(1)
+            elif stripped.startswith('Process:'):
+                package = stripped.split()[1].rstrip(',')
+            elif kind == 'anr' and stripped.startswith('Reason:'):
+                signature = stripped
+            elif kind == 'native' and stripped.startswith('signal '):
+                signature = stripped.split(',')[0]
+            elif kind == 'java' and not frames and not stripped.startswith('at ') and '.' in stripped.split(':')[0]:
+                signature = stripped.split(':')[0]
+            elif stripped.startswith('at ') or stripped.startswith('#'):
+                if len(frames) < self.frames:
+                    frames.append(_normalize_frame(stripped))
+        if kind == 'anr':
+            package = lines[0].split()[2] if len(lines[0].split()) > 2 else package
+        digest = hashlib.sha1('\n'.join([kind, package, _normalize_frame(signature)] + frames).encode()).hexdigest()[:12]
+        group = self.groups.get(digest)
+        if group is None:
+            group = self.groups[digest] = {'hash': digest, 'kind': kind, 'package': package,
+                                           'signature': signature, 'frames': frames, 'count': 0,
+                                           'first_seen': event['time'], 'last_seen': event['time'],
+                                           'sample': lines, 'artifacts': []}
+            if kind == 'anr':
+                Thread(target=self._pull_latest_anr, args=(group,), daemon=True).start()
+        group['count'] += 1
+        group['last_seen'] = event['time']
+        self.latest = group
+        if self.on_group:
+            self.on_group(group)
+
+    def _attach(self, path):
+        """A tombstone path follows the native crash it belongs to"""
+        group = self.latest
+        if group and group['kind'] == 'native' and group['count'] == 1 and path not in self.pulled:
+            # Claimed here, under the feed lock, so a repeated tombstone line cannot start a second pull
+            self.pulled.add(path)
+            Thread(target=self._pull, args=(group, path), daemon=True).start()
+
+    def _pull(self, group, path):
+        os.makedirs(self.report_dir, exist_ok=True)
+        target = os.path.join(self.report_dir, f"{group['hash']}_{os.path.basename(path)}")
+        with open(target, 'wb') as out:
+            subprocess.run(adb_args(self.serial) + ['exec-out', 'cat', path], stdout=out, stderr=subprocess.DEVNULL)
+        if os.path.getsize(target):
+            with self.lock:
+                group['artifacts'].append(target)
+        else:
+            os.remove(target)
+
+    def _pull_latest_anr(self, group):
+        output = subprocess.run(adb_args(self.serial) + ['shell', 'ls -t /data/anr 2>/dev/null | head -n 1'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+        path = f"/data/anr/{output}"
+        with self.lock:
+            if not output or path in self.pulled:
+                return
+            self.pulled.add(path)
+        self._pull(group, path)
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.feed(line)
+        self.finish()
+
+    def _flush_idle(self):
+        # Crash output arrives in a burst; close an event once its source goes quiet
+        while self.running():
+            sleep(0.5)
+            self.finish(idle=1.0)
+
+    def start(self):
+        self.process = subprocess.Popen(adb_args(self.serial) + ['logcat', '-b', 'crash,main,system', '-v', 'threadtime',
+                                                                 '-T', '1'] + CRASH_FILTER,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                        errors='replace')
+        self.thread = Thread(target=self._read, daemon=True)
+        self.thread.start()
+        Thread(target=self._flush_idle, daemon=True).start()
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.running():
+            self.process.terminate()
+
+    def write_report(self):
+        """Write crash_report.json and a text summary, return the summary path"""
+        os.makedirs(self.report_dir, exist_ok=True)
+        with self.lock:
+            groups = sorted((dict(group, artifacts=list(group['artifacts'])) for group in self.groups.values()),
+                            key=lambda group: -group['count'])
+        with open(os.path.join(self.report_dir, 'crash_report.json'), 'w') as f:
+            json.dump(groups, f, indent=1)
+        path = os.path.join(self.report_dir, 'crash_report.txt')
+        with open(path, 'w') as f:
+            for group in groups:
+                f.write(f"[{group['hash']}] {group['kind']} {group['package']} x{group['count']} "
+                        f"({group['first_seen']} .. {group['last_seen']})\n  {group['signature']}\n")
+                f.writelines(f"    {frame}\n" for frame in group['frames'])
+                f.writelines(f"  artifact: {artifact}\n" for artifact in group['artifacts'])
+                f.write("\n")
+        return path
+
+SCREENSHOT_THUMB = (32, 32)
+
+def screenshot_signature(path, thumbnail=False):
+    """Return (sha1 of the file, 32x32 grayscale thumbnail bytes or None) for fast pre-checks"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not thumbnail:
+        return hashlib.sha1(data).hexdigest(), None
+    with Image.open(BytesIO(data)) as image:
+        image.draft('L', (image.width // 8, image.height // 8))
+        thumb = image.convert('L').resize(SCREENSHOT_THUMB, Image.BILINEAR)
+    return hashlib.sha1(data).hexdigest(), thumb.tobytes()
+
+def thumbnail_distance(a, b):
+    """Mean absolute difference of two signature thumbnails, 0-255"""
+    return ImageStat.Stat(ImageChops.difference(Image.frombytes('L', SCREENSHOT_THUMB, a),
+                                                Image.frombytes('L', SCREENSHOT_THUMB, b))).mean[0]
+
+def _changed_regions(binary, cell=8):
+    """Group changed pixels into bounding boxes by flood-filling a downscaled grid"""
+    width, height = binary.size
+    grid = binary.resize((max(1, width // cell), max(1, height // cell)), Image.BOX).point(lambda v: 255 if v else 0)
+    cols, rows = grid.size
+    cells = grid.tobytes()
+    seen = bytearray(len(cells))
+    boxes = []
+    for start in range(len(cells)):
+        if not cells[start] or seen[start]:
+            continue
+        seen[start] = 1
+        stack = [start]
+        x0, y0, x1, y1 = cols, rows, 0, 0
+        while stack:
+            index = stack.pop()
+            y, x = divmod(index, cols)
+            x0, y0, x1, y1 = min(x0, x), min(y0, y), max(x1, x), max(y1, y)
+            for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                if 0 <= nx < cols and 0 <= ny < rows:
+                    neighbour = ny * cols + nx
+                    if cells[neighbour] and not seen[neighbour]:
+                        seen[neighbour] = 1
+                        stack.append(neighbour)
+        boxes.append((x0 * width // cols, y0 * height // rows,
+                      min(width, (x1 + 1) * width // cols), min(height, (y1 + 1) * height // rows)))
+    return boxes
+
+def diff_screenshots(baseline, candidate, masks=(), threshold=24, diff_path=None):
+    """Compare two screenshots with Pillow's C-level image ops.
+
+    Screens of different sizes are compared at the smaller size. Masked
+    boxes (in baseline pixels) are ignored. Returns the share of changed
+    pixels, a perceptual score (mean luma difference after a blur, 0-1), the
+    changed-region boxes and, if asked, writes an overlay highlighting them.
+    """
+    with Image.open(baseline) as a_file, Image.open(candidate) as b_file:
+        a, b = a_file.convert('RGB'), b_file.convert('RGB')
+    scale = 1.0
+    if a.size != b.size:
+        size = min(a.size, b.size, key=lambda item: item[0] * item[1])
+        scale = size[0] / a.width
+        a, b = a.resize(size, Image.BILINEAR), b.resize(size, Image.BILINEAR)
+
+    difference = ImageChops.difference(a, b).convert('L')
+    if masks:
+        draw = ImageDraw.Draw(difference)
+        for box in masks:
+            draw.rectangle([round(value * scale) for value in box], fill=0)
+    binary = difference.point(lambda v: 255 if v > threshold else 0)
+    changed = binary.histogram()[255]
+    total = binary.width * binary.height
+
+    # Perceptual score at half resolution: blurred luma is smooth enough not to need full size
+    blur = ImageFilter.GaussianBlur(1)
+    perceptual = ImageChops.difference(a.convert('L').reduce(2).filter(blur), b.convert('L').reduce(2).filter(blur))
+    if masks:
+        draw = ImageDraw.Draw(perceptual)
+        for box in masks:
+            draw.rectangle([round(value * scale / 2) for value in box], fill=0)
+    boxes = _changed_regions(binary) if changed else []
+
+    if diff_path and changed:
+        overlay = b.copy()
+        overlay.paste((255, 0, 0), mask=binary)
+        draw = ImageDraw.Draw(overlay)
+        for box in boxes:
+            draw.rectangle(box, outline=(255, 255, 0), width=3)
+        overlay.save(diff_path)
+
+    return {
+        'changed_ratio': changed / total,
+        'perceptual': ImageStat.Stat(perceptual).mean[0] / 255,
+        'boxes': [[round(value / scale) for value in box] for box in boxes],
+        'size': list(a.size),
+    }
+
+def _diff_pair(pair, masks, threshold, diff_dir):
+    baseline, candidate = pair
+    diff_path = os.path.join(diff_dir, os.path.basename(candidate) + '.diff.png') if diff_dir else None
+    try:
+        return dict(diff_screenshots(baseline, candidate, masks, threshold, diff_path),
+                    baseline=baseline, candidate=candidate, identical=False)
+    except (OSError, ValueError) as e:
+        return {'baseline': baseline, 'candidate': candidate, 'error': str(e)}
+
+def compare_screenshot_pairs(pairs, masks=(), threshold=24, diff_dir=None, workers=None, same_thumb=None):
+    """Diff many screenshot pairs in a process pool.
+
+    Every file is hashed and thumbnailed once, so byte-identical pairs are
+    settled by comparing two digests. Passing `same_thumb` also accepts pairs
+    whose thumbnails differ by less than that (mean, 0-255) without a full
+    diff; it is off by default because a changed clock can hide at 32x32.
+    """
+    if diff_dir:
+        os.makedirs(diff_dir, exist_ok=True)
+    files = sorted({path for pair in pairs for path in pair})
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        signatures = dict(zip(files, pool.map(screenshot_signature, files, [same_thumb is not None] * len(files),
+                                              chunksize=16)))
+        results, pending = [], []
+        for baseline, candidate in pairs:
+            (hash_a, thumb_a), (hash_b, thumb_b) = signatures[baseline], signatures[candidate]
+            if hash_a == hash_b or (same_thumb is not None and thumbnail_distance(thumb_a, thumb_b) < same_thumb):
+                results.append({'baseline': baseline, 'candidate': candidate, 'identical': True,
+                                'changed_ratio': 0.0, 'perceptual': 0.0, 'boxes': []})
+            else:
+                pending.append((baseline, candidate))
+        futures = [pool.submit(_diff_pair, pair, masks, threshold, diff_dir) for pair in pending]
+        results += [future.result() for future in futures]
+    return results
+
+THUMB_SIZE = (96, 96)
+THUMB_PROBE_BYTES = 65536
+THUMB_MAX_FULL_READ = 2 << 20
+SHARED_STORAGE_ROOTS = ('/sdcard', '/storage/emulated/0', '/storage/self/primary', '/mnt/sdcard')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.3gp', '.mov')
+
+def list_device_dir(path, serial=None):
+    """Return [(name, size, mtime, is_dir)] for a device directory from one stat call"""
+    command = f"cd {shlex.quote(path)} && stat -c '%s %Y %A %n' -- * .[!.]* 2>/dev/null"
+    output = subprocess.run(adb_args(serial) + ['shell', command], stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True, errors='replace').stdout
+    entries = []
+    for line in output.splitlines():
+        fields = line.split(None, 3)
+        if len(fields) == 4 and fields[0].isdigit() and fields[1].isdigit():
+            entries.append((fields[3], int(fields[0]), int(fields[1]), fields[2].startswith('d')))
+    return entries
+
+def exif_thumbnail(data):
+    """Return the JPEG thumbnail embedded in an EXIF APP1 segment, if the data holds one"""
+    if not data.startswith(b'\xff\xd8'):
+        return None
+    position = 2
+    while position + 4 <= len(data) and data[position] == 0xFF:
+        marker = data[position + 1]
+        length = int.from_bytes(data[position + 2:position + 4], 'big')
+        if marker == 0xE1 and data[position + 4:position + 10] == b'Exif\0\0':
+            segment = data[position + 10:position + 2 + length]
+            start = segment.find(b'\xff\xd8', 8)
+            end = segment.find(b'\xff\xd9', start)
+            return segment[start:end + 2] if start >= 0 and end >= 0 else None
+        if marker == 0xDA:
+            break
+        position += 2 + length
+    return None
+
+def make_thumbnail(data):
+    """Decode image bytes (or their EXIF thumbnail) at reduced size, return PNG bytes"""
+    embedded = exif_thumbnail(data[:THUMB_PROBE_BYTES])
+    with Image.open(BytesIO(embedded or data)) as image:
+        image.draft('RGB', THUMB_SIZE)
+        image.thumbnail(THUMB_SIZE)
+        thumb = image.convert('RGB')
+    out = BytesIO()
+    thumb.save(out, 'PNG')
+    return out.getvalue()
+
+def read_file_heads(paths, limit, serial=None):
+    """Read up to `limit` leading bytes of many device files in one exec-out stream.
+
+    Yields (path, data); each chunk is preceded by a marker line carrying the
+    number of bytes that follow, so unreadable files simply come back empty.
+    """
+    script = "; ".join(f"p={shlex.quote(path)}; s=$(stat -c %s -- \"$p\" 2>/dev/null || echo 0); "
+                       f"[ $s -gt {limit} ] && s={limit}; echo {BULK_MARKER} $s; head -c $s -- \"$p\" 2>/dev/null"
+                       for path in paths)
+    return _read_framed(script, paths, serial)
+
+def _read_framed(script, keys, serial=None):
+    """Run an exec-out script printing a marker line with a byte count before each item, yield (key, data)"""
+    process = subprocess.Popen(adb_args(serial) + ['exec-out', script], stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+    try:
+        for key in keys:
+            header = process.stdout.readline().split()
+            if len(header) != 2 or header[0] != BULK_MARKER.encode() or not header[1].isdigit():
+                break
+            yield key, process.stdout.read(int(header[1]))
+    finally:
+        process.kill()
+        process.wait()
+
+def _storage_relative(path):
+    """Strip the shared storage mount prefix, so /sdcard/DCIM and /storage/emulated/0/DCIM compare equal"""
+    path = path.rstrip('/')
+    for root in SHARED_STORAGE_ROOTS:
+        if path == root or path.startswith(root + '/'):
+            return path[len(root):]
+    return path
+
+def mediastore_ids(directory, names, kind, serial=None):
+    """Return {name: MediaStore id} for files of one directory indexed as `kind` ('images' or 'video')"""
+    folder = _storage_relative(directory)
+    where = "_data LIKE '%/" + os.path.basename(folder).replace("'", "''") + "/%'"
+    output = subprocess.run(adb_args(serial) + ['shell', f"content query --uri content://media/external/{kind}/media "
+                                                         f"--projection _id:_data --where {shlex.quote(where)}"],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, errors='replace').stdout
+    wanted = set(names)
+    ids = {}
+    for match in re.finditer(r'_id=(\d+), _data=(.*)$', output, re.M):
+        data = match.group(2).strip()
+        name = os.path.basename(data)
+        if name in wanted and _storage_relative(os.path.dirname(data)) == folder:
+            ids[name] = int(match.group(1))
+    return ids
+
+def read_mediastore_thumbnails(items, serial=None):
+    """Read the thumbnails MediaStore keeps for [(key, kind, id)] in one exec-out stream, yield (key, jpeg)
+
+    Uses the per-item thumbnail URIs of Android 10 and later; older devices
+    and files the media scanner has not seen come back empty.
+    """
+    temp = "/data/local/tmp/.adbhelper_thumb"
+    script = "; ".join(f"content read --uri content://media/external/{kind}/media/{media_id}/thumbnail "
+                       f"> {temp} 2>/dev/null; echo {BULK_MARKER} $(stat -c %s {temp} 2>/dev/null || echo 0); "
+                       f"cat {temp} 2>/dev/null" for _, kind, media_id in items) + f"; rm -f {temp}"
+    return _read_framed(script, [key for key, _, _ in items], serial)
+
+class DeviceStateCache:
+    """Last known device state in SQLite, for drawing the UI before the device answers.
+
+    Rows are keyed by serial, kind and key and remember the boot they were
+    read in; values are zlib-compressed text. Listings from an earlier boot
+    are dropped once the device reports a new boot id, while properties and
+    packages stay as a first guess until they are re-read.
+    """
+
+    def __init__(self, path=os.path.join(CACHE_DIR, "device_state.sqlite3"), listings=50):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.listings = listings
+        self.lock = Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS state (serial TEXT, kind TEXT, key TEXT, boot_id TEXT, "
+                        "updated REAL, value BLOB, PRIMARY KEY (serial, kind, key))")
+
+    def store(self, serial, boot_id, kind, key, text):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?, ?, ?)",
+                            (serial, kind, key, boot_id, datetime.now().timestamp(), zlib.compress(text.encode(), 1)))
+            if kind == 'listing':
+                self.db.execute("DELETE FROM state WHERE serial = ? AND kind = 'listing' AND key NOT IN "
+                                "(SELECT key FROM state WHERE serial = ? AND kind = 'listing' "
+                                "ORDER BY updated DESC LIMIT ?)", (serial, serial, self.listings))
+
+    def load(self, serial, kind, key=''):
+        """Return (text, boot_id, updated) or None"""
+        with self.lock:
+            row = self.db.execute("SELECT value, boot_id, updated FROM state WHERE serial = ? AND kind = ? AND key = ?",
+                                  (serial, kind, key)).fetchone()
+        return (zlib.decompress(row[0]).decode(), row[1], row[2]) if row else None
+
+    def latest(self, serial, kind):
+        """Return (key, text, updated) of the most recently stored row of a kind, or None"""
+        with self.lock:
+            row = self.db.execute("SELECT key, value, updated FROM state WHERE serial = ? AND kind = ? "
+                                  "ORDER BY updated DESC LIMIT 1", (serial, kind)).fetchone()
+        return (row[0], zlib.decompress(row[1]).decode(), row[2]) if row else None
+
+    def last_serial(self):
+        with self.lock:
+            row = self.db.execute("SELECT serial FROM state ORDER BY updated DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def new_boot(self, serial, boot_id):
+        """Forget listings read before the device last booted"""
+        with self.lock:
+            self.db.execute("DELETE FROM state WHERE serial = ? AND kind = 'listing' AND boot_id != ?",
+                            (serial, boot_id))
+
+def read_device_state(path, serial=None):
+    """Read identity, properties, third-party packages and one listing in a single round trip"""
+    transport = subprocess.run(adb_args(serial) + ['get-serialno'], stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, text=True, timeout=10).stdout.strip()
+    results = run_bulk_script(["cat /proc/sys/kernel/random/boot_id", "getprop",
+                               f"{shell_tools(serial)['pm']} list packages -3", f"ls {shlex.quote(path)}"], serial)
+    (_, boot_id), (_, props), (_, packages), (status, listing) = results
+    return {
+        'serial': transport if transport and transport != 'unknown' else None,
+        'boot_id': boot_id.strip(),
+        'props': props,
+        'packages': [line[len('package:'):].strip() for line in packages.splitlines() if line.startswith('package:')],
+        'path': path,
+        'listing': listing if status == 0 else None,
+    }
+
+class ThumbnailCache:
+    """Thumbnail PNGs in a byte-bounded memory LRU backed by a byte-bounded disk LRU.
+
+    Keys hash device, path, size and mtime, so a changed file misses the
+    cache. Disk recency is the file mtime, refreshed on every hit.
+    """
+
+    def __init__(self, directory=os.path.join(CACHE_DIR, "thumbs"), memory_bytes=16 << 20, disk_bytes=128 << 20):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory = OrderedDict()
+        self.memory_used = 0
+        self.lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.disk_used = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+
+    @staticmethod
+    def key(path, size, mtime, serial=None):
+        return hashlib.sha1(f"{serial or ''}|{path}|{size}|{mtime}".encode()).hexdigest()
+
+    def _remember(self, key, data):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return
+        self.memory[key] = data
+        self.memory_used += len(data)
+        while self.memory_used > self.memory_bytes and self.memory:
+            _, old = self.memory.popitem(last=False)
+            self.memory_used -= len(old)
+
+    def get(self, key):
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                return data
+        path = os.path.join(self.directory, key + '.png')
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        with self.lock:
+            self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        with self.lock:
+            self._remember(key, data)
+        path = os.path.join(self.directory, key + '.png')
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(data)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            return
+        with self.lock:
+            self.disk_used += len(data)
+            if self.disk_used > self.disk_bytes:
+                self._prune()
+
+    def _prune(self):
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.is_file()),
+                         key=lambda entry: entry.stat().st_mtime)
+        self.disk_used = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self.disk_used <= self.disk_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self.disk_used -= size
+            except OSError:
+                pass
+
+def load_thumbnails(directory, entries, cache, on_thumb, serial=None, batch=50, workers=4):
+    """Produce thumbnails for the photos and videos in a device directory.
+
+    Cached ones are delivered first. Images are fetched as 64 KB heads in
+    batched exec-out streams; JPEG heads usually contain the EXIF thumbnail
+    and small files are complete. Only images up to 2 MB are read whole.
+    Larger images and all videos use the thumbnail MediaStore keeps for
+    them, when the folder has been scanned. on_thumb(name, png_bytes) runs
+    in worker threads.
+    """
+    missing = []
+    for name, size, mtime, is_dir in entries:
+        if is_dir or not name.lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS):
+            continue
+        path = directory.rstrip('/') + '/' + name
+        key = cache.key(path, size, mtime, serial)
+        data = cache.get(key)
+        if data is not None:
+            on_thumb(name, data)
+        else:
+            missing.append((name, path, size, key))
+
+    indexed = []
+    indexed_lock = Lock()
+
+    def produce(item, data):
+        name, path, size, key = item
+        try:
+            thumb = make_thumbnail(data)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return False
+        cache.put(key, thumb)
+        on_thumb(name, thumb)
+        return True
+
+    def fetch(chunk):
+        images = [item for item in chunk if item[0].lower().endswith(IMAGE_EXTENSIONS)]
+        heads = dict(read_file_heads([path for _, path, _, _ in images], THUMB_PROBE_BYTES, serial))
+        later = [item for item in chunk if item not in images]
+        for item in images:
+            data = heads.get(item[1], b'')
+            if exif_thumbnail(data) is None and len(data) < item[2]:
+                if item[2] > THUMB_MAX_FULL_READ:
+                    later.append(item)
+                    continue
+                data = subprocess.run(adb_args(serial) + ['exec-out', 'cat', item[1]], stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL).stdout
+            if not produce(item, data) and item[2] > len(data):
+                later.append(item)
+        with indexed_lock:
+            indexed.extend(later)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(fetch, missing[i:i + batch]) for i in range(0, len(missing), batch)]:
+            future.result()
+
+    if indexed:
+        # Large images and videos: one MediaStore lookup per kind, then the stored thumbnails in batches
+        by_name = {item[0]: item for item in indexed}
+        lookups = []
+        for kind, extensions in (('images', IMAGE_EXTENSIONS), ('video', VIDEO_EXTENSIONS)):
+            names = [name for name in by_name if name.lower().endswith(extensions)]
+            if names:
+                lookups += [(name, kind, media_id) for name, media_id in mediastore_ids(directory, names, kind, serial).items()]
+        for i in range(0, len(lookups), batch):
+            for name, data in read_mediastore_thumbnails(lookups[i:i + batch], serial):
+                if data:
+                    produce(by_name[name], data)
+    return len(missing)
+
+BULK_MARKER = "__ADBHELPER_RESULT__"
+# Keeps each `adb shell` argument well inside the device shell's argument limit and adbd's payload size
+BULK_SCRIPT_LIMIT = 32768
+
+def _bulk_entry(index, command):
+    return f"echo {BULK_MARKER} begin {index}\n{{ {command}; }} 2>&1\necho {BULK_MARKER} end {index} $?\n"
+
+def build_bulk_script(commands):
+    """Compile commands into one shell script that reports output and exit status of each"""
+    return "".join(_bulk_entry(index, command) for index, command in enumerate(commands))
+
+def parse_bulk_output(output, count):
+    """Split bulk script output into (exit status, output) per command; status is None if it never ran"""
+    results = [(None, '')] * count
+    current, lines = None, []
+    for line in output.splitlines():
+        if line.startswith(BULK_MARKER):
+            parts = line.split()
+            if parts[1] == 'begin':
+                current, lines = int(parts[2]), []
+            elif parts[1] == 'end' and current is not None:
+                results[current] = (int(parts[3]), "\n".join(lines))
+                current = None
+        elif current is not None:
+            lines.append(line)
+    return results
+
+def bulk_succeeded(status, output):
+    """pm and friends print Failure/Error but may still exit with 0"""
+    return status == 0 and not re.search(r'^(Failure|Error|Exception|java\.)', output, re.M)
+
+def bulk_chunks(commands, limit=BULK_SCRIPT_LIMIT):
+    """Split commands into consecutive runs whose bulk script stays under limit bytes"""
+    chunks, chunk, size = [], [], 0
+    for command in commands:
+        length = len(_bulk_entry(len(chunk), command).encode())
+        if chunk and size + length > limit:
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(command)
+        size += length
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def run_bulk_script(commands, serial=None, timeout=300):
+    """Run many shell commands in as few adb round trips as fit, return (exit status, output) per command.
+
+    Each round trip is killed after `timeout` seconds, raising TimeoutExpired.
+    """
+    results = []
+    for chunk in bulk_chunks(commands):
+        result = subprocess.run(adb_args(serial) + ['shell', build_bulk_script(chunk)],
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=timeout)
+        results += parse_bulk_output(result.stdout, len(chunk))
+    return results
+
+def _kb(field):
+    return int(field) if field.isdigit() else None
+
+def parse_meminfo_compact(output):
+    """Parse `dumpsys meminfo -c` proc lines into {pid: {name, category, pss, swap, rss}} (KB)"""
+    processes = {}
+    for line in output.splitlines():
+        fields = line.strip().split(',')
+        if len(fields) < 5 or fields[0] != 'proc' or not fields[3].isdigit():
+            continue
+        # proc,<category>,<name>,<pid>,<pss>,<swap pss|N/A>,[<rss>,]<a|e>
+        numbers = [_kb(field) for field in fields[4:]]
+        processes[int(fields[3])] = {
+            'name': fields[2],
+            'category': fields[1],
+            'pss': numbers[0],
+            'swap': numbers[1] if len(numbers) > 1 else None,
+            'rss': numbers[2] if len(numbers) > 2 else None,
+        }
+    return processes
+
+def sample_process_memory(serial=None):
+    """Return PSS/RSS/swap of every process from one compact meminfo pass and one ps, in one round trip"""
+    (_, meminfo), (_, ps) = run_bulk_script(["dumpsys meminfo -c", "ps -A -o PID,RSS,NAME"], serial)
+    processes = parse_meminfo_compact(meminfo)
+    for line in ps.splitlines()[1:]:
+        fields = line.split(None, 2)
+        if len(fields) < 3 or not fields[0].isdigit():
+            continue
+        pid = int(fields[0])
+        entry = processes.setdefault(pid, {'name': fields[2], 'category': '', 'pss': None, 'swap': None, 'rss': None})
+        if entry['rss'] is None:
+            entry['rss'] = _kb(fields[1])
+    return processes
+
+class MemoryHistory:
+    """Recent PSS samples per process, keyed by (pid, name) so reused pids start over"""
+
+    def __init__(self, samples=60):
+        self.samples = samples
+        self.series = {}
+
+    def add(self, processes, timestamp=None):
+        timestamp = perf_counter() if timestamp is None else timestamp
+        seen = set()
+        for pid, info in processes.items():
+            value = info['pss'] if info['pss'] is not None else info['rss']
+            if value is None:
+                continue
+            key = (pid, info['name'])
+            seen.add(key)
+            series = self.series.setdefault(key, [])
+            series.append((timestamp, value))
+            del series[:-self.samples]
+        for key in set(self.series) - seen:
+            del self.series[key]
+
+    def trend(self, pid, name):
+        """Return the least-squares slope in KB per minute, or None with fewer than three samples"""
+        series = self.series.get((pid, name), ())
+        if len(series) < 3:
+            return None
+        n = len(series)
+        mean_t = sum(t for t, _ in series) / n
+        mean_v = sum(v for _, v in series) / n
+        variance = sum((t - mean_t) ** 2 for t, _ in series)
+        if not variance:
+            return None
+        return sum((t - mean_t) * (v - mean_v) for t, v in series) / variance * 60
+
+NETWORK_COUNTERS = ("if [ -r /proc/net/xt_qtaguid/stats ]; then echo qtaguid; cat /proc/net/xt_qtaguid/stats; "
+                    "else echo netstats; dumpsys netstats --poll >/dev/null; dumpsys netstats --uid; fi")
+SYSTEM_UIDS = {-5: 'tethering', -4: 'removed', 0: 'root', 1000: 'system', 1001: 'radio', 1002: 'bluetooth',
+               1010: 'wifi', 1013: 'media', 1019: 'drm', 1020: 'mdns', 1021: 'gps', 1027: 'nfc',
+               1051: 'dns', 1052: 'dns_tether', 1073: 'network_stack'}
+NETSTATS_UID = re.compile(r'\buid=(-?\d+)\b.*?\btag=(0x[0-9a-f]+)')
+NETSTATS_BYTES = re.compile(r'\b(?:rb|rxBytes)=(\d+).*?\b(?:tb|txBytes)=(\d+)')
+
+def parse_network_counters(output):
+    """Return {uid: [rx_bytes, tx_bytes]} from qtaguid stats or `dumpsys netstats --uid` output"""
+    totals = defaultdict(lambda: [0, 0])
+    lines = output.splitlines()
+    if lines and lines[0].strip() == 'qtaguid':
+        # idx iface acct_tag_hex uid_tag_int cnt_set rx_bytes rx_packets tx_bytes ...
+        for line in lines[2:]:
+            fields = line.split()
+            if len(fields) > 7 and fields[2] == '0x0' and fields[3].isdigit():
+                entry = totals[int(fields[3])]
+                entry[0] += int(fields[5])
+                entry[1] += int(fields[7])
+        return dict(totals)
+
+    in_uid_stats = False
+    uid = None
+    for line in lines:
+        if line and not line[0].isspace():
+            in_uid_stats = line.startswith('UID stats')
+            uid = None
+            continue
+        if not in_uid_stats:
+            continue
+        header = NETSTATS_UID.search(line)
+        if header:
+            uid = int(header.group(1)) if header.group(2) == '0x0' else None
+            continue
+        counters = NETSTATS_BYTES.search(line)
+        if counters and uid is not None:
+            entry = totals[uid]
+            entry[0] += int(counters.group(1))
+            entry[1] += int(counters.group(2))
+    return dict(totals)
+
+def parse_package_uids(output):
+    """Parse `pm list packages -U` into {uid: name}, joining packages that share a uid"""
+    names = defaultdict(list)
+    for line in output.splitlines():
+        match = re.match(r'package:(\S+)\s+uid:(\d+)', line.strip())
+        if match:
+            names[int(match.group(2))].append(match.group(1))
+    return {uid: ','.join(sorted(packages)) for uid, packages in names.items()}
+
+class NetworkMonitor:
+    """Per-UID network rates from cumulative byte counters sampled in one round trip.
+
+    Rates are deltas between consecutive samples; a counter that goes
+    backwards (reboot, netstats history expiry) restarts from zero for that
+    uid. Only the top `top` talkers of each sample are kept, in a ring of
+    `samples` entries, so continuous sampling stays small.
+    """
+
+    def __init__(self, serial=None, samples=120, top=15):
+        self.serial = serial
+        self.top = top
+        self.history = deque(maxlen=samples)
+        self.previous = None
+        self.previous_time = None
+        self.names = {}
+        self.looked_up = set()
+        self.source = None
+
+    def name(self, uid):
+        if uid in self.names:
+            return self.names[uid]
+        if uid in SYSTEM_UIDS:
+            return SYSTEM_UIDS[uid]
+        if uid >= 100000:
+            return f"{self.name(uid % 100000)} (user {uid // 100000})"
+        return f"uid {uid}"
+
+    def sample(self):
+        """Take one sample; return [(uid, name, rx/s, tx/s, rx total, tx total)] sorted by traffic"""
+        refresh = not self.names
+        results = run_bulk_script([NETWORK_COUNTERS] + ([fast_command("pm list packages -U", self.serial)]
+                                                        if refresh else []), self.serial)
+        now = perf_counter()
+        output = results[0][1]
+        self.source = output.split('\n', 1)[0].strip() or None
+        counters = parse_network_counters(output)
+        if refresh:
+            self.names = parse_package_uids(results[1][1])
+            self.looked_up = set(counters)
+        elif set(counters) - self.looked_up:
+            # New app uids appear after installs; reload the package list once for them
+            unknown = {uid for uid in set(counters) - self.looked_up if uid % 100000 >= 10000}
+            self.looked_up |= set(counters)
+            if unknown - set(self.names):
+                self.names = {}
+
+        rows = []
+        elapsed = now - self.previous_time if self.previous_time else None
+        for uid, (rx, tx) in counters.items():
+            old = self.previous.get(uid) if self.previous else None
+            if elapsed and old and rx >= old[0] and tx >= old[1]:
+                rx_rate, tx_rate = (rx - old[0]) / elapsed, (tx - old[1]) / elapsed
+            else:
+                rx_rate = tx_rate = 0.0
+            rows.append((uid, self.name(uid), rx_rate, tx_rate, rx, tx))
+        rows.sort(key=lambda row: (row[2] + row[3], row[4] + row[5]), reverse=True)
+        self.previous, self.previous_time = counters, now
+        if elapsed:
+            self.history.append((now, rows[:self.top]))
+        return rows
+
+    def peaks(self):
+        """Highest combined rate seen for each uid while it was a top talker"""
+        peaks = {}
+        for _, rows in self.history:
+            for uid, _, rx, tx, _, _ in rows:
+                peaks[uid] = max(peaks.get(uid, 0.0), rx + tx)
+        return peaks
+
+POWER_SAMPLER_SCRIPT = """\
+B=/sys/class/power_supply/battery
+[ -r $B/current_now ] || for d in /sys/class/power_supply/*; do [ -r $d/current_now ] && B=$d && break; done
+i=0
+while :; do
+  read c < $B/current_now; read v < $B/voltage_now
+  echo "$EPOCHREALTIME $c $v"
+  if [ $((i % {focus_every})) -eq 0 ]; then
+    ( echo "F $EPOCHREALTIME $(dumpsys activity activities | grep -m1 -E 'mResumedActivity|topResumedActivity')" ) &
+  fi
+  i=$((i + 1))
+  sleep {period}
+done
+"""
+FOREGROUND_ACTIVITY = re.compile(r'\s([\w.]+)/[\w.$]+')
+
+class PowerProfiler:
+    """Streams battery current/voltage samples from an on-device sampling loop.
+
+    One exec-out connection carries "epoch current_uA voltage_uV" lines at the
+    requested rate plus an occasional foreground-activity line. Power is
+    integrated with the trapezoid rule and each interval is charged to the
+    app that was in the foreground at its start.
+    """
+
+    def __init__(self, rate=50, serial=None, focus_interval=2.0):
+        self.rate = rate
+        self.serial = serial
+        self.focus_interval = focus_interval
+        self.process = None
+        self.thread = None
+        self.reset()
+
+    def reset(self):
+        self.samples = 0
+        self.energy = 0.0
+        self.per_app = defaultdict(float)
+        self.foreground = 'unknown'
+        self.first = None
+        self.last = None
+        self.recent = deque(maxlen=self.rate * 10)
+
+    def script(self):
+        return POWER_SAMPLER_SCRIPT.format(period=f"{1 / self.rate:.3f}",
+                                           focus_every=max(1, int(self.focus_interval * self.rate)))
+
+    def feed(self, line):
+        """Account one line of sampler output"""
+        fields = line.split()
+        if fields[:1] == ['F']:
+            match = FOREGROUND_ACTIVITY.search(line)
+            if match:
+                self.foreground = match.group(1)
+            return
+        if len(fields) == 2:
+            # mksh without EPOCHREALTIME: fall back to arrival time
+            fields.insert(0, str(datetime.now().timestamp()))
+        try:
+            timestamp, current, voltage = float(fields[0]), int(fields[1]), int(fields[2])
+        except (ValueError, IndexError):
+            return
+        watts = abs(current) * voltage / 1e12
+        if self.last is not None:
+            last_time, last_watts = self.last
+            dt = timestamp - last_time
+            if 0 < dt < 5:
+                joules = (watts + last_watts) / 2 * dt
+                self.energy += joules
+                self.per_app[self.foreground] += joules
+        if self.first is None:
+            self.first = timestamp
+        self.last = (timestamp, watts)
+        self.samples += 1
+        self.recent.append(watts)
+
+    def duration(self):
+        return self.last[0] - self.first if self.last and self.first is not None else 0.0
+
+    def average_power(self):
+        duration = self.duration()
+        return self.energy / duration if duration else 0.0
+
+    def _read(self):
+        for line in self.process.stdout:
+            self.feed(line)
+
+    def start(self):
+        self.reset()
+        self.process = subprocess.Popen(adb_args(self.serial) + ['exec-out', self.script()],
+                                        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        self.thread = Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.running():
+            self.process.terminate()
+
+ATRACE_CATEGORIES = "sched freq idle am wm gfx view binder_driver input dalvik"
+FTRACE_LINE = re.compile(rb'\s*(.*?)-(\d+)\s+(?:\(\s*(\d+|-+)\)\s+)?\[(\d+)\]\s+(?:\S{4,5}\s+)?(\d+\.\d+): (\w+): (.*)')
+FTRACE_FIELDS = re.compile(rb'(\w+)=(\S+)')
+SCHED_SWITCH = re.compile(rb'prev_comm=(.*?) prev_pid=(\d+) .*?prev_state=(\S+) ==> next_comm=(.*?) next_pid=(\d+)')
+
+class FtraceSummary:
+    """One-pass summary of ftrace text: CPU time per thread and process, slices and wakeup latency.
+
+    Memory stays bounded by the number of threads, `max_slices` distinct
+    slice names and a fixed log2 latency histogram, so traces of any length
+    can be fed line by line as they arrive.
+    """
+
+    def __init__(self, max_slices=5000, worst=10):
+        self.max_slices = max_slices
+        self.worst_count = worst
+        self.first = None
+        self.last = None
+        self.lines = 0
+        self.events = Counter()
+        self.names = {}
+        self.tgids = {}
+        self.cpu_time = defaultdict(float)
+        self.on_cpu = {}
+        self.runnable = {}
+        self.latency_buckets = [0] * 32
+        self.latency_max = defaultdict(float)
+        self.worst = []
+        self.stacks = defaultdict(list)
+        self.slices = {}
+
+    def feed(self, line):
+        match = FTRACE_LINE.match(line)
+        self.lines += 1
+        if not match:
+            return
+        comm, pid, tgid, cpu, timestamp, event, body = match.groups()
+        timestamp = float(timestamp)
+        pid = int(pid)
+        if self.first is None:
+            self.first = timestamp
+        self.last = timestamp
+        self.events[event] += 1
+        if pid not in self.names:
+            self.names[pid] = comm.decode(errors='replace')
+        if tgid and tgid[:1].isdigit():
+            self.tgids[pid] = int(tgid)
+
+        if event == b'sched_switch':
+            self._switch(int(cpu), timestamp, body)
+        elif event in (b'sched_wakeup', b'sched_waking', b'sched_wakeup_new'):
+            fields = dict(FTRACE_FIELDS.findall(body))
+            if b'pid' in fields:
+                self.runnable.setdefault(int(fields[b'pid']), timestamp)
+        elif event == b'tracing_mark_write':
+            self._mark(pid, timestamp, body)
+
+    def _switch(self, cpu, timestamp, body):
+        match = SCHED_SWITCH.search(body)
+        if not match:
+            return
+        prev_comm, prev_pid, prev_state, next_comm, next_pid = match.groups()
+        prev_pid, next_pid = int(prev_pid), int(next_pid)
+        started = self.on_cpu.get(cpu)
+        if started and started[0] == prev_pid and prev_pid:
+            self.cpu_time[prev_pid] += timestamp - started[1]
+        self.on_cpu[cpu] = (next_pid, timestamp)
+        self.names[prev_pid] = prev_comm.decode(errors='replace')
+        self.names[next_pid] = next_comm.decode(errors='replace')
+        if prev_state.startswith(b'R') and prev_pid:
+            # Preempted: runnable again straight away
+            self.runnable[prev_pid] = timestamp
+        woken = self.runnable.pop(next_pid, None)
+        if woken is not None and next_pid:
+            latency = timestamp - woken
+            self.latency_buckets[min(31, max(0, int(latency * 1e6)).bit_length())] += 1
+            if latency > self.latency_max[next_pid]:
+                self.latency_max[next_pid] = latency
+            entry = (latency, timestamp, next_pid)
+            if len(self.worst) < self.worst_count:
+                heapq.heappush(self.worst, entry)
+            elif entry > self.worst[0]:
+                heapq.heapreplace(self.worst, entry)
+
+    def _mark(self, pid, timestamp, body):
+        kind, _, rest = body.partition(b'|')
+        if kind == b'B':
+            tgid, _, name = rest.partition(b'|')
+            if tgid.isdigit():
+                self.tgids.setdefault(pid, int(tgid))
+            stack = self.stacks[pid]
+            if len(stack) < 256:
+                stack.append((name.decode(errors='replace'), timestamp))
+        elif kind == b'E' and self.stacks.get(pid):
+            name, started = self.stacks[pid].pop()
+            if name not in self.slices and len(self.slices) >= self.max_slices:
+                name = '(other)'
+            stats = self.slices.setdefault(name, [0, 0.0, 0.0])
+            duration = timestamp - started
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+
+    def latency_percentile(self, fraction):
+        """Upper bound in ms of the log2 bucket holding the given fraction of wakeups"""
+        total = sum(self.latency_buckets)
+        if not total:
+            return None
+        seen = 0
+        for bucket, count in enumerate(self.latency_buckets):
+            seen += count
+            if seen >= fraction * total:
+                return (1 << bucket) / 1000
+        return None
+
+    def process_name(self, pid):
+        tgid = self.tgids.get(pid, pid)
+        return f"{self.names.get(tgid, '?')} ({tgid})"
+
+    def report(self, top=15):
+        duration = (self.last - self.first) if self.first is not None else 0.0
+        lines = [f"Trace: {duration:.2f} s, {self.lines} lines, {sum(self.events.values())} events",
+                 "Events: " + ", ".join(f"{name.decode()} {count}" for name, count in self.events.most_common(8))]
+        # Close the slices still running on each CPU at the end of the trace
+        cpu_time = Counter(self.cpu_time)
+        for pid, started in self.on_cpu.values():
+            if pid:
+                cpu_time[pid] += self.last - started
+        per_process = Counter()
+        for pid, seconds in cpu_time.items():
+            per_process[self.process_name(pid)] += seconds
+
+        lines.append("\nCPU time by process:")
+        lines += [f"  {seconds * 1000:10.1f} ms  {name}" for name, seconds in per_process.most_common(top)]
+        lines.append("\nCPU time by thread:")
+        lines += [f"  {seconds * 1000:10.1f} ms  {self.names.get(pid, '?')} ({pid}) in {self.process_name(pid)}"
+                  for pid, seconds in cpu_time.most_common(top)]
+        lines.append("\nTop slices by total time:")
+        lines += [f"  {total * 1000:10.1f} ms  {count:6d}x  avg {total / count * 1000:.2f} ms  max {longest * 1000:.2f} ms  {name}"
+                  for name, (count, total, longest) in sorted(self.slices.items(), key=lambda item: -item[1][1])[:top]]
+        wakeups = sum(self.latency_buckets)
+        lines.append(f"\nScheduler latency ({wakeups} wakeups)" + (
+            f": p50 <{self.latency_percentile(0.5)} ms, p90 <{self.latency_percentile(0.9)} ms, "
+            f"p99 <{self.latency_percentile(0.99)} ms" if wakeups else ""))
+        lines += [f"  {latency * 1000:8.2f} ms at {timestamp:.6f}  {self.names.get(pid, '?')} ({pid}) in {self.process_name(pid)}"
+                  for latency, timestamp, pid in sorted(self.worst, reverse=True)]
+        if self.latency_max:
+            lines.append("\nWorst wakeup latency by thread:")
+            lines += [f"  {latency * 1000:8.2f} ms  {self.names.get(pid, '?')} ({pid}) in {self.process_name(pid)}"
+                      for pid, latency in sorted(self.latency_max.items(), key=lambda item: -item[1])[:top]]
+        return "\n".join(lines)
+
+class TraceCapture:
+    """Streams `atrace --stream` over exec-out to a host file while summarizing it.
+
+    Nothing is buffered on the device beyond the kernel ring; the raw text is
+    written to `path` and fed to an FtraceSummary in the same pass.
+    """
+
+    def __init__(self, path, categories=ATRACE_CATEGORIES, buffer_kb=16384, serial=None):
+        self.path = path
+        self.categories = categories.split()
+        self.buffer_kb = buffer_kb
+        self.serial = serial
+        self.summary = FtraceSummary()
+        self.bytes = 0
+        self.process = None
+        self.thread = None
+
+    def _read(self):
+        with open(self.path, 'wb') as f:
+            for line in self.process.stdout:
+                f.write(line)
+                self.bytes += len(line)
+                self.summary.feed(line)
+
+    def start(self):
+        command = ' '.join(['atrace', '--stream', '-b', str(self.buffer_kb)] + [shlex.quote(c) for c in self.categories])
+        self.process = subprocess.Popen(adb_args(self.serial) + ['exec-out', command], stdin=subprocess.DEVNULL,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.thread = Thread(target=self._read, daemon=True)
+        self.thread.start()
+        return self
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self):
+        if self.running():
+            self.process.terminate()
+        # atrace normally cleans up on the broken pipe; make sure tracing is really off
+        subprocess.run(adb_args(self.serial) + ['shell', 'atrace --async_stop >/dev/null 2>&1'],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+FRAME_DEADLINE_NS = 16666667
+
+def parse_framestats(output):
+    """Yield (intended_vsync, frame_ns, deadline_ns) for valid rows of `dumpsys gfxinfo <pkg> framestats`"""
+    columns = None
+    for line in output.splitlines():
+        line = line.strip().rstrip(',')
+        if line == '---PROFILEDATA---':
+            columns = None
+        elif line.startswith('Flags,'):
+            columns = {name: index for index, name in enumerate(line.split(','))}
+        elif columns and line[:1].isdigit():
+            fields = line.split(',')
+            try:
+                # Non-zero flags mark frames the renderer itself excludes from stats
+                if int(fields[columns['Flags']]):
+                    continue
+                intended = int(fields[columns['IntendedVsync']])
+                completed = int(fields[columns['FrameCompleted']])
+                deadline = (int(fields[columns['FrameDeadline']]) - intended
+                            if 'FrameDeadline' in columns else FRAME_DEADLINE_NS)
+            except (KeyError, IndexError, ValueError):
+                continue
+            if completed > intended:
+                yield intended, completed - intended, deadline if deadline > 0 else FRAME_DEADLINE_NS
+
+class FrameStats:
+    """Rolling frame-time window fed from repeated framestats dumps.
+
+    gfxinfo returns the last ~120 frames on every call, so rows are
+    deduplicated by IntendedVsync and only newer frames are kept, as
+    milliseconds in a fixed-size ring.
+    """
+
+    def __init__(self, window=1200):
+        self.window = window
+        self.times = array('f')
+        self.position = 0
+        self.last_vsync = 0
+        self.frames = 0
+        self.janky = 0
+        self.window_janky = array('b')
+
+    def feed(self, output):
+        """Add frames newer than the last seen one, return how many were added"""
+        added = 0
+        for intended, frame_ns, deadline_ns in sorted(parse_framestats(output)):
+            if intended <= self.last_vsync:
+                continue
+            self.last_vsync = intended
+            janky = 1 if frame_ns > deadline_ns else 0
+            if len(self.times) < self.window:
+                self.times.append(frame_ns / 1e6)
+                self.window_janky.append(janky)
+            else:
+                self.times[self.position] = frame_ns / 1e6
+                self.window_janky[self.position] = janky
+                self.position = (self.position + 1) % self.window
+            self.frames += 1
+            self.janky += janky
+            added += 1
+        return added
+
+    def percentiles(self, points=(50, 90, 99)):
+        ordered = sorted(self.times)
+        if not ordered:
+            return {point: 0.0 for point in points}
+        return {point: ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))] for point in points}
+
+    def window_jank(self):
+        return sum(self.window_janky)
+
+def read_framestats(package, serial=None):
+    """Return only the PROFILEDATA blocks of framestats, trimmed on the device"""
+    command = (f"dumpsys gfxinfo {shlex.quote(package)} framestats"
+               " | sed -n '/---PROFILEDATA---/,/---PROFILEDATA---/p'")
+    return subprocess.run(adb_args(serial) + ['shell', command], stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL, text=True).stdout
+
+PRIORITY_INTERACTIVE, PRIORITY_TRANSFER, PRIORITY_BACKGROUND = 0, 1, 2
+
+class DeviceScheduler:
+    """Per-device job queue ordered interactive > transfer > background.
+
+    Each device runs at most `limit` jobs at once, one slot of which only
+    interactive jobs may use, with separate caps for transfers and background
+    polls. Pending jobs submitted with the same key
+    share one future, and background jobs are held back while interactive
+    work for the same device is queued or running.
+    """
+
+    def __init__(self, limit=3, class_limits=None):
+        self.limit = limit
+        self.class_limits = class_limits or {PRIORITY_INTERACTIVE: limit, PRIORITY_TRANSFER: 2,
+                                             PRIORITY_BACKGROUND: 1}
+        self.lock = Lock()
+        self.lanes = {}
+        self.sequence = 0
+        self.default = ''
+
+    def set_devices(self, serials):
+        """Record the connected devices (from DeviceTracker) so jobs without a serial find their lane"""
+        self.default = serials[0] if len(serials) == 1 else ''
+
+    def submit(self, func, *args, priority=PRIORITY_INTERACTIVE, serial=None, key=None):
+        """Queue func(*args) for a device and return a concurrent.futures.Future"""
+        # Jobs without a serial go to the lane of the device adb would pick
+        lane_name = serial or os.environ.get('ANDROID_SERIAL') or self.default
+        with self.lock:
+            lane = self.lanes.setdefault(lane_name, {'queue': [], 'pending': {}, 'running': Counter()})
+            if key is not None and key in lane['pending']:
+                return lane['pending'][key]
+            future = Future()
+            self.sequence += 1
+            heapq.heappush(lane['queue'], (priority, self.sequence, future, func, args, key))
+            if key is not None:
+                lane['pending'][key] = future
+            self._dispatch(lane)
+        return future
+
+    def _dispatch(self, lane):
+        """Start queued jobs that fit the limits; called with the lock held"""
+        running = lane['running']
+        held = []
+        while lane['queue'] and sum(running.values()) < self.limit:
+            job = heapq.heappop(lane['queue'])
+            priority = job[0]
+            interactive_waiting = running[PRIORITY_INTERACTIVE] or any(
+                other[0] == PRIORITY_INTERACTIVE for other in held)
+            # The last slot is kept for interactive work so clicks never wait behind a transfer
+            reserved = priority != PRIORITY_INTERACTIVE and sum(running.values()) >= self.limit - 1
+            if reserved or running[priority] >= self.class_limits[priority] or (
+                    priority == PRIORITY_BACKGROUND and interactive_waiting):
+                held.append(job)
+                continue
+            if job[5] is not None:
+                lane['pending'].pop(job[5], None)
+            if not job[2].set_running_or_notify_cancel():
+                continue
+            running[priority] += 1
+            Thread(target=self._run, args=(lane, job), daemon=True).start()
+        for job in held:
+            heapq.heappush(lane['queue'], job)
+
+    def _run(self, lane, job):
+        priority, _, future, func, args, _ = job
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self.lock:
+                lane['running'][priority] -= 1
+                self._dispatch(lane)
+
+    def stats(self):
+        """Return {device: (queued, running)}"""
+        with self.lock:
+            return {name: (len(lane['queue']), sum(lane['running'].values())) for name, lane in self.lanes.items()}
+
+EV_SYN, EV_KEY, EV_ABS = 0x00, 0x01, 0x03
+SYN_REPORT = 0x00
+BTN_TOUCH = 0x14a
+ABS_MT_SLOT, ABS_MT_TOUCH_MAJOR, ABS_MT_POSITION_X, ABS_MT_POSITION_Y = 0x2f, 0x30, 0x35, 0x36
+ABS_MT_TRACKING_ID, ABS_MT_PRESSURE = 0x39, 0x3a
+LINUX_KEYS = {'HOME': 102, 'BACK': 158, 'POWER': 116, 'VOLUME_UP': 115, 'VOLUME_DOWN': 114,
+              'MENU': 139, 'ENTER': 28, 'APP_SWITCH': 580}
+GETEVENT_LINE = re.compile(r'(?:\[\s*([\d.]+)\]\s*)?(/dev/input/event\d+):\s+([0-9a-f]{4})\s+([0-9a-f]{4})\s+([0-9a-f]{8})')
+
+def parse_getevent_devices(output):
+    """Parse `getevent -p` into {path: {'name', 'keys': set, 'abs': {code: (min, max)}}}"""
+    devices = {}
+    device = section = None
+    for line in output.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('add device'):
+            device = devices.setdefault(stripped.split(':', 1)[1].strip(), {'name': '', 'keys': set(), 'abs': {}})
+            section = None
+        elif device is None:
+            continue
+        elif stripped.startswith('name:'):
+            device['name'] = stripped.split(':', 1)[1].strip().strip('"')
+        else:
+            match = re.match(r'(KEY|ABS|[A-Z]+) \([0-9a-f]{4}\):\s*(.*)', stripped)
+            if match:
+                section, stripped = match.group(1), match.group(2)
+            elif stripped.endswith(':') or not stripped:
+                section = None
+                continue
+            if section == 'KEY':
+                device['keys'].update(int(code, 16) for code in stripped.split() if re.fullmatch(r'[0-9a-f]{4}', code))
+            elif section == 'ABS':
+                axis = re.match(r'([0-9a-f]{4})\s*:\s*value -?\d+, min (-?\d+), max (-?\d+)', stripped)
+                if axis:
+                    device['abs'][int(axis.group(1), 16)] = (int(axis.group(2)), int(axis.group(3)))
+    return devices
+
+class InputInjector:
+    """Injects touch and key events straight into /dev/input on one device.
+
+    Events are packed as struct input_event and streamed over a persistent
+    `adb exec-in cat > /dev/input/eventN` per input device, so a tap costs a
+    single write instead of an `input` JVM start. Nodes the shell cannot
+    write, and nodes whose stream dies, use batched sendevent lines through a
+    persistent shell instead.
+    """
+
+    def __init__(self, serial=None):
+        self.serial = serial
+        self.devices = {}
+        self.touch = None
+        self.display = (1080, 1920)
+        self.event_format = '<qqHHi'
+        self.writers = {}
+        self.sendevent_only = set()
+        self.shell = None
+        self.tracking_id = 0
+        self.lock = Lock()
+
+    def start(self):
+        (_, getevent), (_, size), (_, abi), (_, writable) = run_bulk_script(
+            ["getevent -p", "wm size", "getprop ro.product.cpu.abi",
+             "for f in /dev/input/event*; do [ -w $f ] && echo $f; done"], self.serial)
+        self.devices = parse_getevent_devices(getevent)
+        self.sendevent_only = set(self.devices) - set(writable.split())
+        self.touch = next((path for path, info in self.devices.items() if ABS_MT_POSITION_X in info['abs']), None)
+        sizes = re.findall(r'(\d+)x(\d+)', size)
+        if sizes:
+            # An override size, when present, is printed last
+            self.display = tuple(int(value) for value in sizes[-1])
+        self.event_format = '<qqHHi' if '64' in abi else '<llHHi'
+        self.shell = subprocess.Popen(adb_args(self.serial) + ['shell'], stdin=subprocess.PIPE,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, text=True)
+        if self.touch and self.touch not in self.sendevent_only:
+            # Open the touch stream now so the first tap is not stretched by the open check
+            with self.lock:
+                self._write(self.touch, b'')
+        return self
+
+    def _write(self, path, data):
+        """Stream events to the node; False once the stream has failed, after which the node uses sendevent"""
+        writer = self.writers.get(path)
+        fresh = writer is None
+        if fresh:
+            writer = subprocess.Popen(adb_args(self.serial) + ['exec-in', f"cat > {path}"],
+                                      stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.writers[path] = writer
+        try:
+            if writer.poll() is not None:
+                raise BrokenPipeError
+            writer.stdin.write(data)
+            writer.stdin.flush()
+            if fresh:
+                # The first write only fills the pipe; a cat that cannot open the node exits right away
+                writer.wait(timeout=0.3)
+                raise BrokenPipeError
+        except subprocess.TimeoutExpired:
+            return True
+        except (BrokenPipeError, OSError):
+            self.writers.pop(path, None)
+            self.sendevent_only.add(path)
+            return False
+        return True
+
+    def send(self, path, events):
+        """Write (type, code, value) events to an input device in one go"""
+        data = b''.join(struct.pack(self.event_format, 0, 0, kind, code, value) for kind, code, value in events)
+        with self.lock:
+            if path not in self.sendevent_only and self._write(path, data):
+                return
+            self.shell.stdin.write(';'.join(f"sendevent {path} {kind} {code} {value}"
+                                            for kind, code, value in events) + "\n")
+            self.shell.stdin.flush()
+
+    def _scale(self, x, y):
+        info = self.devices[self.touch]['abs']
+        (x_min, x_max), (y_min, y_max) = info[ABS_MT_POSITION_X], info[ABS_MT_POSITION_Y]
+        width, height = self.display
+        return (x_min + round(x * (x_max - x_min) / max(1, width - 1)),
+                y_min + round(y * (y_max - y_min) / max(1, height - 1)))
+
+    def touch_down(self, x, y, slot=0):
+        if not self.touch:
+            raise RuntimeError("No touchscreen input device found")
+        self.tracking_id = (self.tracking_id + 1) % 65535
+        x, y = self._scale(x, y)
+        events = [(EV_ABS, ABS_MT_SLOT, slot), (EV_ABS, ABS_MT_TRACKING_ID, self.tracking_id),
+                  (EV_ABS, ABS_MT_POSITION_X, x), (EV_ABS, ABS_MT_POSITION_Y, y)]
+        axes = self.devices[self.touch]['abs']
+        if ABS_MT_PRESSURE in axes:
+            events.append((EV_ABS, ABS_MT_PRESSURE, max(1, axes[ABS_MT_PRESSURE][1] // 2)))
+        if ABS_MT_TOUCH_MAJOR in axes:
+            events.append((EV_ABS, ABS_MT_TOUCH_MAJOR, max(1, axes[ABS_MT_TOUCH_MAJOR][1] // 8)))
+        if BTN_TOUCH in self.devices[self.touch]['keys']:
+            events.append((EV_KEY, BTN_TOUCH, 1))
+        self.send(self.touch, events + [(EV_SYN, SYN_REPORT, 0)])
+
+    def touch_move(self, x, y, slot=0):
+        x, y = self._scale(x, y)
+        self.send(self.touch, [(EV_ABS, ABS_MT_SLOT, slot), (EV_ABS, ABS_MT_POSITION_X, x),
+                               (EV_ABS, ABS_MT_POSITION_Y, y), (EV_SYN, SYN_REPORT, 0)])
+
+    def touch_up(self, slot=0):
+        events = [(EV_ABS, ABS_MT_SLOT, slot), (EV_ABS, ABS_MT_TRACKING_ID, -1)]
+        if BTN_TOUCH in self.devices[self.touch]['keys']:
+            events.append((EV_KEY, BTN_TOUCH, 0))
+        self.send(self.touch, events + [(EV_SYN, SYN_REPORT, 0)])
+
+    def tap(self, x, y, hold=0.04):
+        self.touch_down(x, y)
+        sleep(hold)
+        self.touch_up()
+
+    def swipe(self, x1, y1, x2, y2, duration=0.3, rate=120):
+        steps = max(1, int(duration * rate))
+        self.touch_down(x1, y1)
+        start = perf_counter()
+        for step in range(1, steps + 1):
+            delay = start + step / rate - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            self.touch_move(x1 + (x2 - x1) * step // steps, y1 + (y2 - y1) * step // steps)
+        self.touch_up()
+
+    def key(self, name):
+        """Press a key on the input device that has it, or fall back to `input keyevent`"""
+        code = LINUX_KEYS.get(name.upper())
+        path = next((path for path, info in self.devices.items() if code in info['keys']), None)
+        if path:
+            self.send(path, [(EV_KEY, code, 1), (EV_SYN, SYN_REPORT, 0)])
+            self.send(path, [(EV_KEY, code, 0), (EV_SYN, SYN_REPORT, 0)])
+        else:
+            with self.lock:
+                self.shell.stdin.write(f"input keyevent KEYCODE_{name.upper()}\n")
+                self.shell.stdin.flush()
+
+    def play(self, macro, speed=1.0):
+        """Replay a recorded macro, mapping the touchscreen and rescaling its axes"""
+        source_touch = macro.get('touch')
+        source_axes = {int(code): tuple(limits) for code, limits in macro.get('axes', {}).items()}
+        target_axes = self.devices.get(self.touch, {}).get('abs', {})
+        start = perf_counter()
+        for frame_time, path, events in macro['frames']:
+            if path == source_touch and self.touch:
+                target = self.touch
+                events = [(kind, code, self._rescale(value, source_axes.get(code), target_axes.get(code))
+                           if kind == EV_ABS and code in (ABS_MT_POSITION_X, ABS_MT_POSITION_Y) else value)
+                          for kind, code, value in events]
+            else:
+                target = path if path in self.devices else next(
+                    (other for other, info in self.devices.items()
+                     if any(kind == EV_KEY and code in info['keys'] for kind, code, _ in events)), None)
+            if target is None:
+                continue
+            delay = start + frame_time / speed - perf_counter()
+            if delay > 0:
+                sleep(delay)
+            self.send(target, events)
+
+    @staticmethod
+    def _rescale(value, source, target):
+        if not source or not target or source == target:
+            return value
+        return target[0] + round((value - source[0]) * (target[1] - target[0]) / max(1, source[1] - source[0]))
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.terminate()
+        self.writers = {}
+        if self.shell:
+            self.shell.terminate()
+            self.shell = None
+
+class MacroRecorder:
+    """Records raw input events from a device with `getevent -t`.
+
+    Events are grouped into frames at each SYN_REPORT and stored with their
+    offset from the first event, together with the touchscreen axis ranges
+    so playback can rescale on devices with a different panel.
+    """
+
+    def __init__(self, serial=None):
+        self.serial = serial
+        self.process = None
+        self.thread = None
+        self.frames = []
+        self.macro_info = {}
+
+    def start(self):
+        devices = parse_getevent_devices(subprocess.check_output(
+            adb_args(self.serial) + ['shell', 'getevent', '-p'], text=True))
+        touch = next((path for path, info in devices.items() if ABS_MT_POSITION_X in info['abs']), None)
+        axes = devices.get(touch, {}).get('abs', {})
+        self.macro_info = {'touch': touch, 'axes': {str(code): limits for code, limits in axes.items()}}
+        self.frames = []
+        self.process = subprocess.Popen(adb_args(self.serial) + ['exec-out', 'getevent -t'],
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        self.thread = Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def _read(self):
+        first = None
+        pending = {}
+        for line in self.process.stdout:
+            match = GETEVENT_LINE.search(line)
+            if not match:
+                continue
+            stamp, path = match.group(1), match.group(2)
+            kind, code, value = int(match.group(3), 16), int(match.group(4), 16), int(match.group(5), 16)
+            if value >= 1 << 31:
+                value -= 1 << 32
+            now = float(stamp) if stamp else perf_counter()
+            if first is None:
+                first = now
+            events = pending.setdefault(path, [])
+            events.append((kind, code, value))
+            if kind == EV_SYN and code == SYN_REPORT:
+                self.frames.append((round(now - first, 6), path, events))
+                del pending[path]
+
+    def stop(self):
+        """Stop recording and return the macro"""
+        if self.process:
+            self.process.terminate()
+            self.thread.join(timeout=2)
+        return dict(self.macro_info, frames=self.frames)
+
+def play_macro_on_devices(macro, serials, speed=1.0):
+    """Replay a macro on several devices at once, return {serial: error or None}"""
+    def play(serial):
+        injector = InputInjector(serial).start()
+        try:
+            injector.play(macro, speed)
+        finally:
+            injector.close()
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, len(serials))) as pool:
+        futures = {pool.submit(play, serial): serial for serial in serials}
+        for future in as_completed(futures):
+            try:
+                future.result()
+                results[futures[future]] = None
+            except Exception as e:
+                results[futures[future]] = str(e)
+    return results
+
+SETTINGS_NAMESPACES = ('system', 'secure', 'global')
+SETTINGS_PROPS = ('ro.product.model', 'ro.build.fingerprint', 'ro.build.version.sdk', 'persist.sys.locale',
+                  'persist.sys.timezone', 'persist.sys.dalvik.vm.lib.2', 'ro.sf.lcd_density')
+# Per-device identities, counters and the switches that keep adb itself connected
+SETTINGS_SKIP = {'android_id', 'bluetooth_address', 'bluetooth_name', 'device_name', 'boot_count',
+                 'adb_enabled', 'adb_wifi_enabled', 'development_settings_enabled', 'lock_screen_owner_info'}
+
+def snapshot_settings(serial=None):
+    """Return {'system'|'secure'|'global': {key: value}, 'props': {...}} from one round trip"""
+    settings = shell_tools(serial)['settings']
+    results = run_bulk_script([f"{settings} list {namespace}" for namespace in SETTINGS_NAMESPACES] +
+                              ["getprop"], serial)
+    snapshot = {}
+    for namespace, (status, output) in zip(SETTINGS_NAMESPACES, results):
+        # A namespace that failed to list must not read as one with nothing set
+        if not bulk_succeeded(status, output):
+            raise subprocess.CalledProcessError(status or 1, f"settings list {namespace}", output)
+        values = {}
+        for line in output.splitlines():
+            key, sep, value = line.partition('=')
+            if sep and key and not key.startswith(' '):
+                values[key] = value
+        snapshot[namespace] = values
+    props = {}
+    for line in results[-1][1].splitlines():
+        match = re.match(r'\[([^\]]+)\]: \[(.*)\]$', line)
+        if match and match.group(1) in SETTINGS_PROPS:
+            props[match.group(1)] = match.group(2)
+    snapshot['props'] = props
+    return snapshot
+
+def diff_settings(current, target):
+    """Return [(namespace, key, current value or None, target value)] for keys the target sets differently.
+
+    Keys missing from the target are left alone, and device identities and
+    adb switches (SETTINGS_SKIP) are never touched. Props are informational.
+    """
+    changes = []
+    for namespace in SETTINGS_NAMESPACES + ('props',):
+        have = current.get(namespace, {})
+        for key, value in sorted(target.get(namespace, {}).items()):
+            if key not in SETTINGS_SKIP and have.get(key, 'null') != value:
+                changes.append((namespace, key, have.get(key), value))
+    return changes
+
+def apply_settings(changes, serial=None):
+    """Write settings changes in one round trip, return [(namespace, key, error)] for the ones that failed"""
+    changes = [change for change in changes if change[0] in SETTINGS_NAMESPACES]
+    if not changes:
+        return []
+    settings = shell_tools(serial)['settings']
+    results = run_bulk_script([f"{settings} put {namespace} {shlex.quote(key)} {shlex.quote(value)}"
+                               if value != 'null' else f"{settings} delete {namespace} {shlex.quote(key)}"
+                               for namespace, key, _, value in changes], serial)
+    return [(namespace, key, output.strip() or f"exit status {status}")
+            for (namespace, key, _, _), (status, output) in zip(changes, results)
+            if not bulk_succeeded(status, output)]
+
+def apply_settings_profile(profile, serials, workers=8):
+    """Bring several devices to a profile at once, return {serial: (changes, failures) or error string}"""
+    def apply(serial):
+        changes = [change for change in diff_settings(snapshot_settings(serial), profile)
+                   if change[0] in SETTINGS_NAMESPACES]
+        return changes, apply_settings(changes, serial)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(serials)))) as pool:
+        futures = {pool.submit(apply, serial): serial for serial in serials}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = str(e)
+    return results
+
+ADB_WIRELESS_PORT = 5555
+
+async def _probe_port(host, port, timeout, semaphore):
+    """Return (host, port, connect seconds) if the port accepts connections"""
+    async with semaphore:
+        start = perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        except (OSError, asyncio.TimeoutError):
+            return None
+        elapsed = perf_counter() - start
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return host, port, elapsed
+
+async def scan_subnet_async(network, ports=(ADB_WIRELESS_PORT,), timeout=0.5, concurrency=256):
+    """Probe every host of a network on the given ports concurrently"""
+    net = ipaddress.ip_network(network, strict=False)
+    hosts = list(net.hosts()) or [net.network_address]
+    semaphore = asyncio.Semaphore(concurrency)
+    results = await asyncio.gather(*(_probe_port(str(host), port, timeout, semaphore)
+                                     for host in hosts for port in ports))
+    return sorted((result for result in results if result), key=lambda r: (ipaddress.ip_address(r[0]), r[1]))
+
+def scan_subnet(network, ports=(ADB_WIRELESS_PORT,), timeout=0.5, concurrency=256):
+    """Find hosts with open ADB ports, return (host, port, connect seconds) tuples"""
+    return asyncio.run(scan_subnet_async(network, ports, timeout, concurrency))
+
+def local_subnet():
+    """Guess the /24 network of the default interface"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(("10.255.255.255", 1))
+            address = sock.getsockname()[0]
+        return str(ipaddress.ip_network(f"{address}/24", strict=False))
+    except OSError:
+        return "192.168.1.0/24"
+
+class WirelessMonitor:
+    """Keeps wireless ADB devices connected.
+
+    Every interval one `adb devices` call reports which wireless serials are
+    online and a TCP connect to each device measures round-trip latency.
+    Devices that dropped are reconnected with exponential backoff.
+    `on_event(address, state, rtt)` is called from the monitor thread.
+    """
+
+    def __init__(self, interval=5.0, max_backoff=60.0, on_event=None):
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.on_event = on_event
+        self.targets = {}
+        self.stopped = None
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.stopped is not None and not self.stopped.is_set()
+
+    def add(self, address):
+        if ':' not in address:
+            address = f"{address}:{ADB_WIRELESS_PORT}"
+        self.targets.setdefault(address, {'state': 'unknown', 'rtt': None, 'failures': 0, 'next_attempt': 0.0})
+
+    async def _adb(self, *args, timeout=10):
+        process = await asyncio.create_subprocess_exec('adb', *args, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.STDOUT)
+        try:
+            output, _ = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            return ''
+        return output.decode(errors='replace')
+
+    async def _online(self):
+        """Return wireless serials in 'device' state, adding new ones as targets"""
+        online = set()
+        for line in (await self._adb('devices')).splitlines()[1:]:
+            parts = line.split()
+            if len(parts) >= 2 and ':' in parts[0]:
+                self.add(parts[0])
+                if parts[1] == 'device':
+                    online.add(parts[0])
+        return online
+
+    async def _check(self, address, online, semaphore):
+        target = self.targets[address]
+        host, _, port = address.rpartition(':')
+        probe = await _probe_port(host, int(port), 2.0, semaphore)
+        target['rtt'] = probe[2] if probe else None
+        if address in online:
+            target.update(state='online', failures=0, next_attempt=0.0)
+        elif perf_counter() >= target['next_attempt']:
+            output = await self._adb('connect', address)
+            if 'connected to' in output and 'unable' not in output:
+                target.update(state='reconnected', failures=0, next_attempt=0.0)
+            else:
+                target['failures'] += 1
+                delay = min(self.max_backoff, 2 ** target['failures'])
+                target.update(state=f"offline (retry in {delay:.0f}s)", next_attempt=perf_counter() + delay)
+        if self.on_event:
+            self.on_event(address, target['state'], target['rtt'])
+
+    async def run(self, stopped):
+        semaphore = asyncio.Semaphore(64)
+        while not stopped.is_set():
+            online = await self._online()
+            await asyncio.gather(*(self._check(address, online, semaphore) for address in list(self.targets)))
+            for _ in range(int(self.interval * 10)):
+                if stopped.is_set():
+                    break
+                await asyncio.sleep(0.1)
+
+    def start(self):
+        # Each run gets its own stop event, so a loop still winding down after stop() never resumes
+        if not self.running:
+            self.stopped = Event()
+            self.thread = Thread(target=asyncio.run, args=(self.run(self.stopped),), daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.stopped:
+            self.stopped.set()
+
+TERMINAL_MAX_LINES = 20000
+HISTORY_FILE = os.path.join(CACHE_DIR, "terminal_history")
+
+class CommandHistory:
+    """Append-only terminal history file with prefix and reverse search.
+
+    Commands are kept oldest first without consecutive duplicates, plus a
+    sorted list of unique commands so prefix completion is a bisect. The file
+    is rewritten only when it grows past the limit by a tenth.
+    """
+
+    def __init__(self, path=HISTORY_FILE, limit=50000):
+        self.path = path
+        self.limit = limit
+        self.entries = []
+        self.cursor = None
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    command = line.rstrip('\n')
+                    if command and (not self.entries or self.entries[-1] != command):
+                        self.entries.append(command)
+        except OSError:
+            pass
+        if len(self.entries) > limit:
+            self._compact()
+        self.unique = sorted(set(self.entries))
+
+    def _compact(self):
+        self.entries = self.entries[-self.limit:]
+        self.unique = sorted(set(self.entries))
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+                f.writelines(command + '\n' for command in self.entries)
+            os.replace(self.path + '.tmp', self.path)
+        except OSError:
+            pass
+
+    def add(self, command):
+        command = ' '.join(command.splitlines()).strip()
+        self.cursor = None
+        if not command or (self.entries and self.entries[-1] == command):
+            return
+        self.entries.append(command)
+        index = bisect.bisect_left(self.unique, command)
+        if index == len(self.unique) or self.unique[index] != command:
+            self.unique.insert(index, command)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(command + '\n')
+        except OSError:
+            pass
+        if len(self.entries) > self.limit + self.limit // 10:
+            self._compact()
+
+    def complete(self, prefix, limit=100):
+        """Return unique commands starting with prefix, in sorted order"""
+        index = bisect.bisect_left(self.unique, prefix)
+        matches = []
+        while index < len(self.unique) and len(matches) < limit and self.unique[index].startswith(prefix):
+            matches.append(self.unique[index])
+            index += 1
+        return matches
+
+    def search(self, text, before=None):
+        """Return (index, command) of the newest command containing text, older than before"""
+        index = len(self.entries) if before is None else before
+        while index > 0:
+            index -= 1
+            if text in self.entries[index]:
+                return index, self.entries[index]
+        return None
+
+    def matches(self, text, limit=1000):
+        """Return distinct commands containing text, newest first"""
+        seen = set()
+        found = []
+        for command in reversed(self.entries):
+            if text in command and command not in seen:
+                seen.add(command)
+                found.append(command)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def previous(self, prefix=''):
+        """Step back to the previous command starting with prefix"""
+        index = len(self.entries) if self.cursor is None else self.cursor
+        current = self.entries[index] if index < len(self.entries) else None
+        while index > 0:
+            index -= 1
+            if self.entries[index].startswith(prefix) and self.entries[index] != current:
+                self.cursor = index
+                return self.entries[index]
+        return None
+
+    def next(self, prefix=''):
+        """Step forward; returns the prefix itself past the newest command"""
+        if self.cursor is None:
+            return None
+        index = self.cursor
+        current = self.entries[index]
+        while index < len(self.entries) - 1:
+            index += 1
+            if self.entries[index].startswith(prefix) and self.entries[index] != current:
+                self.cursor = index
+                return self.entries[index]
+        self.cursor = None
+        return prefix
+
 class ADBHelperGUI:
     def __init__(self, root):
         self.root = root
@@ -34,13 +2892,18 @@ class ADBHelperGUI:
         self.dark_mode = True
         self.set_theme()
 
+        self.scheduler = DeviceScheduler()
+        self.pending_callbacks = {}
+        self.callbacks_lock = Lock()
+        self.device_tracker = DeviceTracker(self._on_devices_changed).start()
         self.setup_ui()
         self.check_adb_installation()
+        self.warm_start()
 
         # Load icon (with fallback)
         try:
             icon_url = "https://raw.githubusercontent.com/mleko777/adb-helper/main/icon.png"
-            response = requests.get(icon_url)
+            response = requests.get(icon_url, timeout=5)
             img_data = response.content
             img = Image.open(BytesIO(img_data))
             photo = ImageTk.PhotoImage(img)
@@ -54,6 +2917,91 @@ class ADBHelperGUI:
         self.batch_operations = []
         self.permission_history = []
 
+    def warm_start(self):
+        """Show the last known state of the last device, then re-read it in the background"""
+        self.state_identity = None
+        self.state_generation = 0
+        try:
+            self.state_cache = DeviceStateCache()
+            serial = self.state_cache.last_serial()
+        except sqlite3.Error as e:
+            self.state_cache = None
+            self.print_to_console(f"Device state cache unavailable: {str(e)}", error=True)
+            return
+        path = self.device_path.get() or "/sdcard/"
+        if serial:
+            props = self.state_cache.load(serial, 'props')
+            packages = self.state_cache.load(serial, 'packages')
+            listing = self.state_cache.latest(serial, 'listing')
+            if props:
+                self._show_device_info(props[0])
+            if packages:
+                self._fill_app_list(packages[0].split(), '')
+            if listing:
+                path = listing[0]
+                self.device_path.delete(0, tk.END)
+                self.device_path.insert(0, path)
+                self._show_device_listing(listing[1])
+            if props or packages or listing:
+                updated = datetime.fromtimestamp(max(row[-1] for row in (props, packages, listing) if row))
+                self.print_to_console(f"Showing cached state of {serial} from {updated.strftime('%Y-%m-%d %H:%M')}")
+        self._read_device_state(path)
+
+    def _read_device_state(self, path):
+        """Read the device state in the background, dropping it if the device changes meanwhile"""
+        generation = self.state_generation
+        self.schedule(read_device_state, path, priority=PRIORITY_BACKGROUND, key='device-state',
+                      error="Error reading device state",
+                      done=lambda state: self._reconcile_state(state, generation))
+
+    def _reconcile_state(self, state, generation):
+        """Replace cached views with fresh device state and store it"""
+        if generation != self.state_generation or not state['serial'] or not state['boot_id']:
+            return
+        serial, boot_id = state['serial'], state['boot_id']
+        previous = self.state_cache.load(serial, 'props')
+        if previous and previous[1] != boot_id:
+            self.state_cache.new_boot(serial, boot_id)
+        self.state_identity = (serial, boot_id)
+        self._show_device_info(state['props'])
+        if not self.app_filter.get():
+            self._fill_app_list(state['packages'], '')
+        if state['listing'] is not None and self.device_path.get() in (state['path'], ''):
+            self._show_device_listing(state['listing'])
+        self._remember_state('props', '', state['props'])
+        self._remember_state('packages', '', '\n'.join(state['packages']))
+        if state['listing'] is not None:
+            self._remember_state('listing', state['path'], state['listing'])
+
+    def _remember_state(self, kind, key, text):
+        """Store fresh device output for the next start, once the device identity is known"""
+        if self.state_cache and self.state_identity:
+            try:
+                self.state_cache.store(*self.state_identity, kind, key, text)
+            except sqlite3.Error as e:
+                self.print_to_console(f"Error caching device state: {str(e)}", error=True)
+
+    def _on_devices_changed(self, serials):
+        """Called from the device tracker thread when devices come or go"""
+        self.scheduler.set_devices(serials)
+        self.root.after(0, self._devices_changed, serials)
+
+    def _devices_changed(self, serials):
+        """Forget per-device state that may now describe another device"""
+        previous, self.known_devices = getattr(self, 'known_devices', None), serials
+        if previous is None:
+            return
+        forget_device_caches()
+        # Counters and uid names belong to the old device; start rates over instead of diffing across devices
+        self.network_monitor = NetworkMonitor()
+        # Its exec-in streams went to the old device list; start a fresh one on the next tap
+        Thread(target=self._reset_injector, daemon=True).start()
+        # A reboot shows up as the device leaving and coming back; re-read who is there before caching again
+        self.state_identity = None
+        self.state_generation += 1
+        if self.state_cache and serials:
+            self._read_device_state(self.device_path.get() or "/sdcard/")
+
     def set_theme(self):
         """Set light/dark theme"""
         if self.dark_mode:
@@ -147,6 +3095,39 @@ class ADBHelperGUI:
             self.print_to_console(f"Error executing command: {command}\n{e.stderr}", error=True)
             return None
 
+    def schedule(self, func, *args, priority=PRIORITY_INTERACTIVE, key=None, serial=None, done=None, error="Error"):
+        """Run func on the device scheduler; done(result) is called on the UI thread.
+
+        Calls deduplicated onto a pending job with the same key replace that
+        job's done/error instead of adding another callback, so the job
+        finishes with one UI update for the latest request.
+        """
+        future = self.scheduler.submit(func, *args, priority=priority, serial=serial, key=key)
+        entry = [future, done, error]
+        if key is not None:
+            with self.callbacks_lock:
+                current = self.pending_callbacks.get((serial, key))
+                if current and current[0] is future:
+                    current[1:] = [done, error]
+                    return future
+                self.pending_callbacks[(serial, key)] = entry
+
+        def finished(future):
+            if key is not None:
+                with self.callbacks_lock:
+                    if self.pending_callbacks.get((serial, key)) is entry:
+                        del self.pending_callbacks[(serial, key)]
+            _, done, error = entry
+            try:
+                result = future.result()
+            except Exception as e:
+                self.root.after(0, self.print_to_console, f"{error}: {str(e)}", True)
+                return
+            if done:
+                self.root.after(0, done, result)
+        future.add_done_callback(finished)
+        return future
+
     def setup_ui(self):
         """Setup the main UI"""
         # Menu
@@ -229,6 +3210,41 @@ class ADBHelperGUI:
         ttk.Button(tab, text="Connect", command=self.connect_device).grid(row=5, column=0, sticky=tk.EW, pady=2)
         ttk.Button(tab, text="Disconnect", command=lambda: self.run_command("adb disconnect")).grid(row=5, column=1, sticky=tk.EW, pady=2)
 
+        # Wireless discovery
+        ttk.Label(tab, text="Wireless Discovery:").grid(row=6, column=0, sticky=tk.W, pady=5)
+        self.subnet_entry = ttk.Entry(tab)
+        self.subnet_entry.insert(0, local_subnet())
+        self.subnet_entry.grid(row=6, column=1, sticky=tk.EW)
+
+        ttk.Button(tab, text="Scan Subnet", command=self.scan_wireless).grid(row=7, column=0, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Connect Selected", command=self.connect_discovered).grid(row=7, column=1, sticky=tk.EW, pady=2)
+
+        self.wireless_list = tk.Listbox(tab, height=5)
+        self.wireless_list.grid(row=8, column=0, columnspan=2, sticky=tk.NSEW, pady=2)
+
+        self.auto_reconnect = tk.BooleanVar(value=False)
+        ttk.Checkbutton(tab, text="Keep wireless devices connected", variable=self.auto_reconnect,
+                        command=self.toggle_wireless_monitor).grid(row=9, column=0, sticky=tk.W)
+        self.wireless_status = ttk.Label(tab, text="")
+        self.wireless_status.grid(row=9, column=1, sticky=tk.W)
+        self.wireless_monitor = WirelessMonitor(on_event=self._on_wireless_event)
+        self.wireless_states = {}
+
+        # Input injection
+        ttk.Label(tab, text="Tap (x,y):").grid(row=10, column=0, sticky=tk.W, pady=5)
+        self.tap_entry = ttk.Entry(tab)
+        self.tap_entry.grid(row=10, column=1, sticky=tk.EW)
+        self.tap_entry.bind('<Return>', lambda event: self.inject_tap())
+
+        ttk.Button(tab, text="Tap", command=self.inject_tap).grid(row=11, column=0, sticky=tk.EW, pady=2)
+        self.macro_button = ttk.Button(tab, text="Record Macro", command=self.toggle_macro_recording)
+        self.macro_button.grid(row=11, column=1, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Play Macro on All Devices",
+                   command=self.play_macro).grid(row=12, column=0, columnspan=2, sticky=tk.EW, pady=2)
+        self.input_injector = None
+        self.injector_lock = Lock()
+        self.macro_recorder = None
+
         tab.columnconfigure(1, weight=1)
         tab.rowconfigure(1, weight=1)
 
@@ -262,6 +3278,8 @@ class ADBHelperGUI:
         self.device_path.insert(0, "/sdcard/")
         self.device_path.grid(row=5, column=1, sticky=tk.EW, pady=5)
 
+        ttk.Button(tab, text="Thumbnails", command=self.show_device_thumbnails).grid(row=6, column=1, sticky=tk.EW, pady=2)
+
         tab.columnconfigure(0, weight=1)
         tab.columnconfigure(1, weight=1)
         tab.rowconfigure(1, weight=1)
@@ -273,7 +3291,7 @@ class ADBHelperGUI:
 
         # App list
         ttk.Label(tab, text="Installed Apps:").grid(row=0, column=0, sticky=tk.W, pady=5)
-        self.app_list = tk.Listbox(tab, height=15)
+        self.app_list = tk.Listbox(tab, height=15, selectmode=tk.EXTENDED, exportselection=False)
         self.app_list.grid(row=1, column=0, rowspan=4, sticky=tk.NSEW, padx=5, pady=5)
 
         # App controls
@@ -297,6 +3315,14 @@ class ADBHelperGUI:
         ttk.Button(tab, text="Show Info", command=self.show_app_info).grid(row=5, column=1, sticky=tk.EW, pady=2)
         ttk.Button(tab, text="Clear Data", command=self.clear_app_data).grid(row=6, column=1, sticky=tk.EW, pady=2)
         ttk.Button(tab, text="Backup APK", command=self.backup_apk).grid(row=7, column=1, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Install APKs", command=self.install_apks).grid(row=8, column=0, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Backup to Store", command=self.backup_apk_to_store).grid(row=8, column=1, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Backup All to Store", command=self.backup_all_to_store).grid(row=9, column=1, sticky=tk.EW, pady=2)
+        self.frame_stats_button = ttk.Button(tab, text="Start Frame Stats", command=self.toggle_frame_stats)
+        self.frame_stats_button.grid(row=9, column=0, sticky=tk.EW, pady=2)
+        self.frame_stats_label = ttk.Label(tab, text="")
+        self.frame_stats_label.grid(row=10, column=0, columnspan=2, sticky=tk.W)
+        self.frame_stats_stop = None
 
         tab.columnconfigure(0, weight=1)
         tab.columnconfigure(1, weight=1)
@@ -323,6 +3349,21 @@ class ADBHelperGUI:
         self.logcat_output.grid(row=2, column=0, columnspan=4, sticky=tk.NSEW, pady=5)
         self.logcat_output.configure(state='disabled')
 
+        # Logcat rules
+        self.logcat_rules = None
+        ttk.Button(tab, text="Load Rules", command=self.load_logcat_rules).grid(row=3, column=0, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Rule Stats", command=self.show_logcat_rule_stats).grid(row=3, column=1, sticky=tk.EW, pady=2)
+        self.logcat_rule_label = ttk.Label(tab, text="No rules loaded")
+        self.logcat_rule_label.grid(row=3, column=2, columnspan=2, sticky=tk.W)
+
+        # Crash collector
+        self.crash_button = ttk.Button(tab, text="Collect Crashes", command=self.toggle_crash_collector)
+        self.crash_button.grid(row=4, column=0, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Crash Report", command=self.show_crash_report).grid(row=4, column=1, sticky=tk.EW, pady=2)
+        self.crash_label = ttk.Label(tab, text="")
+        self.crash_label.grid(row=4, column=2, columnspan=2, sticky=tk.W)
+        self.crash_collector = None
+
         tab.columnconfigure(0, weight=1)
         tab.columnconfigure(1, weight=1)
         tab.columnconfigure(2, weight=1)
@@ -345,16 +3386,37 @@ class ADBHelperGUI:
         ttk.Label(tab, text="Screenshot:").grid(row=0, column=1, sticky=tk.W, pady=5)
         ttk.Button(tab, text="Take Screenshot", command=self.take_screenshot).grid(row=1, column=1, sticky=tk.EW, pady=2)
         ttk.Button(tab, text="Record Screen", command=self.record_screen).grid(row=2, column=1, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Compare Screenshots", command=self.compare_screenshots).grid(row=3, column=1, sticky=tk.EW, pady=2)
 
         # System info
         ttk.Label(tab, text="System Info:").grid(row=0, column=2, sticky=tk.W, pady=5)
         ttk.Button(tab, text="Get Prop", command=self.get_system_prop).grid(row=1, column=2, sticky=tk.EW, pady=2)
         ttk.Button(tab, text="Battery Info", command=self.get_battery_info).grid(row=2, column=2, sticky=tk.EW, pady=2)
         ttk.Button(tab, text="CPU Info", command=self.get_cpu_info).grid(row=3, column=2, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Browse Dumpsys", command=lambda: self.open_dumpsys([], "full")).grid(row=4, column=2, sticky=tk.EW, pady=2)
+
+        # Device settings profiles
+        ttk.Label(tab, text="Device Settings:").grid(row=0, column=3, sticky=tk.W, pady=5)
+        ttk.Button(tab, text="Save Settings Profile", command=self.save_settings_profile).grid(row=1, column=3, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Diff Settings", command=self.diff_device_settings).grid(row=2, column=3, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Apply Profile to All Devices", command=self.apply_settings_profile).grid(row=3, column=3, sticky=tk.EW, pady=2)
+
+        # Tracing
+        ttk.Label(tab, text="Trace Categories:").grid(row=5, column=0, sticky=tk.W, pady=5)
+        self.trace_categories = ttk.Entry(tab)
+        self.trace_categories.insert(0, ATRACE_CATEGORIES)
+        self.trace_categories.grid(row=6, column=0, columnspan=2, sticky=tk.EW, pady=2)
+        self.trace_button = ttk.Button(tab, text="Start Trace", command=self.toggle_trace)
+        self.trace_button.grid(row=6, column=2, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Summarize Trace File", command=self.summarize_trace_file).grid(row=6, column=3, sticky=tk.EW, pady=2)
+        self.trace_label = ttk.Label(tab, text="")
+        self.trace_label.grid(row=7, column=0, columnspan=4, sticky=tk.W)
+        self.trace_capture = None
 
         tab.columnconfigure(0, weight=1)
         tab.columnconfigure(1, weight=1)
         tab.columnconfigure(2, weight=1)
+        tab.columnconfigure(3, weight=1)
 
     def create_backup_tab(self):
         """Create backup/restore tab"""
@@ -366,18 +3428,34 @@ class ADBHelperGUI:
         ttk.Button(tab, text="Full Backup", command=self.create_full_backup).grid(row=1, column=0, sticky=tk.EW, pady=2)
         ttk.Button(tab, text="Full Restore", command=self.restore_full_backup).grid(row=2, column=0, sticky=tk.EW, pady=2)
 
+        # Backup file tools
+        ttk.Label(tab, text="Backup Files (.ab):").grid(row=0, column=1, sticky=tk.W, pady=5)
+        ttk.Button(tab, text="Inspect", command=self.inspect_ab).grid(row=1, column=1, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Extract App Data", command=self.extract_ab_app).grid(row=2, column=1, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Convert to .tar", command=self.convert_ab_to_tar).grid(row=3, column=1, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Verify", command=self.verify_ab).grid(row=4, column=1, sticky=tk.EW, pady=2)
+
         # Partition backup
         ttk.Label(tab, text="Partition Backup:").grid(row=3, column=0, sticky=tk.W, pady=5)
         ttk.Button(tab, text="Backup Boot", command=lambda: self.backup_partition("boot")).grid(row=4, column=0, sticky=tk.EW, pady=2)
         ttk.Button(tab, text="Backup Recovery", command=lambda: self.backup_partition("recovery")).grid(row=5, column=0, sticky=tk.EW, pady=2)
+        self.image_compress = tk.BooleanVar(value=True)
+        ttk.Checkbutton(tab, text="Compress images (gzip)", variable=self.image_compress).grid(row=6, column=0, sticky=tk.W, pady=2)
+        self.image_verify = tk.BooleanVar(value=False)
+        ttk.Checkbutton(tab, text="Verify against on-device checksum", variable=self.image_verify).grid(row=7, column=0, sticky=tk.W, pady=2)
+        self.image_progress = ttk.Progressbar(tab, maximum=100)
+        self.image_progress.grid(row=8, column=0, sticky=tk.EW, pady=2)
+        self.image_status = ttk.Label(tab, text="")
+        self.image_status.grid(row=9, column=0, sticky=tk.W)
 
         # Backup info
-        ttk.Label(tab, text="Backup Location:").grid(row=6, column=0, sticky=tk.W, pady=5)
+        ttk.Label(tab, text="Backup Location:").grid(row=10, column=0, sticky=tk.W, pady=5)
         self.backup_path = ttk.Entry(tab)
         self.backup_path.insert(0, os.path.expanduser("~/adb_backups"))
-        self.backup_path.grid(row=7, column=0, sticky=tk.EW, pady=2)
+        self.backup_path.grid(row=11, column=0, sticky=tk.EW, pady=2)
 
         tab.columnconfigure(0, weight=1)
+        tab.columnconfigure(1, weight=1)
 
     def create_settings_tab(self):
         """Create settings tab"""
@@ -390,9 +3468,16 @@ class ADBHelperGUI:
         ttk.Button(tab, text="Start Server", command=lambda: self.run_command("adb start-server")).grid(row=2, column=0, sticky=tk.EW, pady=2)
         ttk.Button(tab, text="Devices", command=lambda: self.run_command("adb devices -l")).grid(row=3, column=0, sticky=tk.EW, pady=2)
 
+        # ADB server (e.g. the simulated device farm in bench/adbfarm.py)
+        ttk.Label(tab, text="ADB Server (host:port, empty for default):").grid(row=4, column=0, sticky=tk.W, pady=5)
+        self.adb_server_entry = ttk.Entry(tab)
+        self.adb_server_entry.insert(0, os.environ.get('ADB_SERVER_SOCKET', '').replace('tcp:', '', 1))
+        self.adb_server_entry.grid(row=5, column=0, sticky=tk.EW, pady=2)
+        ttk.Button(tab, text="Use Server", command=self.set_adb_server).grid(row=6, column=0, sticky=tk.EW, pady=2)
+
         # UI settings
-        ttk.Label(tab, text="UI Settings:").grid(row=4, column=0, sticky=tk.W, pady=5)
-        ttk.Button(tab, text="Toggle Theme", command=self.toggle_theme).grid(row=5, column=0, sticky=tk.EW, pady=2)
+        ttk.Label(tab, text="UI Settings:").grid(row=7, column=0, sticky=tk.W, pady=5)
+        ttk.Button(tab, text="Toggle Theme", command=self.toggle_theme).grid(row=8, column=0, sticky=tk.EW, pady=2)
 
         tab.columnconfigure(0, weight=1)
 
@@ -518,18 +3603,82 @@ class ADBHelperGUI:
 
         # Process list
         ttk.Label(tab, text="Running Processes:").grid(row=4, column=0, columnspan=2, sticky=tk.W, pady=5)
-        self.process_listbox = tk.Listbox(tab, height=12)
+        self.process_listbox = tk.Listbox(tab, height=12, selectmode=tk.EXTENDED, exportselection=False)
         self.process_listbox.grid(row=5, column=0, columnspan=2, sticky=tk.NSEW)
 
+        self.process_listbox.bind('<<ListboxSelect>>', self._select_memory_rows)
+
         # Process controls
         ttk.Button(tab, text="Refresh Processes",
                  command=self.refresh_processes).grid(row=6, column=0, sticky=tk.EW, pady=2)
         ttk.Button(tab, text="Kill Process",
                  command=self.kill_process).grid(row=6, column=1, sticky=tk.EW, pady=2)
 
+        # Per-process memory
+        ttk.Button(tab, text="Refresh Memory",
+                 command=self.refresh_memory).grid(row=7, column=0, sticky=tk.EW, pady=2)
+        self.memory_tracking = tk.BooleanVar(value=False)
+        ttk.Checkbutton(tab, text="Sample memory every 10 s", variable=self.memory_tracking,
+                        command=self.toggle_memory_tracking).grid(row=7, column=1, sticky=tk.W, pady=2)
+
+        columns = ('pid', 'name', 'pss', 'rss', 'swap', 'trend')
+        headings = ('PID', 'Process', 'PSS (KB)', 'RSS (KB)', 'Swap (KB)', 'Trend (KB/min)')
+        self.memory_tree = ttk.Treeview(tab, columns=columns, show='headings', height=10)
+        for column, heading in zip(columns, headings):
+            self.memory_tree.heading(column, text=heading, command=lambda c=column: self.sort_memory(c))
+            self.memory_tree.column(column, width=260 if column == 'name' else 90,
+                                    anchor=tk.W if column == 'name' else tk.E)
+        self.memory_tree.grid(row=8, column=0, columnspan=2, sticky=tk.NSEW)
+        self.memory_tree.bind('<<TreeviewSelect>>', self._select_process_rows)
+        self.memory_status = ttk.Label(tab, text="")
+        self.memory_status.grid(row=9, column=0, columnspan=2, sticky=tk.W)
+
+        # Power profiling
+        self.power_button = ttk.Button(tab, text="Start Power Profile", command=self.toggle_power_profile)
+        self.power_button.grid(row=10, column=0, sticky=tk.EW, pady=2)
+        rate_frame = ttk.Frame(tab)
+        rate_frame.grid(row=10, column=1, sticky=tk.W)
+        ttk.Label(rate_frame, text="Rate (Hz):").pack(side=tk.LEFT)
+        self.power_rate = ttk.Combobox(rate_frame, values=["10", "25", "50", "100"], width=5)
+        self.power_rate.set("50")
+        self.power_rate.pack(side=tk.LEFT, padx=5)
+        self.power_label = ttk.Label(tab, text="")
+        self.power_label.grid(row=11, column=0, columnspan=2, sticky=tk.W)
+        self.power_profiler = None
+
+        # Per-app network usage
+        ttk.Button(tab, text="Refresh Network",
+                 command=self.refresh_network).grid(row=12, column=0, sticky=tk.EW, pady=2)
+        self.network_tracking = tk.BooleanVar(value=False)
+        ttk.Checkbutton(tab, text="Sample network every 5 s", variable=self.network_tracking,
+                        command=self.toggle_network_tracking).grid(row=12, column=1, sticky=tk.W, pady=2)
+
+        columns = ('uid', 'app', 'rx_rate', 'tx_rate', 'peak', 'rx', 'tx')
+        headings = ('UID', 'App', 'Rx (KB/s)', 'Tx (KB/s)', 'Peak (KB/s)', 'Rx total (MB)', 'Tx total (MB)')
+        self.network_tree = ttk.Treeview(tab, columns=columns, show='headings', height=8)
+        for column, heading in zip(columns, headings):
+            self.network_tree.heading(column, text=heading)
+            self.network_tree.column(column, width=260 if column == 'app' else 90,
+                                     anchor=tk.W if column == 'app' else tk.E)
+        self.network_tree.grid(row=13, column=0, columnspan=2, sticky=tk.NSEW)
+        self.network_status = ttk.Label(tab, text="")
+        self.network_status.grid(row=14, column=0, columnspan=2, sticky=tk.W)
+        self.network_monitor = NetworkMonitor()
+        self.network_tracking_running = False
+        self.network_tracking_thread = None
+
+        self.memory_history = MemoryHistory()
+        self.memory_processes = {}
+        self.memory_sort = ('pss', True)
+        self.memory_syncing = False
+        self.memory_tracking_running = False
+        self.memory_tracking_thread = None
+
         tab.columnconfigure(0, weight=1)
         tab.columnconfigure(1, weight=1)
         tab.rowconfigure(5, weight=1)
+        tab.rowconfigure(8, weight=1)
+        tab.rowconfigure(13, weight=1)
 
     def create_permission_manager_tab(self):
         """Permissions management tab"""
@@ -539,7 +3688,7 @@ class ADBHelperGUI:
         # App permissions
         ttk.Label(tab, text="App Permissions:").grid(row=0, column=0, sticky=tk.W, pady=5)
 
-        self.permission_app_list = tk.Listbox(tab, height=12, selectmode=tk.SINGLE)
+        self.permission_app_list = tk.Listbox(tab, height=12, selectmode=tk.EXTENDED, exportselection=False)
         self.permission_app_list.grid(row=1, column=0, rowspan=4, sticky=tk.NSEW, padx=5, pady=5)
 
         ttk.Button(tab, text="Refresh Apps",
@@ -578,14 +3727,28 @@ class ADBHelperGUI:
         self.terminal_entry = ttk.Entry(tab)
         self.terminal_entry.grid(row=0, column=1, sticky=tk.EW, padx=5)
         self.terminal_entry.bind('<Return>', self.execute_terminal_command)
+        self.terminal_entry.bind('<Up>', self.terminal_history_previous)
+        self.terminal_entry.bind('<Down>', self.terminal_history_next)
+        self.terminal_entry.bind('<Control-r>', self.terminal_reverse_search)
+        self.terminal_entry.bind('<Tab>', self.terminal_complete)
+        self.terminal_entry.bind('<Control-c>', self.cancel_terminal_command)
+        self.terminal_entry.bind('<KeyRelease>', self.terminal_history_reset)
 
         ttk.Button(tab, text="Execute",
                  command=lambda: self.execute_terminal_command(None)).grid(row=0, column=2, sticky=tk.EW)
+        ttk.Button(tab, text="Stop",
+                 command=self.cancel_terminal_command).grid(row=0, column=3, sticky=tk.EW)
 
         # Terminal output
         self.terminal_output = scrolledtext.ScrolledText(tab, height=20)
-        self.terminal_output.grid(row=1, column=0, columnspan=3, sticky=tk.NSEW, pady=5)
+        self.terminal_output.grid(row=1, column=0, columnspan=4, sticky=tk.NSEW, pady=5)
         self.terminal_output.configure(state='disabled')
+        self.terminal_output.bind('<Control-c>', self.cancel_terminal_command)
+
+        self.terminal_history = CommandHistory()
+        self.terminal_prefix = ''
+        self.terminal_search = None
+        self.terminal_process = None
 
         # History
         ttk.Button(tab, text="Clear",
@@ -593,7 +3756,7 @@ class ADBHelperGUI:
         ttk.Button(tab, text="Save Output",
                  command=self.save_terminal_output).grid(row=2, column=1, sticky=tk.EW, pady=2)
         ttk.Button(tab, text="History",
-                 command=self.show_terminal_history).grid(row=2, column=2, sticky=tk.EW, pady=2)
+                 command=self.show_terminal_history).grid(row=2, column=2, columnspan=2, sticky=tk.EW, pady=2)
 
         tab.columnconfigure(1, weight=1)
         tab.rowconfigure(1, weight=1)
@@ -603,14 +3766,18 @@ class ADBHelperGUI:
         """Update device information"""
         try:
             info = subprocess.check_output("adb shell getprop", shell=True, text=True)
-            self.device_info.configure(state='normal')
-            self.device_info.delete(1.0, tk.END)
-            self.device_info.insert(tk.END, info)
-            self.device_info.configure(state='disabled')
+            self._show_device_info(info)
+            self._remember_state('props', '', info)
             self.print_to_console("Device info updated")
         except subprocess.CalledProcessError as e:
             self.print_to_console(f"Error getting device info: {str(e)}", error=True)
 
+    def _show_device_info(self, info):
+        self.device_info.configure(state='normal')
+        self.device_info.delete(1.0, tk.END)
+        self.device_info.insert(tk.END, info)
+        self.device_info.configure(state='disabled')
+
     def connect_device(self):
         """Connect to device via IP"""
         ip = self.ip_entry.get()
@@ -620,9 +3787,172 @@ class ADBHelperGUI:
 
         if self.run_command(f"adb connect {ip}"):
             self.print_to_console(f"Connected to {ip}")
+            self.wireless_monitor.add(ip)
             self.update_device_info()
 
+    def scan_wireless(self):
+        """Scan the subnet for open ADB ports in the background"""
+        network = self.subnet_entry.get().strip()
+        try:
+            ipaddress.ip_network(network, strict=False)
+        except ValueError:
+            messagebox.showerror("Error", f"Invalid network: {network}")
+            return
+
+        def worker():
+            start = perf_counter()
+            found = scan_subnet(network)
+            self.root.after(0, self._show_scan_results, found, perf_counter() - start)
+
+        self.print_to_console(f"Scanning {network} for ADB devices...")
+        Thread(target=worker, daemon=True).start()
+
+    def _show_scan_results(self, found, elapsed):
+        self.wireless_list.delete(0, tk.END)
+        for host, port, rtt in found:
+            self.wireless_list.insert(tk.END, f"{host}:{port}  ({rtt * 1000:.1f} ms)")
+        self.print_to_console(f"Scan finished in {elapsed:.1f}s: {len(found)} device(s) found")
+
+    def connect_discovered(self):
+        """Connect to the selected discovered device"""
+        selection = self.wireless_list.curselection()
+        if not selection:
+            messagebox.showerror("Error", "No device selected")
+            return
+
+        self.ip_entry.delete(0, tk.END)
+        self.ip_entry.insert(0, self.wireless_list.get(selection[0]).split()[0])
+        self.connect_device()
+
+    def toggle_wireless_monitor(self):
+        """Start or stop keepalive and automatic reconnect for wireless devices"""
+        if self.auto_reconnect.get():
+            self.wireless_monitor.start()
+            self.print_to_console("Wireless keepalive started")
+        else:
+            self.wireless_monitor.stop()
+            self.wireless_status.config(text="")
+            self.print_to_console("Wireless keepalive stopped")
+
+    def _on_wireless_event(self, address, state, rtt):
+        self.root.after(0, self._update_wireless_status, address, state, rtt)
+
+    def _update_wireless_status(self, address, state, rtt):
+        previous = self.wireless_states.get(address)
+        self.wireless_states[address] = state
+        if state != previous and previous is not None:
+            self.print_to_console(f"{address}: {state}", error=state.startswith('offline'))
+        self.wireless_status.config(text="  ".join(
+            f"{addr} {self.wireless_monitor.targets[addr]['rtt'] * 1000:.0f} ms"
+            if self.wireless_monitor.targets[addr]['rtt'] is not None else f"{addr} -"
+            for addr in sorted(self.wireless_states)))
+
     # File tab methods
+    def _injector(self, serial):
+        """Return the persistent input injector for a device, starting it on first use"""
+        with self.injector_lock:
+            if self.input_injector is not None and self.input_injector.serial != serial:
+                self.input_injector.close()
+                self.input_injector = None
+            if self.input_injector is None:
+                self.input_injector = InputInjector(serial).start()
+            return self.input_injector
+
+    def _reset_injector(self):
+        # Waits for a tap that is still starting the injector, so runs off the UI thread
+        with self.injector_lock:
+            if self.input_injector:
+                self.input_injector.close()
+                self.input_injector = None
+
+    def _injector_serial(self):
+        """Pick the device taps go to, asking when several are attached; None if there is none"""
+        devices = getattr(self, 'known_devices', None) or []
+        current = self.input_injector.serial if self.input_injector else None
+        if current in devices:
+            return current
+        if len(devices) <= 1:
+            return devices[0] if devices else ''
+        serial = simpledialog.askstring("Tap", "Device to send input to:\n" + "\n".join(devices),
+                                        initialvalue=devices[0])
+        if serial not in devices:
+            if serial:
+                messagebox.showerror("Error", f"{serial} is not attached")
+            return None
+        return serial
+
+    def inject_tap(self):
+        """Tap the entered screen coordinates through the input injector"""
+        try:
+            x, y = (int(value) for value in self.tap_entry.get().replace(' ', '').split(','))
+        except ValueError:
+            messagebox.showerror("Error", "Enter coordinates as x,y")
+            return
+        serial = self._injector_serial()
+        if serial is None:
+            return
+
+        def tap():
+            started = perf_counter()
+            self._injector(serial or None).tap(x, y)
+            return perf_counter() - started
+        self.schedule(tap, key=('tap', x, y), serial=serial or None, error="Tap failed",
+                      done=lambda seconds: self.print_to_console(f"Tapped {x},{y} in {seconds * 1000:.0f} ms"))
+
+    def toggle_macro_recording(self):
+        """Start recording device input, or stop and save the macro"""
+        if self.macro_recorder is None:
+            self.macro_recorder = MacroRecorder()
+            try:
+                self.macro_recorder.start()
+            except (subprocess.CalledProcessError, OSError) as e:
+                self.macro_recorder = None
+                self.print_to_console(f"Error starting macro recording: {str(e)}", error=True)
+                return
+            self.macro_button.config(text="Stop Recording")
+            self.print_to_console("Recording input, use the device now")
+            return
+
+        macro = self.macro_recorder.stop()
+        self.macro_recorder = None
+        self.macro_button.config(text="Record Macro")
+        if not macro['frames']:
+            self.print_to_console("No input recorded", error=True)
+            return
+
+        filename = filedialog.asksaveasfilename(title="Save Macro", defaultextension=".json",
+                                                filetypes=[("Macro Files", "*.json")])
+        if filename:
+            with open(filename, 'w') as f:
+                json.dump(macro, f)
+            self.print_to_console(f"Saved macro with {len(macro['frames'])} input frames "
+                                  f"({macro['frames'][-1][0]:.1f} s) to {filename}")
+
+    def play_macro(self):
+        """Replay a saved macro on every connected device at once"""
+        filename = filedialog.askopenfilename(title="Select Macro", filetypes=[("Macro Files", "*.json")])
+        if not filename:
+            return
+        try:
+            with open(filename) as f:
+                macro = json.load(f)
+        except (OSError, ValueError) as e:
+            self.print_to_console(f"Error loading macro: {str(e)}", error=True)
+            return
+
+        devices = list_devices()
+        if not devices:
+            messagebox.showerror("Error", "No devices connected")
+            return
+
+        def report(results):
+            for serial, error in sorted(results.items()):
+                if error:
+                    self.print_to_console(f"Macro on {serial} failed: {error}", error=True)
+            self.print_to_console(f"Macro played on {sum(1 for error in results.values() if not error)} device(s)")
+        self.print_to_console(f"Playing {os.path.basename(filename)} on {len(devices)} device(s)")
+        Thread(target=lambda: self.root.after(0, report, play_macro_on_devices(macro, devices)), daemon=True).start()
+
     def browse_local_files(self):
         """Browse local files"""
         path = filedialog.askdirectory()
@@ -642,13 +3972,84 @@ class ADBHelperGUI:
 
         try:
             result = subprocess.check_output(f'adb shell ls "{path}"', shell=True, text=True)
-            self.device_files.delete(0, tk.END)
-            for line in result.split('\n'):
-                if line.strip():
-                    self.device_files.insert(tk.END, line)
+            self._show_device_listing(result)
+            self._remember_state('listing', path, result)
         except subprocess.CalledProcessError as e:
             self.print_to_console(f"Error browsing device files: {str(e)}", error=True)
 
+    def _show_device_listing(self, listing):
+        self.device_files.delete(0, tk.END)
+        for line in listing.split('\n'):
+            if line.strip():
+                self.device_files.insert(tk.END, line)
+
+    def show_device_thumbnails(self):
+        """Show thumbnails of the media in the current device folder"""
+        path = self.device_path.get() or "/sdcard/"
+        if not hasattr(self, 'thumbnail_cache'):
+            self.thumbnail_cache = ThumbnailCache()
+
+        window = tk.Toplevel(self.root)
+        window.title(f"Thumbnails - {path}")
+        window.geometry("760x560")
+        canvas = tk.Canvas(window, background='white')
+        scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL, command=canvas.yview)
+        canvas.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        status = ttk.Label(window, text="Listing...")
+        status.place(relx=0, rely=1, anchor=tk.SW)
+
+        cell = THUMB_SIZE[0] + 24
+        images = {}
+        slots = {}
+        start = perf_counter()
+
+        def place(name, data):
+            if not window.winfo_exists() or name not in slots:
+                return
+            x, y = slots[name]
+            images[name] = ImageTk.PhotoImage(data=data)
+            canvas.create_image(x + cell // 2, y + THUMB_SIZE[1] // 2 + 4, image=images[name], tags=('file:' + name,))
+            canvas.tag_raise('play')
+            status.configure(text=f"{len(images)}/{len(slots)} thumbnails")
+
+        def layout(entries):
+            if not window.winfo_exists():
+                return
+            columns = max(1, canvas.winfo_width() // cell)
+            media = [entry for entry in entries if not entry[3] and entry[0].lower().endswith(IMAGE_EXTENSIONS + VIDEO_EXTENSIONS)]
+            for i, (name, _, _, _) in enumerate(media):
+                x, y = (i % columns) * cell, (i // columns) * (cell + 12)
+                slots[name] = (x, y)
+                canvas.create_rectangle(x + 12, y + 4, x + cell - 12, y + THUMB_SIZE[1] + 4, outline='#ccc', tags=('file:' + name,))
+                if name.lower().endswith(VIDEO_EXTENSIONS):
+                    canvas.create_text(x + cell // 2, y + THUMB_SIZE[1] // 2, text="▶", font=('TkDefaultFont', 24),
+                                       tags=('file:' + name, 'play'))
+                canvas.create_text(x + cell // 2, y + THUMB_SIZE[1] + 14, text=name[:16], tags=('file:' + name,))
+            canvas.configure(scrollregion=(0, 0, columns * cell, (len(media) // columns + 1) * (cell + 12)))
+            status.configure(text=f"0/{len(media)} thumbnails")
+            self.schedule(load_thumbnails, path, entries, self.thumbnail_cache,
+                          lambda name, data: self.root.after(0, place, name, data),
+                          priority=PRIORITY_TRANSFER, key=('thumbs', path, str(window)), error="Error loading thumbnails",
+                          done=lambda missing: window.winfo_exists() and status.configure(
+                              text=f"{len(images)} thumbnails ({missing} generated) in {perf_counter() - start:.1f} s"))
+
+        def on_click(event):
+            tags = canvas.gettags(canvas.find_closest(canvas.canvasx(event.x), canvas.canvasy(event.y)))
+            names = list(self.device_files.get(0, tk.END))
+            name = tags[0][5:] if tags else None
+            if name in names:
+                index = names.index(name)
+                self.device_files.selection_clear(0, tk.END)
+                self.device_files.selection_set(index)
+                self.device_files.see(index)
+
+        canvas.bind('<Button-1>', on_click)
+        canvas.bind('<MouseWheel>', lambda event: canvas.yview_scroll(-event.delta // 120, 'units'))
+        window.update_idletasks()
+        self.schedule(list_device_dir, path, key=('ls', path), error="Error listing device files", done=layout)
+
     def push_file(self):
         """Push file to device"""
         selection = self.local_files.curselection()
@@ -661,9 +4062,11 @@ class ADBHelperGUI:
         if not device_path:
             device_path = "/sdcard/"
 
-        if self.run_command(f'adb push "{local_file}" "{device_path}"'):
-            self.print_to_console(f"Pushed {local_file} to {device_path}")
+        def pushed(result):
+            self._report_transfer("Pushed", local_file, device_path, result)
             self.browse_device_files()
+        self.schedule(transfer_file, 'push', local_file, device_path, priority=PRIORITY_TRANSFER,
+                      error=f"Error pushing {local_file}", done=pushed)
 
     def pull_file(self):
         """Pull file from device"""
@@ -675,8 +4078,14 @@ class ADBHelperGUI:
         device_file = self.device_files.get(selection[0])
         local_path = filedialog.askdirectory()
         if local_path:
-            if self.run_command(f'adb pull "{device_file}" "{local_path}"'):
-                self.print_to_console(f"Pulled {device_file} to {local_path}")
+            self.schedule(transfer_file, 'pull', device_file, local_path, priority=PRIORITY_TRANSFER,
+                          error=f"Error pulling {device_file}",
+                          done=lambda result: self._report_transfer("Pulled", device_file, local_path, result))
+
+    def _report_transfer(self, verb, source, target, result):
+        mode, size, seconds = result
+        rate = f", {size / seconds / (1 << 20):.1f} MB/s" if seconds > 0 and size else ""
+        self.print_to_console(f"{verb} {source} to {target} ({mode}{rate})")
 
     def delete_device_file(self):
         """Delete file on device"""
@@ -694,31 +4103,33 @@ class ADBHelperGUI:
     # Apps tab methods
     def refresh_app_list(self):
         """Refresh list of installed apps"""
-        try:
-            apps = subprocess.check_output("adb shell pm list packages -3", shell=True, text=True).split('\n')
-            self.app_list.delete(0, tk.END)
-            for app in apps:
-                if app.strip():
-                    self.app_list.insert(tk.END, app.replace("package:", ""))
-            self.print_to_console("App list refreshed")
-        except subprocess.CalledProcessError as e:
-            self.print_to_console(f"Error refreshing app list: {str(e)}", error=True)
+        def refreshed(apps):
+            self._fill_app_list(apps, '', "App list refreshed")
+            self._remember_state('packages', '', '\n'.join(apps))
+        return self.schedule(self._third_party_packages, key='apps', error="Error refreshing app list", done=refreshed)
+
+    def _third_party_packages(self):
+        apps = subprocess.check_output(f"adb shell {shell_tools()['pm']} list packages -3",
+                                       shell=True, text=True).split('\n')
+        return [app.replace("package:", "") for app in apps if app.strip()]
+
+    def _fill_app_list(self, apps, term, message=None):
+        self.app_list.delete(0, tk.END)
+        for app in apps:
+            if term in app.lower():
+                self.app_list.insert(tk.END, app)
+        if message:
+            self.print_to_console(message)
 
     def filter_apps(self, event):
         """Filter apps based on search term"""
         term = self.app_filter.get().lower()
         if not term:
-            self.refresh_app_list()
-            return
+            return self.refresh_app_list()
 
-        try:
-            apps = subprocess.check_output("adb shell pm list packages -3", shell=True, text=True).split('\n')
-            self.app_list.delete(0, tk.END)
-            for app in apps:
-                if app.strip() and term in app.lower():
-                    self.app_list.insert(tk.END, app.replace("package:", ""))
-        except subprocess.CalledProcessError as e:
-            self.print_to_console(f"Error filtering apps: {str(e)}", error=True)
+        # Keystrokes typed while the list is loading share one pending query and one list refill
+        return self.schedule(self._third_party_packages, key='apps', error="Error filtering apps",
+                      done=lambda apps: self._fill_app_list(apps, self.app_filter.get().lower()))
 
     def show_app_info(self):
         """Show info about selected app"""
@@ -728,28 +4139,67 @@ class ADBHelperGUI:
             return
 
         package = self.app_list.get(selection[0])
-        try:
-            info = subprocess.check_output(f"adb shell dumpsys package {package}", shell=True, text=True)
-            self.app_info.configure(state='normal')
-            self.app_info.delete(1.0, tk.END)
-            self.app_info.insert(tk.END, info)
-            self.app_info.configure(state='disabled')
-            self.print_to_console(f"Showing info for {package}")
-        except subprocess.CalledProcessError as e:
-            self.print_to_console(f"Error getting app info: {str(e)}", error=True)
+        self.open_dumpsys(['package', package], f"package_{package}", self.app_info)
+
+    def toggle_frame_stats(self):
+        """Start or stop live frame timing for the selected app"""
+        if self.frame_stats_stop and not self.frame_stats_stop.is_set():
+            self.frame_stats_stop.set()
+            return
 
-    def uninstall_app(self):
-        """Uninstall selected app"""
         selection = self.app_list.curselection()
         if not selection:
             messagebox.showerror("Error", "No app selected")
             return
 
         package = self.app_list.get(selection[0])
-        if messagebox.askyesno("Confirm", f"Uninstall {package}?"):
-            if self.run_command(f"adb uninstall {package}"):
-                self.print_to_console(f"Uninstalled {package}")
-                self.refresh_app_list()
+        # A stopped worker may still be finishing its last read; it only ever sees its own event
+        self.frame_stats_stop = Event()
+        self.frame_stats_button.config(text="Stop Frame Stats")
+        Thread(target=self._frame_stats_worker, args=(package, self.frame_stats_stop), daemon=True).start()
+        self.print_to_console(f"Frame stats started for {package}")
+
+    def _frame_stats_worker(self, package, stop):
+        stats = FrameStats()
+        while not stop.is_set():
+            started = perf_counter()
+            try:
+                stats.feed(self.scheduler.submit(read_framestats, package, priority=PRIORITY_BACKGROUND,
+                                                 key=('framestats', package)).result())
+            except Exception as e:
+                self.root.after(0, self.print_to_console, f"Frame stats error: {str(e)}", True)
+                break
+            if stop.is_set():
+                break
+            self.root.after(0, self._show_frame_stats, package, stats.frames, stats.janky,
+                            stats.percentiles(), stats.window_jank(), len(stats.times))
+            # gfxinfo keeps ~120 frames, about one second at 120 Hz
+            stop.wait(max(0.1, 1.0 - (perf_counter() - started)))
+        stop.set()
+        self.root.after(0, self._frame_stats_finished, stop)
+        self.root.after(0, self.print_to_console,
+                        f"Frame stats for {package}: {stats.frames} frames, {stats.janky} janky")
+
+    def _frame_stats_finished(self, stop):
+        if self.frame_stats_stop is stop:
+            self.frame_stats_button.config(text="Start Frame Stats")
+
+    def _show_frame_stats(self, package, frames, janky, percentiles, window_janky, window):
+        self.frame_stats_label.config(
+            text=f"{package}: p50 {percentiles[50]:.1f} ms, p90 {percentiles[90]:.1f} ms, "
+                 f"p99 {percentiles[99]:.1f} ms, jank {window_janky}/{window} recent, {janky}/{frames} total")
+
+    def uninstall_app(self):
+        """Uninstall selected apps"""
+        packages = self.selected_items(self.app_list)
+        if not packages:
+            messagebox.showerror("Error", "No app selected")
+            return
+
+        target = packages[0] if len(packages) == 1 else f"{len(packages)} apps"
+        if messagebox.askyesno("Confirm", f"Uninstall {target}?"):
+            self.run_bulk_action("Uninstall", packages, lambda package: f"pm uninstall {shlex.quote(package)}",
+                                 then=self.refresh_app_list)
 
     def launch_app(self):
         """Launch selected app"""
@@ -759,23 +4209,99 @@ class ADBHelperGUI:
             return
 
         package = self.app_list.get(selection[0])
-        if self.run_command(f"adb shell monkey -p {package} -c android.intent.category.LAUNCHER 1"):
-            self.print_to_console(f"Launched {package}")
+
+        def launch():
+            tools = shell_tools()
+            if tools['am'].startswith('cmd'):
+                # Resolve the launcher activity and start it without monkey's VM
+                command = (f"adb shell \"c=\\$({tools['pm']} resolve-activity --brief"
+                           f" -c android.intent.category.LAUNCHER {package} | tail -n 1);"
+                           f" {tools['am']} start -n \\$c\"")
+            else:
+                command = f"adb shell monkey -p {package} -c android.intent.category.LAUNCHER 1"
+            subprocess.run(command, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+        self.schedule(launch, error=f"Error launching {package}",
+                      done=lambda _: self.print_to_console(f"Launched {package}"))
+
+    def install_apks(self):
+        """Install APKs (splits grouped with their base) on all connected devices"""
+        files = filedialog.askopenfilenames(title="Select APKs", filetypes=[("APK Files", "*.apk")])
+        if files:
+            self._start_install(group_apks(files))
+
+    def _start_install(self, sessions):
+        """Run install sessions on every connected device in the background"""
+        devices = list_devices()
+        if not devices:
+            messagebox.showerror("Error", "No device connected")
+            return
+
+        if len(devices) > 1 and not messagebox.askyesno(
+                "Confirm", f"Install {len(sessions)} app(s) on {len(devices)} devices?"):
+            return
+
+        Thread(target=self._install_worker, args=(sessions, devices), daemon=True).start()
+        self.print_to_console(f"Installing {len(sessions)} app(s) on {len(devices)} device(s)...")
+
+    def _install_worker(self, sessions, devices):
+        """Install every session on every device concurrently and report phase timings"""
+        jobs = [(serial, apks) for serial in devices for apks in sessions]
+        futures = {self.scheduler.submit(install_apk_session, apks, serial, priority=PRIORITY_TRANSFER,
+                                         serial=serial): (serial, apks) for serial, apks in jobs}
+        if futures:
+            for future in as_completed(futures):
+                serial, apks = futures[future]
+                names = ', '.join(os.path.basename(apk) for apk in apks)
+                try:
+                    t = future.result()
+                    rate = t['bytes'] / t['write'] / (1 << 20) if t['write'] else 0
+                    message = (f"Installed {names} on {serial}: create {t['create']:.2f}s, "
+                               f"write {t['write']:.2f}s ({rate:.1f} MB/s), commit {t['commit']:.2f}s, "
+                               f"total {t['total']:.2f}s")
+                    self.root.after(0, self.print_to_console, message)
+                except Exception as e:
+                    self.root.after(0, self.print_to_console, f"Install of {names} on {serial} failed: {e}", True)
+        self.root.after(0, self.refresh_app_list)
 
     def clear_app_data(self):
-        """Clear data for selected app"""
-        selection = self.app_list.curselection()
-        if not selection:
+        """Clear data for selected apps"""
+        packages = self.selected_items(self.app_list)
+        if not packages:
             messagebox.showerror("Error", "No app selected")
             return
 
-        package = self.app_list.get(selection[0])
-        if messagebox.askyesno("Confirm", f"Clear data for {package}?"):
-            if self.run_command(f"adb shell pm clear {package}"):
-                self.print_to_console(f"Cleared data for {package}")
+        target = packages[0] if len(packages) == 1 else f"{len(packages)} apps"
+        if messagebox.askyesno("Confirm", f"Clear data for {target}?"):
+            self.run_bulk_action("Clear data", packages, lambda package: f"pm clear {shlex.quote(package)}")
+
+    def selected_items(self, listbox):
+        """Return the text of every selected listbox entry"""
+        return [listbox.get(index) for index in listbox.curselection()]
+
+    def run_bulk_action(self, label, items, command_for, then=None):
+        """Run one command per item in a single background round trip, then summarize and call then()"""
+        def report(results):
+            failures = [(item, status, output) for item, (status, output) in zip(items, results)
+                        if not bulk_succeeded(status, output)]
+            self.print_to_console(f"{label}: {len(items) - len(failures)} of {len(items)} succeeded")
+            for item, status, output in failures:
+                reason = output.strip() or ("not run" if status is None else f"exit status {status}")
+                self.print_to_console(f"{label} failed for {item}: {reason}", error=True)
+            if len(items) > 1:
+                summary = f"{label}: {len(items) - len(failures)} of {len(items)} succeeded"
+                if failures:
+                    summary += "\n\nFailed:\n" + "\n".join(item for item, _, _ in failures[:20])
+                messagebox.showinfo("Bulk Action", summary)
+            if then:
+                then()
+
+        self.print_to_console(f"{label}: running for {len(items)} item(s)...")
+        return self.schedule(lambda: run_bulk_script([fast_command(command_for(item)) for item in items]),
+                             priority=PRIORITY_INTERACTIVE, error=f"{label} failed", done=report)
 
     def backup_apk(self):
-        """Backup APK of selected app"""
+        """Backup APK of selected app (split APKs go into a folder)"""
         selection = self.app_list.curselection()
         if not selection:
             messagebox.showerror("Error", "No app selected")
@@ -789,8 +4315,83 @@ class ADBHelperGUI:
         )
 
         if filename:
-            if self.run_command(f"adb pull $(adb shell pm path {package} | cut -d: -f2) {filename}"):
-                self.print_to_console(f"Backed up {package} to {filename}")
+            try:
+                paths = get_apk_paths(package)
+            except subprocess.CalledProcessError as e:
+                self.print_to_console(f"Error getting APK paths: {str(e)}", error=True)
+                return
+
+            if len(paths) == 1:
+                if self.run_command(f'adb pull "{paths[0]}" "{filename}"'):
+                    self.print_to_console(f"Backed up {package} to {filename}")
+                return
+
+            directory = os.path.splitext(filename)[0]
+            os.makedirs(directory, exist_ok=True)
+            for path in paths:
+                self.run_command(f'adb pull "{path}" "{directory}"')
+            self.print_to_console(f"Backed up {len(paths)} APKs of {package} to {directory}")
+
+    def apk_store(self):
+        """Return the APK store under the backup location"""
+        return ApkStore(os.path.join(self.backup_path.get() or os.path.expanduser("~/adb_backups"), "apk_store"))
+
+    def backup_apk_to_store(self):
+        """Backup selected app from every connected device into the APK store"""
+        selection = self.app_list.curselection()
+        if not selection:
+            messagebox.showerror("Error", "No app selected")
+            return
+
+        self._start_store_backup([self.app_list.get(selection[0])])
+
+    def backup_all_to_store(self):
+        """Backup all third-party apps of every connected device into the APK store"""
+        self._start_store_backup(None)
+
+    def _start_store_backup(self, packages):
+        devices = list_devices()
+        if not devices:
+            messagebox.showerror("Error", "No device connected")
+            return
+
+        store = self.apk_store()
+        Thread(target=self._store_backup_worker, args=(store, packages, devices), daemon=True).start()
+        self.print_to_console(f"Backing up to {store.root} from {len(devices)} device(s)...")
+
+    def _store_backup_worker(self, store, packages, devices):
+        """Back up packages from every device as transfer jobs, one per device"""
+        futures = [self.scheduler.submit(self._store_backup_device, store, packages, serial,
+                                         priority=PRIORITY_TRANSFER, serial=serial) for serial in devices]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                self.root.after(0, self.print_to_console, f"Store backup failed: {str(e)}", True)
+
+    def _store_backup_device(self, store, packages, serial):
+        """Back up packages from one device, reporting how many APKs actually had to be pulled"""
+        names = packages
+        if names is None:
+            try:
+                output = subprocess.check_output(adb_args(serial) + ['shell', shell_tools(serial)['pm'], 'list', 'packages', '-3'], text=True)
+                names = [line.replace("package:", "").strip() for line in output.splitlines() if line.strip()]
+            except subprocess.CalledProcessError as e:
+                self.root.after(0, self.print_to_console, f"Error listing apps on {serial}: {str(e)}", True)
+                return
+
+        pulled_total = 0
+        for package, manifest, pulled, error in store.backup_packages(names, serial):
+            if error:
+                self.root.after(0, self.print_to_console, f"Backup of {package} on {serial} failed: {error}", True)
+                continue
+            pulled_total += pulled
+            if len(names) == 1:
+                self.root.after(0, self.print_to_console,
+                                f"Backed up {package} {manifest['version_name']} on {serial}: "
+                                f"{len(manifest['apks'])} APK(s), {pulled} pulled")
+        self.root.after(0, self.print_to_console,
+                        f"Store backup of {len(names)} app(s) on {serial} done, {pulled_total} APK(s) pulled")
 
     # Logcat tab methods
     def start_logcat(self):
@@ -800,7 +4401,7 @@ class ADBHelperGUI:
             return
 
         filter_text = self.logcat_filter.get()
-        command = "adb logcat"
+        command = "adb logcat -v threadtime"
         if filter_text:
             command += f" | grep {filter_text}"
 
@@ -812,26 +4413,130 @@ class ADBHelperGUI:
             text=True
         )
 
+        self.logcat_queue = queue.Queue()
         self.logcat_thread = Thread(target=self._read_logcat)
         self.logcat_thread.daemon = True
         self.logcat_thread.start()
+        self.root.after(50, self._update_logcat)
         self.print_to_console("Logcat started")
 
     def _read_logcat(self):
-        """Read logcat output continuously"""
-        while True:
-            line = self.logcat_process.stdout.readline()
-            if not line:
-                break
+        """Read logcat output continuously, matching rules off the UI thread"""
+        engine = self.logcat_rules
+        no_hits = ()
+        for line in self.logcat_process.stdout:
+            self.logcat_queue.put((line, engine.process(line) if engine else no_hits))
+
+    def _update_logcat(self):
+        """Append queued logcat lines to the display in one batch"""
+        items = []
+        try:
+            while len(items) < 20000:
+                items.append(self.logcat_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if items:
+            engine = self.logcat_rules
+            args = []
+            for line, hits in items:
+                args.append(line)
+                args.append(tuple(f"rule{index}" for index in hits
+                                  if engine.rules[index].get('action') == 'highlight') if hits else ())
+                if hits:
+                    for index in hits:
+                        if engine.rules[index].get('action') == 'console':
+                            self.print_to_console(f"[{engine.rules[index].get('name')}] {line.rstrip()}")
+
+            self.logcat_output.configure(state='normal')
+            self.logcat_output.insert(tk.END, *args)
+            lines = int(self.logcat_output.index('end-1c').split('.')[0])
+            if lines > LOGCAT_MAX_LINES:
+                self.logcat_output.delete(1.0, f"{lines - LOGCAT_MAX_LINES}.0")
+            self.logcat_output.see(tk.END)
+            self.logcat_output.configure(state='disabled')
+            if engine:
+                self.logcat_rule_label.config(text=f"{sum(engine.counts.values())} rule matches")
+
+        if self.logcat_thread.is_alive() or not self.logcat_queue.empty():
+            self.root.after(50, self._update_logcat)
+
+    def load_logcat_rules(self):
+        """Load logcat rules from a JSON file.
+
+        The file holds a list of objects such as
+        {"name": "crash", "type": "substring", "pattern": "FATAL EXCEPTION",
+         "action": "highlight", "color": "red"}; types are substring, regex,
+        tag, level and pid, actions are highlight, console and count.
+        """
+        filename = filedialog.askopenfilename(title="Select Logcat Rules", filetypes=[("JSON Files", "*.json")])
+        if not filename:
+            return
 
-            self.root.after(0, self._update_logcat, line)
+        try:
+            with open(filename) as f:
+                engine = LogcatRuleEngine(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.print_to_console(f"Error loading logcat rules: {str(e)}", error=True)
+            return
 
-    def _update_logcat(self, line):
-        """Update logcat display"""
-        self.logcat_output.configure(state='normal')
-        self.logcat_output.insert(tk.END, line)
-        self.logcat_output.see(tk.END)
-        self.logcat_output.configure(state='disabled')
+        for index, rule in enumerate(engine.rules):
+            if rule.get('action') == 'highlight':
+                self.logcat_output.tag_config(f"rule{index}", background=rule.get('color', 'yellow'),
+                                              foreground='black')
+        self.logcat_rules = engine
+        self.logcat_rule_label.config(text=f"{len(engine.rules)} rules loaded")
+        self.print_to_console(f"Loaded {len(engine.rules)} logcat rules (applied when logcat starts)")
+
+    def show_logcat_rule_stats(self):
+        """Show match counts per logcat rule"""
+        if not self.logcat_rules:
+            messagebox.showinfo("Info", "No logcat rules loaded")
+            return
+
+        stats = "\n".join(f"{name}: {count}" for name, count in self.logcat_rules.summary())
+        self.print_to_console("Logcat rule matches:\n" + stats)
+
+    def toggle_crash_collector(self):
+        """Start following the crash buffers, or stop and write the report"""
+        collector = self.crash_collector
+        if collector and collector.running():
+            collector.stop()
+            collector.finish()
+            self.crash_button.config(text="Collect Crashes")
+            self.print_to_console(f"Crash report written to {collector.write_report()}")
+            return
+
+        report_dir = os.path.join(CACHE_DIR, "crashes", datetime.now().strftime("%Y%m%d_%H%M%S"))
+        self.crash_collector = CrashCollector(report_dir)
+        self.crash_collector.on_group = lambda group: self.root.after(0, self._on_crash, group)
+        try:
+            self.crash_collector.start()
+        except OSError as e:
+            self.print_to_console(f"Error starting crash collector: {str(e)}", error=True)
+            return
+        self.crash_button.config(text="Stop Collecting")
+        self.crash_label.config(text="Watching for crashes")
+        self.print_to_console(f"Collecting crashes into {report_dir}")
+
+    def _on_crash(self, group):
+        with self.crash_collector.lock:
+            counts = [g['count'] for g in self.crash_collector.groups.values()]
+        self.crash_label.config(text=f"{sum(counts)} crashes in {len(counts)} groups")
+        if group['count'] == 1:
+            self.print_to_console(f"New {group['kind']} crash in {group['package']}: {group['signature']}",
+                                  error=True)
+
+    def show_crash_report(self):
+        """Print the crash groups collected so far"""
+        collector = self.crash_collector
+        if not collector or not collector.groups:
+            messagebox.showinfo("Info", "No crashes collected")
+            return
+
+        path = collector.write_report()
+        with open(path) as f:
+            self.print_to_console(f"Crash report ({path}):\n{f.read()}")
 
     def stop_logcat(self):
         """Stop logcat process"""
@@ -875,6 +4580,57 @@ class ADBHelperGUI:
             if self.run_command(f"adb exec-out screencap -p > {filename}"):
                 self.print_to_console(f"Screenshot saved to {filename}")
 
+    def compare_screenshots(self):
+        """Diff every screenshot in a candidate folder against the same name in a baseline folder"""
+        baseline_dir = filedialog.askdirectory(title="Select Baseline Screenshots")
+        if not baseline_dir:
+            return
+        candidate_dir = filedialog.askdirectory(title="Select Candidate Screenshots")
+        if not candidate_dir:
+            return
+
+        names = sorted(name for name in os.listdir(candidate_dir)
+                       if name.lower().endswith(('.png', '.jpg', '.jpeg', '.webp'))
+                       and os.path.isfile(os.path.join(baseline_dir, name)))
+        if not names:
+            messagebox.showerror("Error", "No screenshots with matching names found")
+            return
+
+        masks_text = simpledialog.askstring("Masks", "Regions to ignore as x0,y0,x1,y1 separated by ';' (optional):",
+                                            parent=self.root)
+        try:
+            masks = [tuple(int(value) for value in box.split(',')) for box in (masks_text or '').split(';') if box.strip()]
+        except ValueError:
+            messagebox.showerror("Error", "Invalid mask regions")
+            return
+
+        pairs = [(os.path.join(baseline_dir, name), os.path.join(candidate_dir, name)) for name in names]
+        diff_dir = os.path.join(candidate_dir, "diffs")
+
+        def worker():
+            started = perf_counter()
+            try:
+                results = compare_screenshot_pairs(pairs, masks, diff_dir=diff_dir)
+            except Exception as e:
+                self.root.after(0, self.print_to_console, f"Screenshot comparison failed: {str(e)}", True)
+                return
+            with open(os.path.join(diff_dir, "report.json"), 'w') as f:
+                json.dump(results, f, indent=1)
+            self.root.after(0, self._report_screenshot_diffs, results, perf_counter() - started, diff_dir)
+
+        self.print_to_console(f"Comparing {len(pairs)} screenshot pairs...")
+        Thread(target=worker, daemon=True).start()
+
+    def _report_screenshot_diffs(self, results, seconds, diff_dir):
+        errors = [result for result in results if 'error' in result]
+        changed = [result for result in results if 'error' not in result and result['boxes']]
+        lines = [f"{os.path.basename(result['candidate'])}: {result['changed_ratio'] * 100:.2f}% pixels, "
+                 f"perceptual {result['perceptual']:.4f}, {len(result['boxes'])} region(s)"
+                 for result in sorted(changed, key=lambda result: -result['perceptual'])]
+        lines += [f"{os.path.basename(result['candidate'])}: {result['error']}" for result in errors]
+        self.print_to_console(f"Compared {len(results)} pairs in {seconds:.1f}s: {len(changed)} changed, "
+                              f"{len(errors)} failed; diffs in {diff_dir}\n" + "\n".join(lines))
+
     def record_screen(self):
         """Record device screen"""
         filename = filedialog.asksaveasfilename(
@@ -902,11 +4658,146 @@ class ADBHelperGUI:
 
     def get_battery_info(self):
         """Get battery information"""
+        self.open_dumpsys(['battery'], "battery")
+
+    def open_dumpsys(self, args, name, outline_widget=None):
+        """Fetch dumpsys output into the cache in the background and open the section viewer"""
+        def worker():
+            try:
+                path, index = dumpsys_to_cache(args, name)
+                self.root.after(0, self._show_dumpsys, path, index, name, outline_widget)
+            except (subprocess.CalledProcessError, OSError) as e:
+                self.root.after(0, self.print_to_console, f"Error getting dumpsys {' '.join(args)}: {str(e)}", True)
+
+        self.print_to_console(f"Fetching dumpsys {' '.join(args)}...")
+        self.scheduler.submit(worker, key=('dumpsys',) + tuple(args))
+
+    def _show_dumpsys(self, path, index, name, outline_widget):
+        """Show the section outline in a widget, if any, and open the viewer"""
+        if outline_widget is not None:
+            outline = "".join(f"{child['title']} ({(child['end'] - child['start']) >> 10} KB)\n"
+                              for child in index['children'])
+            outline_widget.configure(state='normal')
+            outline_widget.delete(1.0, tk.END)
+            outline_widget.insert(tk.END, outline or read_dumpsys_section(path, index, 1 << 16))
+            outline_widget.configure(state='disabled')
+        self.print_to_console(f"dumpsys {name}: {index['end'] >> 10} KB cached in {path}")
+        self.show_dumpsys_viewer(path, index, name)
+
+    def show_dumpsys_viewer(self, path, index, title, max_section=2 << 20):
+        """Tree viewer that loads only the sections being looked at"""
+        window = tk.Toplevel(self.root)
+        window.title(f"dumpsys {title}")
+        window.geometry("1000x600")
+        tree = ttk.Treeview(window, show='tree')
+        tree.pack(side=tk.LEFT, fill=tk.Y)
+        text = scrolledtext.ScrolledText(window)
+        text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        nodes = {}
+        f = open(path, 'rb')
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if index['end'] else b''
+
+        def add_children(parent_id, node):
+            for child in node['children']:
+                item = tree.insert(parent_id, tk.END, text=child['title'])
+                nodes[item] = child
+                if child['children']:
+                    tree.insert(item, tk.END, text='...')
+
+        def on_open(event):
+            item = tree.focus()
+            children = tree.get_children(item)
+            if len(children) == 1 and children[0] not in nodes:
+                tree.delete(children[0])
+                add_children(item, nodes[item])
+
+        def on_select(event):
+            node = nodes.get(tree.focus())
+            if node:
+                end = min(node['end'], node['start'] + max_section)
+                content = data[node['start']:end].decode(errors='replace')
+                if end < node['end']:
+                    content += f"\n... {(node['end'] - end) >> 10} KB more, expand sub-sections to see them"
+                text.delete(1.0, tk.END)
+                text.insert(tk.END, content)
+
+        def on_close():
+            if index['end']:
+                data.close()
+            f.close()
+            window.destroy()
+
+        add_children('', index)
+        if not index['children'] and index['end']:
+            text.insert(tk.END, data[:max_section].decode(errors='replace'))
+        tree.bind('<<TreeviewOpen>>', on_open)
+        tree.bind('<<TreeviewSelect>>', on_select)
+        window.protocol("WM_DELETE_WINDOW", on_close)
+
+    def toggle_trace(self):
+        """Start streaming an atrace session to the host, or stop it and show the summary"""
+        capture = self.trace_capture
+        if capture and capture.running():
+            self.trace_button.config(text="Stopping...", state='disabled')
+            Thread(target=capture.stop, daemon=True).start()
+            return
+
+        categories = self.trace_categories.get().strip() or ATRACE_CATEGORIES
+        directory = os.path.join(CACHE_DIR, "traces")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"trace-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt")
         try:
-            info = subprocess.check_output("adb shell dumpsys battery", shell=True, text=True)
-            self.print_to_console("Battery info:\n" + info)
-        except subprocess.CalledProcessError as e:
-            self.print_to_console(f"Error getting battery info: {str(e)}", error=True)
+            self.trace_capture = TraceCapture(path, categories).start()
+        except OSError as e:
+            self.print_to_console(f"Error starting trace: {str(e)}", error=True)
+            return
+        self.trace_button.config(text="Stop Trace")
+        self.print_to_console(f"Tracing {categories} to {path}")
+        self.root.after(500, self._update_trace)
+
+    def _update_trace(self):
+        capture = self.trace_capture
+        summary = capture.summary
+        duration = (summary.last - summary.first) if summary.first is not None else 0.0
+        self.trace_label.config(text=f"{capture.bytes >> 20} MB, {summary.lines} lines, {duration:.1f} s of trace")
+        if capture.running() or capture.thread.is_alive():
+            self.root.after(500, self._update_trace)
+            return
+
+        self.trace_button.config(text="Start Trace", state='normal')
+        if not summary.lines:
+            self.print_to_console("Trace produced no output (atrace missing or not permitted?)", error=True)
+            return
+        self._show_trace_summary(capture.path, summary)
+
+    def summarize_trace_file(self):
+        """Summarize a saved ftrace text file in the background"""
+        filename = filedialog.askopenfilename(title="Select Trace", filetypes=[("Trace Files", "*.txt *.trace"), ("All Files", "*")])
+        if not filename:
+            return
+
+        def worker():
+            summary = FtraceSummary()
+            try:
+                with open(filename, 'rb') as f:
+                    for line in f:
+                        summary.feed(line)
+            except OSError as e:
+                self.root.after(0, self.print_to_console, f"Error reading trace: {str(e)}", True)
+                return
+            self.root.after(0, self._show_trace_summary, filename, summary)
+        self.print_to_console(f"Summarizing {filename}...")
+        Thread(target=worker, daemon=True).start()
+
+    def _show_trace_summary(self, path, summary):
+        report = summary.report()
+        try:
+            with open(os.path.splitext(path)[0] + ".summary.txt", 'w') as f:
+                f.write(report + "\n")
+        except OSError as e:
+            self.print_to_console(f"Error saving trace summary: {str(e)}", error=True)
+        self.print_to_console(f"Trace summary for {path}:\n{report}")
 
     def get_cpu_info(self):
         """Get CPU information"""
@@ -941,17 +4832,129 @@ class ADBHelperGUI:
                 if self.run_command(f"adb restore {filename}"):
                     self.print_to_console(f"Restoring backup: {filename}")
 
+    def _ask_ab_file(self):
+        return filedialog.askopenfilename(title="Select Backup File", filetypes=[("Android Backup", "*.ab")])
+
+    def _run_ab_task(self, description, task):
+        """Run an .ab operation in the background and report its result"""
+        def worker():
+            try:
+                message = task()
+                self.root.after(0, self.print_to_console, message)
+            except Exception as e:
+                self.root.after(0, self.print_to_console, f"Error {description}: {str(e)}", True)
+
+        self.print_to_console(f"{description.capitalize()}...")
+        Thread(target=worker, daemon=True).start()
+
+    def inspect_ab(self):
+        """List the contents of a backup file"""
+        filename = self._ask_ab_file()
+        if not filename:
+            return
+
+        window = tk.Toplevel(self.root)
+        window.title(f"Contents of {os.path.basename(filename)}")
+        text = scrolledtext.ScrolledText(window, width=100, height=30)
+        text.pack(fill=tk.BOTH, expand=True)
+
+        def task():
+            packages = {}
+            lines = []
+            for name, size in ab_list(filename):
+                package = ab_package_of(name) or '(other)'
+                count, total = packages.get(package, (0, 0))
+                packages[package] = (count + 1, total + size)
+                lines.append(f"{size:>12}  {name}\n")
+                if len(lines) >= 500:
+                    self.root.after(0, text.insert, tk.END, ''.join(lines))
+                    lines = []
+            summary = ''.join(f"{package}: {count} entries, {total >> 10} KB\n"
+                              for package, (count, total) in sorted(packages.items()))
+            self.root.after(0, text.insert, tk.END, ''.join(lines) + "\nSummary:\n" + summary)
+            return f"Inspected {filename}: {len(packages)} package(s)"
+
+        self._run_ab_task("inspecting backup", task)
+
+    def extract_ab_app(self):
+        """Extract one app's data directory from a backup file"""
+        filename = self._ask_ab_file()
+        if not filename:
+            return
+
+        package = simpledialog.askstring("Extract App Data", "Package to extract:")
+        if not package:
+            return
+
+        destination = filedialog.askdirectory(title="Extract to")
+        if destination:
+            self._run_ab_task(f"extracting {package}", lambda: (
+                f"Extracted {ab_extract_package(filename, package, destination)} entries of {package} to {destination}"))
+
+    def convert_ab_to_tar(self):
+        """Convert a backup file into a plain tar archive"""
+        filename = self._ask_ab_file()
+        if not filename:
+            return
+
+        tar_path = filedialog.asksaveasfilename(title="Save as tar", defaultextension=".tar",
+                                                filetypes=[("Tar Archives", "*.tar")])
+        if tar_path:
+            self._run_ab_task("converting backup", lambda: (
+                f"Converted {filename} to {tar_path} ({ab_to_tar(filename, tar_path) >> 10} KB)"))
+
+    def verify_ab(self):
+        """Verify the integrity of a backup file"""
+        filename = self._ask_ab_file()
+        if not filename:
+            return
+
+        def task():
+            entries, total, packages = ab_verify(filename)
+            return f"{filename} is intact: {entries} entries, {total >> 10} KB, packages: {', '.join(packages)}"
+
+        self._run_ab_task("verifying backup", task)
+
     def backup_partition(self, partition):
         """Backup device partition"""
+        compress = self.image_compress.get()
         filename = filedialog.asksaveasfilename(
             title=f"Save {partition.capitalize()} Backup",
-            defaultextension=".img",
-            filetypes=[("Image Files", "*.img")]
+            defaultextension=".img.gz" if compress else ".img",
+            filetypes=[("Compressed Images", "*.img.gz")] if compress else [("Image Files", "*.img")]
         )
 
         if filename:
-            if self.run_command(f"adb shell su -c dd if=/dev/block/bootdevice/by-name/{partition} | adb shell cat > {filename}"):
-                self.print_to_console(f"{partition.capitalize()} backup saved to {filename}")
+            if os.path.exists(filename + '.progress'):
+                self.print_to_console(f"Resuming interrupted backup of {partition}")
+            self.scheduler.submit(self._image_worker, partition, filename, compress, self.image_verify.get(),
+                                  priority=PRIORITY_TRANSFER)
+
+    def _image_worker(self, partition, filename, compress, verify):
+        """Image a partition in the background"""
+        def progress(done, total, rate):
+            if perf_counter() - last_update[0] > 0.2 or done == total:
+                last_update[0] = perf_counter()
+                self.root.after(0, self._update_image_progress, done, total, rate)
+
+        last_update = [0.0]
+        try:
+            digest = image_partition(partition, filename, compress=compress, progress=progress)
+            self.root.after(0, self.print_to_console, f"{partition.capitalize()} backup saved to {filename} (sha256 {digest})")
+            if verify:
+                device_digest = device_partition_hash(partition)
+                if device_digest == digest:
+                    self.root.after(0, self.print_to_console, f"{partition.capitalize()} image verified")
+                else:
+                    self.root.after(0, self.print_to_console,
+                                    f"{partition.capitalize()} image checksum mismatch: device {device_digest}", True)
+        except Exception as e:
+            self.root.after(0, self.print_to_console, f"Error backing up {partition}: {str(e)}", True)
+
+    def _update_image_progress(self, done, total, rate):
+        """Update partition imaging progress display"""
+        self.image_progress['value'] = done * 100 / total if total else 0
+        self.image_status.config(text=f"{done >> 20} / {total >> 20} MB at {rate / (1 << 20):.1f} MB/s")
 
     # Settings tab methods
     def toggle_theme(self):
@@ -960,6 +4963,25 @@ class ADBHelperGUI:
         self.set_theme()
         self.print_to_console(f"Theme changed to {'dark' if self.dark_mode else 'light'}")
 
+    def set_adb_server(self):
+        """Point all adb calls at another ADB server"""
+        address = self.adb_server_entry.get().strip()
+        if not address:
+            os.environ.pop('ADB_SERVER_SOCKET', None)
+            self.device_tracker.restart()
+            self.print_to_console("Using the default ADB server")
+            return
+
+        host, _, port = address.rpartition(':')
+        if not port.isdigit():
+            messagebox.showerror("Error", "Server must be given as host:port")
+            return
+
+        os.environ['ADB_SERVER_SOCKET'] = f"tcp:{host or 'localhost'}:{port}"
+        self.device_tracker.restart()
+        self.print_to_console(f"Using ADB server {os.environ['ADB_SERVER_SOCKET']}")
+        self.update_device_info()
+
     def show_about(self):
         """Show about dialog"""
         messagebox.showinfo("About", "ADB Helper v2.0\n\nA made by mleko|avisdada")
@@ -979,21 +5001,23 @@ class ADBHelperGUI:
             self.print_to_console(f"Added {len(files)} files to batch")
 
     def execute_batch(self):
-        """Execute batch operations"""
+        """Queue the batch operations as transfers; returns their futures"""
         if not self.batch_operations:
             messagebox.showwarning("Warning", "No operations in batch")
-            return
+            return []
 
-        for operation in self.batch_operations:
-            op_type, src, dst = operation
-            if op_type == 'push':
-                self.run_command(f'adb push "{src}" "{dst}"')
-            elif op_type == 'pull':
-                self.run_command(f'adb pull "{src}" "{dst}"')
+        futures = []
+        for op_type, src, dst in self.batch_operations:
+            if op_type in ('push', 'pull'):
+                futures.append(self.schedule(transfer_file, op_type, src, dst, priority=PRIORITY_TRANSFER,
+                              error=f"Error in batch {op_type} of {src}",
+                              done=lambda result, verb=op_type.title() + "ed", src=src, dst=dst:
+                              self._report_transfer(verb, src, dst, result)))
 
-        self.print_to_console(f"Executed {len(self.batch_operations)} batch operations")
+        self.print_to_console(f"Queued {len(self.batch_operations)} batch operations")
         self.batch_operations.clear()
         self.batch_listbox.delete(0, tk.END)
+        return futures
 
     def clear_batch(self):
         """Clear batch operations list"""
@@ -1061,63 +5085,170 @@ class ADBHelperGUI:
 
         if filename:
             package = os.path.basename(filename).replace('.ab', '')
+            try:
+                with open(filename, 'rb') as f:
+                    _, member = next(ab_members(AndroidBackupReader(f)))
+                package = ab_package_of(member.name) or package
+            except (ValueError, StopIteration, OSError, tarfile.TarError, zlib.error) as e:
+                self.print_to_console(f"Could not read package from backup: {str(e)}", error=True)
             if messagebox.askyesno("Confirm", f"Restore {package} from backup?"):
                 self.run_command(f"adb restore {filename}")
                 self.print_to_console(f"Restoring {package} from backup")
 
     def prepare_migration(self):
-        """Prepare app migration"""
+        """Pull the base and split APKs of the selected app for installation elsewhere"""
         selection = self.app_list.curselection()
         if not selection:
             messagebox.showerror("Error", "No app selected")
             return
 
         package = self.app_list.get(selection[0])
-        filename = filedialog.asksaveasfilename(
-            title=f"Prepare migration for {package}",
-            defaultextension=".apk",
-            filetypes=[("APK Files", "*.apk")]
-        )
+        directory = filedialog.askdirectory(title=f"Save APKs of {package}")
+        if not directory:
+            return
 
-        if filename:
-            self.run_command(f"adb shell pm install-create -r -t -S {os.path.getsize(filename)}")
-            self.print_to_console(f"Prepared migration for {package}")
+        try:
+            paths = get_apk_paths(package)
+        except subprocess.CalledProcessError as e:
+            self.print_to_console(f"Error getting APK paths: {str(e)}", error=True)
+            return
+
+        target = os.path.join(directory, package)
+        os.makedirs(target, exist_ok=True)
+        for path in paths:
+            self.run_command(f'adb pull "{path}" "{target}"')
+        self.print_to_console(f"Prepared migration for {package}: {len(paths)} APK(s) in {target}")
 
     def complete_migration(self):
-        """Complete app migration"""
-        selection = self.app_list.curselection()
-        if not selection:
-            messagebox.showerror("Error", "No app selected")
+        """Install APKs saved by Prepare Migration on the connected devices"""
+        directory = filedialog.askdirectory(title="Select folder with migrated APKs")
+        if not directory:
             return
 
-        package = self.app_list.get(selection[0])
-        self.run_command(f"adb shell pm install-commit {package}")
-        self.print_to_console(f"Completed migration for {package}")
+        apks = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.apk'))
+        if not apks:
+            messagebox.showerror("Error", "No APK files in the selected folder")
+            return
+
+        self._start_install([apks])
 
     def disable_app(self):
-        """Disable selected app"""
-        selection = self.app_list.curselection()
-        if selection:
-            package = self.app_list.get(selection[0])
-            self.run_command(f"adb shell pm disable-user --user 0 {package}")
-            self.print_to_console(f"Disabled app: {package}")
+        """Disable selected apps"""
+        packages = self.selected_items(self.app_list)
+        if packages:
+            self.run_bulk_action("Disable", packages,
+                                 lambda package: f"pm disable-user --user 0 {shlex.quote(package)}")
 
     def enable_app(self):
-        """Enable selected app"""
-        selection = self.app_list.curselection()
-        if selection:
-            package = self.app_list.get(selection[0])
-            self.run_command(f"adb shell pm enable {package}")
-            self.print_to_console(f"Enabled app: {package}")
+        """Enable selected apps"""
+        packages = self.selected_items(self.app_list)
+        if packages:
+            self.run_bulk_action("Enable", packages, lambda package: f"pm enable {shlex.quote(package)}")
 
     def force_dark_mode(self):
         """Force dark mode for app"""
         selection = self.app_list.curselection()
         if selection:
             package = self.app_list.get(selection[0])
-            self.run_command(f"adb shell cmd uimode night yes")
-            self.run_command(f"adb shell settings put secure ui_night_mode 2")
-            self.print_to_console(f"Forced dark mode for: {package}")
+
+            def report(results):
+                if all(bulk_succeeded(status, output) for status, output in results):
+                    self.print_to_console(f"Forced dark mode for: {package}")
+                else:
+                    errors = "; ".join(output.strip() or f"exit status {status}" for status, output in results)
+                    self.print_to_console(f"Error forcing dark mode: {errors}", error=True)
+
+            self.schedule(lambda: run_bulk_script(["cmd uimode night yes",
+                                                   fast_command("settings put secure ui_night_mode 2")]),
+                          priority=PRIORITY_INTERACTIVE, error="Error forcing dark mode", done=report)
+
+    def save_settings_profile(self):
+        """Save the system/secure/global settings of the device as a JSON profile"""
+        filename = filedialog.asksaveasfilename(title="Save Settings Profile", defaultextension=".json",
+                                                filetypes=[("Settings Profiles", "*.json")])
+        if not filename:
+            return
+
+        def saved(snapshot):
+            try:
+                with open(filename, 'w') as f:
+                    json.dump(snapshot, f, indent=1, sort_keys=True)
+            except OSError as e:
+                self.print_to_console(f"Error saving settings profile: {str(e)}", error=True)
+                return
+            count = sum(len(snapshot[namespace]) for namespace in SETTINGS_NAMESPACES)
+            self.print_to_console(f"Saved {count} settings to {filename}")
+        self.schedule(snapshot_settings, error="Error reading settings", done=saved)
+
+    def _load_settings_profile(self, filename):
+        try:
+            with open(filename) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            self.print_to_console(f"Error loading settings profile: {str(e)}", error=True)
+            return None
+
+    def diff_device_settings(self):
+        """Compare the device's settings with a saved profile or another connected device"""
+        devices = list_devices()
+        if not devices:
+            messagebox.showerror("Error", "No devices connected")
+            return
+        serial, other = devices[0], None
+        if len(devices) > 1:
+            # With several devices attached every snapshot needs an explicit serial
+            serial = simpledialog.askstring("Diff Settings", "Device to inspect:\n" + "\n".join(devices),
+                                            initialvalue=devices[0])
+            if not serial:
+                return
+            other = simpledialog.askstring("Diff Settings", "Compare with device (serial), or leave empty to pick a profile:",
+                                           initialvalue=next(device for device in devices if device != serial))
+            for name in (serial, other):
+                if name and name not in devices:
+                    messagebox.showerror("Error", f"Device {name} is not connected")
+                    return
+        profile = None
+        if not other:
+            filename = filedialog.askopenfilename(title="Select Settings Profile", filetypes=[("Settings Profiles", "*.json")])
+            profile = filename and self._load_settings_profile(filename)
+            if not profile:
+                return
+        source = other or os.path.basename(filename)
+
+        def compare():
+            return diff_settings(snapshot_settings(serial), profile or snapshot_settings(other))
+
+        def report(changes):
+            for namespace, key, have, want in changes:
+                self.print_to_console(f"  {namespace} {key}: {have if have is not None else '(unset)'} -> {want}")
+            self.print_to_console(f"{len(changes)} setting(s) on {serial} differ from {source}")
+        self.schedule(compare, serial=serial, error="Error comparing settings", done=report)
+
+    def apply_settings_profile(self):
+        """Apply a saved settings profile to every connected device at once"""
+        filename = filedialog.askopenfilename(title="Select Settings Profile", filetypes=[("Settings Profiles", "*.json")])
+        profile = filename and self._load_settings_profile(filename)
+        if not profile:
+            return
+        devices = list_devices()
+        if not devices:
+            messagebox.showerror("Error", "No devices connected")
+            return
+        if not messagebox.askyesno("Confirm", f"Apply {os.path.basename(filename)} to {len(devices)} device(s)?\n\n"
+                                              + "\n".join(devices[:20]) + ("\n..." if len(devices) > 20 else "")):
+            return
+
+        def report(results):
+            for serial, result in sorted(results.items()):
+                if isinstance(result, str):
+                    self.print_to_console(f"Settings on {serial} failed: {result}", error=True)
+                    continue
+                changes, failures = result
+                self.print_to_console(f"{serial}: {len(changes) - len(failures)} of {len(changes)} setting(s) changed")
+                for namespace, key, error in failures:
+                    self.print_to_console(f"{serial}: {namespace} {key} failed: {error}", error=True)
+        self.print_to_console(f"Applying {os.path.basename(filename)} to {len(devices)} device(s)")
+        Thread(target=lambda: self.root.after(0, report, apply_settings_profile(profile, devices)), daemon=True).start()
 
     def check_battery_optimization(self):
         """Check battery optimization for app"""
@@ -1148,33 +5279,40 @@ class ADBHelperGUI:
         self.resource_monitor_thread.start()
         self.print_to_console("Started resource monitoring")
 
+    def _poll_resources(self):
+        """Read CPU, memory and battery figures for the resource labels"""
+        # CPU usage
+        cpu = subprocess.check_output(
+            "adb shell top -bn1 | grep -m1 -o '[0-9.]*%'",
+            shell=True, text=True
+        ).strip()
+
+        # Memory usage
+        mem = subprocess.check_output(
+            "adb shell cat /proc/meminfo | grep -E 'MemTotal|MemFree'",
+            shell=True, text=True
+        )
+        total = int(mem.split('\n')[0].split()[1]) // 1024
+        free = int(mem.split('\n')[1].split()[1]) // 1024
+        used = total - free
+
+        # Battery level
+        battery = subprocess.check_output(
+            "adb shell dumpsys battery | grep level",
+            shell=True, text=True
+        ).split(':')[1].strip()
+        return cpu, f"{used} MB / {total} MB", f"{battery}%"
+
     def _monitor_resources(self):
         """Internal method for monitoring resources"""
         while self.process_monitor_running:
             try:
-                # CPU usage
-                cpu = subprocess.check_output(
-                    "adb shell top -bn1 | grep -m1 -o '[0-9.]*%'",
-                    shell=True, text=True
-                ).strip()
-
-                # Memory usage
-                mem = subprocess.check_output(
-                    "adb shell cat /proc/meminfo | grep -E 'MemTotal|MemFree'",
-                    shell=True, text=True
-                )
-                total = int(mem.split('\n')[0].split()[1]) // 1024
-                free = int(mem.split('\n')[1].split()[1]) // 1024
-                used = total - free
-
-                # Battery level
-                battery = subprocess.check_output(
-                    "adb shell dumpsys battery | grep level",
-                    shell=True, text=True
-                ).split(':')[1].strip()
+                # Background priority: waits while interactive work is queued for the device
+                labels = self.scheduler.submit(self._poll_resources, priority=PRIORITY_BACKGROUND,
+                                               key='resources').result()
 
                 # Update UI
-                self.root.after(0, self._update_resource_labels, cpu, f"{used} MB / {total} MB", f"{battery}%")
+                self.root.after(0, self._update_resource_labels, *labels)
 
                 # Refresh processes every 5 updates
                 if int(datetime.now().timestamp()) % 5 == 0:
@@ -1182,7 +5320,7 @@ class ADBHelperGUI:
 
                 sleep(1)
             except Exception as e:
-                self.print_to_console(f"Monitoring error: {str(e)}", error=True)
+                self.root.after(0, self.print_to_console, f"Monitoring error: {str(e)}", True)
                 sleep(5)
 
     def _update_resource_labels(self, cpu, mem, battery):
@@ -1213,30 +5351,203 @@ class ADBHelperGUI:
         except Exception as e:
             self.print_to_console(f"Error refreshing processes: {str(e)}", error=True)
 
+    def refresh_memory(self):
+        """Sample per-process memory once in the background"""
+        Thread(target=self._sample_memory, daemon=True).start()
+
+    def _sample_memory(self, priority=PRIORITY_INTERACTIVE):
+        try:
+            processes = self.scheduler.submit(sample_process_memory, priority=priority, key='meminfo').result()
+        except Exception as e:
+            self.root.after(0, self.print_to_console, f"Error reading process memory: {str(e)}", True)
+            return
+        self.root.after(0, self._show_memory, processes)
+
+    def toggle_memory_tracking(self):
+        """Start or stop periodic memory sampling"""
+        self.memory_tracking_running = self.memory_tracking.get()
+        if self.memory_tracking_running:
+            if not (self.memory_tracking_thread and self.memory_tracking_thread.is_alive()):
+                self.memory_tracking_thread = Thread(target=self._track_memory, daemon=True)
+                self.memory_tracking_thread.start()
+            self.print_to_console("Started memory sampling")
+        else:
+            self.print_to_console("Stopped memory sampling")
+
+    def _track_memory(self):
+        while self.memory_tracking_running:
+            self._sample_memory(PRIORITY_BACKGROUND)
+            for _ in range(100):
+                if not self.memory_tracking_running:
+                    break
+                sleep(0.1)
+
+    def _show_memory(self, processes):
+        """Record a memory sample and redraw the table"""
+        self.memory_history.add(processes)
+        self.memory_processes = processes
+        self._fill_memory_tree()
+        known = sum(1 for info in processes.values() if info['pss'] is not None)
+        total = sum(info['pss'] or 0 for info in processes.values()) // 1024
+        self.memory_status.config(text=f"{len(processes)} processes, {known} with PSS, "
+                                       f"total PSS {total} MB, sampled {datetime.now().strftime('%H:%M:%S')}")
+
+    def _fill_memory_tree(self):
+        column, descending = self.memory_sort
+        rows = []
+        for pid, info in self.memory_processes.items():
+            trend = self.memory_history.trend(pid, info['name'])
+            rows.append({'pid': pid, 'name': info['name'], 'pss': info['pss'], 'rss': info['rss'],
+                         'swap': info['swap'], 'trend': trend})
+        missing = [row for row in rows if row[column] is None]
+        rows = sorted((row for row in rows if row[column] is not None),
+                      key=lambda row: row[column], reverse=descending) + missing
+
+        selected = {int(self.memory_tree.set(item, 'pid')) for item in self.memory_tree.selection()}
+        self.memory_tree.delete(*self.memory_tree.get_children())
+        for row in rows:
+            values = ['' if row[c] is None else f"{row[c]:+.0f}" if c == 'trend' else row[c]
+                      for c in ('pid', 'name', 'pss', 'rss', 'swap', 'trend')]
+            self.memory_tree.insert('', tk.END, iid=str(row['pid']), values=values)
+        self.memory_syncing = True
+        self.memory_tree.selection_set([str(pid) for pid in selected if self.memory_tree.exists(str(pid))])
+        self.root.after_idle(setattr, self, 'memory_syncing', False)
+
+    def sort_memory(self, column):
+        """Sort the memory table by a column, toggling direction on repeat"""
+        current, descending = self.memory_sort
+        self.memory_sort = (column, not descending if column == current else column not in ('pid', 'name'))
+        self._fill_memory_tree()
+
+    def _select_process_rows(self, event):
+        """Mirror the memory table selection in the process list so Kill Process applies to it"""
+        if self.memory_syncing:
+            return
+        pids = set(self.memory_tree.selection())
+        self.process_listbox.selection_clear(0, tk.END)
+        for index, line in enumerate(self.process_listbox.get(0, tk.END)):
+            fields = line.split()
+            if fields and fields[0] in pids:
+                self.process_listbox.selection_set(index)
+                self.process_listbox.see(index)
+
+    def _select_memory_rows(self, event):
+        """Mirror the process list selection in the memory table"""
+        pids = [line.split()[0] for line in self.selected_items(self.process_listbox) if line.split()]
+        rows = [pid for pid in pids if self.memory_tree.exists(pid)]
+        self.memory_syncing = True
+        self.memory_tree.selection_set(rows)
+        if rows:
+            self.memory_tree.see(rows[0])
+        self.root.after_idle(setattr, self, 'memory_syncing', False)
+
+    def refresh_network(self):
+        """Sample per-app network counters once in the background"""
+        Thread(target=self._sample_network, daemon=True).start()
+
+    def _sample_network(self, priority=PRIORITY_INTERACTIVE):
+        try:
+            rows = self.scheduler.submit(self.network_monitor.sample, priority=priority, key='netstats').result()
+        except Exception as e:
+            self.root.after(0, self.print_to_console, f"Error reading network usage: {str(e)}", True)
+            return
+        self.root.after(0, self._show_network, rows)
+
+    def toggle_network_tracking(self):
+        """Start or stop periodic network sampling"""
+        self.network_tracking_running = self.network_tracking.get()
+        if self.network_tracking_running:
+            if not (self.network_tracking_thread and self.network_tracking_thread.is_alive()):
+                self.network_tracking_thread = Thread(target=self._track_network, daemon=True)
+                self.network_tracking_thread.start()
+            self.print_to_console("Started network sampling")
+        else:
+            self.print_to_console("Stopped network sampling")
+
+    def _track_network(self):
+        while self.network_tracking_running:
+            self._sample_network(PRIORITY_BACKGROUND)
+            for _ in range(50):
+                if not self.network_tracking_running:
+                    break
+                sleep(0.1)
+
+    def _show_network(self, rows):
+        """Redraw the network table, busiest apps first"""
+        self.network_tree.delete(*self.network_tree.get_children())
+        peaks = self.network_monitor.peaks()
+        for uid, name, rx_rate, tx_rate, rx, tx in rows:
+            if not (rx or tx):
+                continue
+            self.network_tree.insert('', tk.END, iid=str(uid), values=(
+                uid, name, f"{rx_rate / 1024:.1f}", f"{tx_rate / 1024:.1f}",
+                f"{max(peaks.get(uid, 0.0), rx_rate + tx_rate) / 1024:.1f}",
+                f"{rx / (1 << 20):.1f}", f"{tx / (1 << 20):.1f}"))
+        rx_total = sum(row[2] for row in rows) / 1024
+        tx_total = sum(row[3] for row in rows) / 1024
+        self.network_status.config(text=f"{len(rows)} uids from {self.network_monitor.source}, "
+                                        f"{rx_total:.1f} KB/s down, {tx_total:.1f} KB/s up, "
+                                        f"sampled {datetime.now().strftime('%H:%M:%S')}")
+
+    def toggle_power_profile(self):
+        """Start or stop streaming power samples from the device"""
+        if self.power_profiler and self.power_profiler.running():
+            self.power_profiler.stop()
+            return
+
+        try:
+            rate = min(100, max(1, int(self.power_rate.get())))
+        except ValueError:
+            self.print_to_console("Invalid sampling rate", error=True)
+            return
+        self.power_profiler = PowerProfiler(rate)
+        try:
+            self.power_profiler.start()
+        except OSError as e:
+            self.print_to_console(f"Error starting power profile: {str(e)}", error=True)
+            return
+        self.power_button.config(text="Stop Power Profile")
+        self.print_to_console(f"Power profiling at {rate} Hz")
+        self.root.after(500, self._update_power_profile)
+
+    def _update_power_profile(self):
+        profiler = self.power_profiler
+        recent = list(profiler.recent)
+        now = sum(recent[-profiler.rate:]) / len(recent[-profiler.rate:]) if recent else 0.0
+        duration = profiler.duration()
+        rate = profiler.samples / duration if duration else 0.0
+        self.power_label.config(text=f"{now:.2f} W now, {profiler.average_power():.2f} W avg, "
+                                     f"{profiler.energy:.1f} J in {duration:.0f} s, "
+                                     f"{rate:.0f} samples/s, foreground {profiler.foreground}")
+        if profiler.running() or profiler.thread.is_alive():
+            self.root.after(500, self._update_power_profile)
+            return
+
+        self.power_button.config(text="Start Power Profile")
+        if not profiler.samples:
+            self.print_to_console("Power profile got no samples (battery sysfs not readable?)", error=True)
+            return
+        lines = [f"  {app}: {joules:.1f} J ({joules / profiler.energy * 100 if profiler.energy else 0:.0f}%)"
+                 for app, joules in sorted(profiler.per_app.items(), key=lambda item: -item[1])]
+        self.print_to_console(f"Power profile: {profiler.energy:.1f} J over {duration:.1f} s, "
+                              f"{profiler.average_power():.2f} W avg, {profiler.samples} samples\n" + "\n".join(lines))
+
     def kill_process(self):
-        """Kill selected process"""
-        selection = self.process_listbox.curselection()
-        if selection:
-            pid = self.process_listbox.get(selection[0]).split()[0]
-            self.run_command(f"adb shell kill -9 {pid}")
-            self.print_to_console(f"Killed process with PID: {pid}")
-            self.refresh_processes()
+        """Kill selected processes"""
+        pids = [line.split()[0] for line in self.selected_items(self.process_listbox) if line.split()]
+        if pids:
+            self.run_bulk_action("Kill", pids, lambda pid: f"kill -9 {shlex.quote(pid)}",
+                                 then=self.refresh_processes)
 
     # New methods for permission management
     def refresh_permission_apps(self):
         """Refresh app list for permission manager"""
-        try:
-            apps = subprocess.check_output(
-                "adb shell pm list packages -3",
-                shell=True, text=True
-            ).split('\n')
-
+        def refreshed(apps):
             self.permission_app_list.delete(0, tk.END)
             for app in apps:
-                if app.strip():
-                    self.permission_app_list.insert(tk.END, app.replace("package:", ""))
-        except Exception as e:
-            self.print_to_console(f"Error refreshing apps: {str(e)}", error=True)
+                self.permission_app_list.insert(tk.END, app)
+        return self.schedule(self._third_party_packages, key='permission-apps', error="Error refreshing apps",
+                             done=refreshed)
 
     def show_app_permissions(self):
         """Show permissions for selected app"""
@@ -1245,61 +5556,182 @@ class ADBHelperGUI:
             return
 
         package = self.permission_app_list.get(selection[0])
-        try:
-            perms = subprocess.check_output(
-                f"adb shell dumpsys package {package} | grep -A50 'requested permissions:'",
-                shell=True, text=True
-            )
+
+        def read_permissions():
+            path, index = dumpsys_to_cache(['package', package], f"package_{package}")
+            return {title: "".join(read_dumpsys_section(path, node) for node in find_dumpsys_sections(index, title))
+                    for title in ('requested permissions:', 'install permissions:', 'runtime permissions:')}
+
+        def show(sections):
+            perms = "".join(sections.values())
 
             self.permission_details.configure(state='normal')
             self.permission_details.delete(1.0, tk.END)
             self.permission_details.insert(tk.END, perms)
             self.permission_details.configure(state='disabled')
 
-            # Find dangerous permissions
-            dangerous = [line for line in perms.split('\n') if "dangerous" in line]
+            # Runtime permissions are the dangerous ones
+            dangerous = [line.strip() for line in sections['runtime permissions:'].split('\n')[1:] if line.strip()]
+            dangerous += [line for line in perms.split('\n') if "dangerous" in line]
             self.dangerous_perms_list.configure(state='normal')
             self.dangerous_perms_list.delete(1.0, tk.END)
             self.dangerous_perms_list.insert(tk.END, "\n".join(dangerous))
             self.dangerous_perms_list.configure(state='disabled')
-        except Exception as e:
-            self.print_to_console(f"Error getting permissions: {str(e)}", error=True)
+
+        return self.schedule(read_permissions, key=('permissions', package), error="Error getting permissions",
+                             done=show)
 
     def revoke_permission(self):
-        """Revoke permission for app"""
-        selection = self.permission_app_list.curselection()
-        if not selection:
+        """Revoke a permission from selected apps"""
+        packages = self.selected_items(self.permission_app_list)
+        if not packages:
             return
 
-        package = self.permission_app_list.get(selection[0])
         perm = simpledialog.askstring("Revoke Permission", "Enter permission to revoke:")
         if perm:
-            self.run_command(f"adb shell pm revoke {package} {perm}")
-            self.print_to_console(f"Revoked permission {perm} for {package}")
-            self.show_app_permissions()
+            self.run_bulk_action(f"Revoke {perm}", packages,
+                                 lambda package: f"pm revoke {shlex.quote(package)} {shlex.quote(perm)}",
+                                 then=self.show_app_permissions)
 
     # New methods for terminal
     def execute_terminal_command(self, event):
-        """Execute ADB shell command"""
-        cmd = self.terminal_entry.get()
+        """Run an ADB shell command, streaming its output into the terminal"""
+        cmd = self.terminal_entry.get().strip()
         if not cmd:
-            return
-
-        self.terminal_output.configure(state='normal')
-        self.terminal_output.insert(tk.END, f"\n$ {cmd}\n")
+            return "break"
+        if self.terminal_process and self.terminal_process.poll() is None:
+            self.print_to_console("A terminal command is still running, press Ctrl+C to stop it", error=True)
+            return "break"
+
+        self.terminal_history.add(cmd)
+        self.terminal_search = None
+        self._terminal_write(f"\n$ {cmd}\n")
+        self.terminal_entry.delete(0, tk.END)
 
         try:
-            result = subprocess.check_output(
-                f"adb shell {cmd}",
-                shell=True, stderr=subprocess.STDOUT, text=True
+            self.terminal_process = subprocess.Popen(
+                ['adb', 'shell', cmd],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT
             )
-            self.terminal_output.insert(tk.END, result)
-        except subprocess.CalledProcessError as e:
-            self.terminal_output.insert(tk.END, f"Error: {e.output}")
+        except OSError as e:
+            self._terminal_write(f"Error: {str(e)}\n")
+            return "break"
+
+        self.terminal_queue = queue.Queue()
+        self.terminal_thread = Thread(target=self._read_terminal,
+                                      args=(self.terminal_process, self.terminal_queue), daemon=True)
+        self.terminal_thread.start()
+        self.root.after(50, self._update_terminal)
+        return "break"
+
+    def _read_terminal(self, process, output_queue):
+        """Forward terminal output in whatever chunks the pipe delivers"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            chunk = process.stdout.read1(65536)
+            if not chunk:
+                break
+            output_queue.put(decoder.decode(chunk))
+        output_queue.put(decoder.decode(b'', final=True))
+        process.wait()
 
+    def _terminal_write(self, text):
+        self.terminal_output.configure(state='normal')
+        self.terminal_output.insert(tk.END, text)
+        lines = int(self.terminal_output.index('end-1c').split('.')[0])
+        if lines > TERMINAL_MAX_LINES:
+            self.terminal_output.delete(1.0, f"{lines - TERMINAL_MAX_LINES}.0")
         self.terminal_output.see(tk.END)
         self.terminal_output.configure(state='disabled')
+
+    def _update_terminal(self):
+        """Append queued terminal output in one batch"""
+        chunks = []
+        try:
+            while True:
+                chunks.append(self.terminal_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if chunks:
+            self._terminal_write(''.join(chunks))
+
+        if self.terminal_thread.is_alive() or not self.terminal_queue.empty():
+            self.root.after(50, self._update_terminal)
+        elif self.terminal_process and self.terminal_process.returncode:
+            self._terminal_write(f"[exit code {self.terminal_process.returncode}]\n")
+
+    def cancel_terminal_command(self, event=None):
+        """Stop the running terminal command; adbd kills the remote side when the shell closes"""
+        process = self.terminal_process
+        if not process or process.poll() is not None:
+            # Nothing running: let Ctrl+C copy as usual
+            return None
+        process.terminate()
+        self._terminal_write("^C\n")
+
+        def reap():
+            try:
+                process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        Thread(target=reap, daemon=True).start()
+        return "break"
+
+    def _set_terminal_entry(self, text):
         self.terminal_entry.delete(0, tk.END)
+        self.terminal_entry.insert(0, text)
+        self.terminal_entry.icursor(tk.END)
+
+    def terminal_history_reset(self, event):
+        """Start a new history walk after the entry is edited"""
+        if event.keysym not in ('Up', 'Down', 'Tab', 'Return') and not event.state & 0x4:
+            self.terminal_history.cursor = None
+            self.terminal_search = None
+
+    def terminal_history_previous(self, event):
+        """Recall the previous command starting with the typed text"""
+        if self.terminal_history.cursor is None:
+            self.terminal_prefix = self.terminal_entry.get()
+        command = self.terminal_history.previous(self.terminal_prefix)
+        if command is not None:
+            self._set_terminal_entry(command)
+        return "break"
+
+    def terminal_history_next(self, event):
+        """Recall the next command starting with the typed text"""
+        command = self.terminal_history.next(self.terminal_prefix)
+        if command is not None:
+            self._set_terminal_entry(command)
+        return "break"
+
+    def terminal_reverse_search(self, event):
+        """Find the newest command containing the typed text; repeat to go further back"""
+        if self.terminal_search is None:
+            self.terminal_search = [self.terminal_entry.get(), None]
+        text, before = self.terminal_search
+        found = self.terminal_history.search(text, before)
+        if found:
+            self.terminal_search[1] = found[0]
+            self._set_terminal_entry(found[1])
+        else:
+            self.terminal_entry.bell()
+        return "break"
+
+    def terminal_complete(self, event):
+        """Complete the typed text from history, listing candidates when ambiguous"""
+        prefix = self.terminal_entry.get()
+        matches = self.terminal_history.complete(prefix)
+        if len(matches) == 1:
+            self._set_terminal_entry(matches[0])
+        elif matches:
+            common = os.path.commonprefix(matches)
+            if len(common) > len(prefix):
+                self._set_terminal_entry(common)
+            else:
+                self._terminal_write("\n".join(matches) + "\n")
+        return "break"
 
     def clear_terminal(self):
         """Clear terminal"""
@@ -1324,9 +5756,37 @@ class ADBHelperGUI:
                 self.print_to_console(f"Error saving terminal output: {str(e)}", error=True)
 
     def show_terminal_history(self):
-        """Show terminal command history"""
-        # To be implemented - would require storing command history
-        messagebox.showinfo("Info", "Command history feature coming soon")
+        """Show searchable terminal command history"""
+        window = tk.Toplevel(self.root)
+        window.title("Terminal History")
+        window.geometry("700x450")
+
+        search = ttk.Entry(window)
+        search.pack(fill=tk.X, padx=5, pady=5)
+        listbox = tk.Listbox(window)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=5)
+        count = ttk.Label(window)
+        count.pack(fill=tk.X, padx=5, pady=2)
+
+        def refresh(event=None):
+            matches = self.terminal_history.matches(search.get())
+            listbox.delete(0, tk.END)
+            listbox.insert(tk.END, *matches)
+            count.config(text=f"{len(matches)} shown of {len(self.terminal_history.entries)} commands")
+
+        def use(event=None):
+            selection = listbox.curselection()
+            if selection:
+                self._set_terminal_entry(listbox.get(selection[0]))
+                self.terminal_entry.focus_set()
+                window.destroy()
+
+        search.bind('<KeyRelease>', refresh)
+        search.bind('<Return>', lambda event: use() if listbox.curselection() else None)
+        listbox.bind('<Double-Button-1>', use)
+        listbox.bind('<Return>', use)
+        refresh()
+        search.focus_set()
 
 def main():
     root = tk.Tk()
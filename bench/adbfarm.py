@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""Simulated device farm speaking the ADB host protocol.
+
+Presents N virtual devices to a real `adb` client or to ADB Helper:
+
+    python bench/adbfarm.py --devices 40 --port 5038
+    ADB_SERVER_SOCKET=tcp:127.0.0.1:5038 python adbhelper.py
+
+Implemented services: host:version, host:devices(-l), host:track-devices,
+host:features, host-serial:<serial>:*, host:transport*/host:tport:*,
+then shell:/exec: (with a small command interpreter) and sync: (STAT, LIST,
+RECV, SEND). Every device has a synthetic filesystem, package list, logcat
+generator and /proc files.
+"""
+import argparse
+import asyncio
+import fnmatch
+import hashlib
+import os
+import posixpath
+import re
+import shlex
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synth  # noqa: E402
+
+ADB_SERVER_VERSION = 41
+SYNC_DATA_MAX = 64 * 1024
+S_IFDIR = 0o040000
+S_IFREG = 0o100000
+
+
+class VirtualFile:
+    """File whose content is generated on demand unless it was written"""
+
+    def __init__(self, path, size, mtime, data=None):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.data = data
+
+    def read(self):
+        if self.data is None:
+            seed = hashlib.sha256(self.path.encode()).digest()
+            self.data = (seed * (self.size // len(seed) + 1))[:self.size]
+        return self.data
+
+
+class VirtualDevice:
+    """One emulated device: filesystem, packages, processes and logcat"""
+
+    def __init__(self, serial, index, config):
+        self.serial = serial
+        self.index = index
+        self.config = config
+        self.boot_time = time.time()
+        self.packages = synth.package_names(config.packages, seed=index)
+        self.dirs = {'/': set()}
+        self.files = {}
+        self.props = synth.getprop_output(serial)
+        now = int(self.boot_time)
+        for directory in ('/sdcard/Download', '/sdcard/DCIM/Camera', '/data/local/tmp',
+                          '/data/app', '/system/bin', '/proc'):
+            self.mkdir(directory)
+        for i in range(config.files):
+            self.add_file(f"/sdcard/DCIM/Camera/IMG_{i:05d}.jpg", 200_000 + (i * 7919) % 3_000_000, now - i)
+        for i in range(20):
+            self.add_file(f"/sdcard/Download/doc_{i:02d}.txt", 4096 * (i + 1), now - i)
+        for i, package in enumerate(self.packages):
+            self.add_file(f"/data/app/{package}-1/base.apk", 1_000_000 + i * 1024, now)
+        self.add_file('/proc/meminfo', 0, now, self._meminfo().encode())
+        self.add_file('/proc/cpuinfo', 0, now, self._cpuinfo().encode())
+
+    # Filesystem
+    def mkdir(self, path):
+        path = posixpath.normpath(path)
+        while path != '/':
+            self.dirs.setdefault(path, set())
+            siblings = self.dirs.setdefault(posixpath.dirname(path), set())
+            if posixpath.basename(path) in siblings:
+                break
+            siblings.add(posixpath.basename(path))
+            path = posixpath.dirname(path)
+
+    def add_file(self, path, size, mtime, data=None):
+        self.mkdir(posixpath.dirname(path))
+        self.dirs[posixpath.dirname(path)].add(posixpath.basename(path))
+        self.files[path] = VirtualFile(path, len(data) if data is not None else size, mtime, data)
+
+    def stat(self, path):
+        """Return (mode, size, mtime) or None"""
+        path = posixpath.normpath(path)
+        if path in self.dirs:
+            return S_IFDIR | 0o771, 4096, int(self.boot_time)
+        entry = self.files.get(path)
+        if entry:
+            return S_IFREG | 0o660, entry.size, entry.mtime
+        return None
+
+    def listdir(self, path):
+        return sorted(self.dirs.get(posixpath.normpath(path), ()))
+
+    # Synthetic /proc and system state
+    def _meminfo(self):
+        total = 8 * 1024 * 1024
+        return (f"MemTotal:       {total} kB\nMemFree:        {total // 3} kB\n"
+                f"MemAvailable:   {total // 2} kB\nSwapTotal:      2097148 kB\n")
+
+    def _cpuinfo(self):
+        return ''.join(f"processor\t: {i}\nBogoMIPS\t: 38.40\n\n" for i in range(8))
+
+    def uptime(self):
+        elapsed = time.time() - self.boot_time
+        return f"{elapsed:.2f} {elapsed * 6:.2f}\n"
+
+    def battery(self):
+        level = 100 - int(time.time() - self.boot_time) // 60 % 100
+        return (f"Current Battery Service state:\n  AC powered: false\n  USB powered: true\n"
+                f"  status: 2\n  health: 2\n  present: true\n  level: {level}\n  scale: 100\n"
+                f"  voltage: 4100\n  temperature: 300\n  technology: Li-ion\n")
+
+
+class ShellSession:
+    """Very small shell: pipelines of built-in commands"""
+
+    def __init__(self, device):
+        self.device = device
+
+    def run(self, command):
+        """Return (output, streaming logcat pipeline or None) for a command line"""
+        output = ''
+        for pipeline in self.parse(command):
+            if pipeline[0][0] == 'logcat' and '-d' not in pipeline[0]:
+                return output, pipeline
+            text = ''
+            for stage in pipeline:
+                text = self.builtin(stage, text)
+            output += text
+        return output, None
+
+    @staticmethod
+    def parse(command):
+        """Split a command line into pipelines of argument lists"""
+        lexer = shlex.shlex(command, posix=True, punctuation_chars=';&|')
+        lexer.whitespace_split = True
+        pipelines, stages, args = [], [], []
+        for token in lexer:
+            if token == '|':
+                stages.append(args)
+                args = []
+            elif token in (';', '&&', '||'):
+                if args:
+                    stages.append(args)
+                if stages:
+                    pipelines.append(stages)
+                stages, args = [], []
+            else:
+                args.append(token)
+        if args:
+            stages.append(args)
+        if stages:
+            pipelines.append(stages)
+        return pipelines
+
+    def builtin(self, args, stdin):
+        args = list(args)
+        while args and args[0] in ('su', '-c', 'root'):
+            args = args[1:]
+        if len(args) == 1 and ' ' in args[0]:
+            args = shlex.split(args[0])
+        if not args:
+            return stdin
+        name, rest = args[0], args[1:]
+        device = self.device
+        if name == 'getprop':
+            if rest:
+                match = re.search(rf"^\[{re.escape(rest[0])}\]: \[(.*)\]$", device.props, re.M)
+                return (match.group(1) if match else '') + '\n'
+            return device.props
+        if name in ('pm', 'cmd') and 'packages' in rest:
+            with_uid = '-U' in rest
+            return ''.join(f"package:{pkg}" + (f" uid:{10000 + i}" if with_uid else '') + '\n'
+                           for i, pkg in enumerate(device.packages))
+        if name in ('pm', 'cmd') and 'path' in rest:
+            return f"package:/data/app/{rest[-1]}-1/base.apk\n"
+        if name == 'ps':
+            return synth.ps_output(device.config.processes, seed=device.index)
+        if name == 'ls':
+            paths = [arg for arg in rest if not arg.startswith('-')] or ['/']
+            out = []
+            for path in paths:
+                if path in device.files:
+                    out.append(path)
+                elif device.stat(path):
+                    out.extend(device.listdir(path))
+                else:
+                    return f"ls: {path}: No such file or directory\n"
+            return '\n'.join(out) + ('\n' if out else '')
+        if name == 'cat':
+            out = ''
+            for path in rest:
+                if path == '/proc/uptime':
+                    out += device.uptime()
+                elif path in device.files:
+                    out += device.files[path].read().decode('latin-1')
+                else:
+                    out += f"cat: {path}: No such file or directory\n"
+            return out
+        if name == 'stat':
+            fmt = rest[rest.index('-c') + 1] if '-c' in rest else '%s %Y %n'
+            out = []
+            for path in [arg for arg in rest if arg.startswith('/')]:
+                targets = [path]
+                if any(ch in path for ch in '*?'):
+                    parent = posixpath.dirname(path)
+                    targets = [posixpath.join(parent, name)
+                               for name in fnmatch.filter(device.listdir(parent), posixpath.basename(path))]
+                for target in targets:
+                    info = device.stat(target)
+                    if info:
+                        out.append(fmt.replace('%s', str(info[1])).replace('%Y', str(info[2]))
+                                   .replace('%n', target).replace('%f', f"{info[0]:x}"))
+            return '\n'.join(out) + ('\n' if out else '')
+        if name == 'dumpsys':
+            if rest and rest[0] == 'battery':
+                return device.battery()
+            return f"DUMP OF SERVICE {rest[0] if rest else 'activity'}:\n  synthetic\n"
+        if name == 'top':
+            return "Tasks: 512 total\n800%cpu  37%user   0%nice  22%sys 741%idle\n"
+        if name == 'echo':
+            return ' '.join(rest) + '\n'
+        if name == 'sha256sum':
+            return ''.join(f"{hashlib.sha256(device.files[p].read()).hexdigest()}  {p}\n"
+                           for p in rest if p in device.files)
+        if name == 'grep':
+            return self.grep(rest, stdin)
+        if name == 'head':
+            count = int(rest[rest.index('-n') + 1]) if '-n' in rest else 10
+            return ''.join(stdin.splitlines(True)[:count])
+        if name == 'wc':
+            return f"{len(stdin.splitlines())}\n"
+        if name in ('true', 'sleep', 'input', 'am', 'settings', 'kill', 'rm', 'chmod'):
+            return ''
+        if name == 'logcat':
+            lines = synth.logcat_lines(seed=device.index)
+            return ''.join(next(lines) for _ in range(1000))
+        return f"/system/bin/sh: {name}: inaccessible or not found\n"
+
+    def grep(self, args, stdin):
+        only, limit, pattern, regex = False, None, None, False
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg == '-m':
+                limit = int(args[i + 1])
+                i += 1
+            elif arg.startswith('-m') and arg[2:].isdigit():
+                limit = int(arg[2:])
+            elif arg == '-o':
+                only = True
+            elif arg == '-E':
+                regex = True
+            elif pattern is None:
+                pattern = arg
+            i += 1
+        matcher = re.compile(pattern if regex or only else re.escape(pattern or ''))
+        out = []
+        for line in stdin.splitlines():
+            match = matcher.search(line)
+            if match:
+                out.append(match.group(0) if only else line)
+                if limit and len(out) >= limit:
+                    break
+        return '\n'.join(out) + ('\n' if out else '')
+
+
+class DeviceFarm:
+    """Asyncio ADB server presenting a set of virtual devices"""
+
+    def __init__(self, config):
+        self.config = config
+        self.devices = {}
+        self.trackers = set()
+        for i in range(config.devices):
+            serial = f"{config.serial_prefix}{i:03d}"
+            self.devices[serial] = VirtualDevice(serial, i, config)
+
+    def device_list(self, long=False):
+        lines = []
+        for tid, serial in enumerate(self.devices, 1):
+            if long:
+                lines.append(f"{serial:<22} device product:synthetic model:Farm_{serial} "
+                             f"device:farm transport_id:{tid}")
+            else:
+                lines.append(f"{serial}\tdevice")
+        return ''.join(line + '\n' for line in lines)
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle, self.config.host, self.config.port)
+        print(f"Farm of {len(self.devices)} devices listening on {self.config.host}:{self.config.port}",
+              flush=True)
+        async with server:
+            await server.serve_forever()
+
+    @staticmethod
+    async def read_request(reader):
+        length = int((await reader.readexactly(4)).decode(), 16)
+        return (await reader.readexactly(length)).decode()
+
+    @staticmethod
+    def okay(writer, payload=None):
+        writer.write(b'OKAY')
+        if payload is not None:
+            data = payload.encode() if isinstance(payload, str) else payload
+            writer.write(f"{len(data):04x}".encode() + data)
+
+    @staticmethod
+    def fail(writer, message):
+        data = message.encode()
+        writer.write(b'FAIL' + f"{len(data):04x}".encode() + data)
+
+    def pick_device(self, request):
+        """Return the device selected by a transport/tport/host-serial request"""
+        if request.startswith('host-serial:'):
+            serial = request[len('host-serial:'):].rsplit(':', 1)[0]
+            return self.devices.get(serial)
+        if ':serial:' in request or request.startswith('host:transport:'):
+            return self.devices.get(request.rsplit(':', 1)[1])
+        if request.endswith(('-id', 'any', 'usb', 'local')) or ':transport-id:' in request:
+            return next(iter(self.devices.values()), None)
+        return None
+
+    async def handle(self, reader, writer):
+        try:
+            await self.dispatch(reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, reader, writer):
+        request = await self.read_request(reader)
+        if request == 'host:version':
+            self.okay(writer, f"{ADB_SERVER_VERSION:04x}")
+        elif request in ('host:devices', 'host:devices-l'):
+            self.okay(writer, self.device_list(request.endswith('-l')))
+        elif request.startswith('host:track-devices'):
+            await self.track(writer, request.endswith('-l'))
+        elif request in ('host:features', 'host:host-features') or request.endswith(':features'):
+            self.okay(writer, '')
+        elif request == 'host:kill':
+            self.okay(writer)
+        elif request.startswith('host:connect:') or request.startswith('host:disconnect'):
+            self.okay(writer, f"connected to {request.rsplit(':', 1)[-1]}")
+        elif request.startswith('host-serial:') and request.endswith(':get-state'):
+            device = self.pick_device(request)
+            self.okay(writer, 'device') if device else self.fail(writer, 'device not found')
+        elif request.startswith(('host:transport', 'host:tport:')):
+            device = self.pick_device(request)
+            if not device:
+                self.fail(writer, 'device not found')
+                return
+            self.okay(writer)
+            if request.startswith('host:tport:'):
+                writer.write(struct.pack('<Q', list(self.devices).index(device.serial) + 1))
+            await writer.drain()
+            await self.device_service(device, reader, writer, await self.read_request(reader))
+        else:
+            self.fail(writer, f"unknown host service '{request}'")
+        await writer.drain()
+
+    async def track(self, writer, long):
+        self.okay(writer)
+        data = self.device_list(long).encode()
+        writer.write(f"{len(data):04x}".encode() + data)
+        await writer.drain()
+        self.trackers.add(writer)
+        try:
+            while not writer.is_closing():
+                await asyncio.sleep(1)
+        finally:
+            self.trackers.discard(writer)
+
+    async def device_service(self, device, reader, writer, service):
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+        if service.startswith(('shell', 'exec:')):
+            command = service.split(':', 1)[1]
+            self.okay(writer)
+            if command:
+                await self.run_shell(device, command, writer)
+            else:
+                await self.interactive_shell(device, reader, writer)
+        elif service == 'sync:':
+            self.okay(writer)
+            await self.sync(device, reader, writer)
+        elif service.startswith(('reboot:', 'root:', 'remount:')):
+            self.okay(writer)
+        else:
+            self.fail(writer, f"unknown device service '{service}'")
+
+    async def run_shell(self, device, command, writer):
+        output, stream = ShellSession(device).run(command)
+        writer.write(output.encode())
+        if stream:
+            await self.stream_logcat(device, stream, writer)
+
+    async def interactive_shell(self, device, reader, writer):
+        session = ShellSession(device)
+        while True:
+            line = await reader.readline()
+            if not line or line.strip() == b'exit':
+                break
+            output, _ = session.run(line.decode().strip())
+            writer.write(output.encode())
+            await writer.drain()
+
+    async def stream_logcat(self, device, stages, writer):
+        """Stream synthetic logcat at the configured rate through any filters"""
+        session = ShellSession(device)
+        lines = synth.logcat_lines(seed=device.index)
+        rate = self.config.logcat_rate
+        per_tick = max(1, rate // 100)
+        start = time.perf_counter()
+        sent = 0
+        while not writer.is_closing():
+            chunk = ''.join(next(lines) for _ in range(per_tick))
+            for stage in stages[1:]:
+                chunk = session.builtin(stage, chunk)
+            writer.write(chunk.encode())
+            await writer.drain()
+            sent += per_tick
+            await asyncio.sleep(max(0, start + sent / rate - time.perf_counter()))
+
+    async def sync(self, device, reader, writer):
+        while True:
+            header = await reader.readexactly(8)
+            command, length = header[:4], struct.unpack('<I', header[4:])[0]
+            path = (await reader.readexactly(length)).decode()
+            if command == b'QUIT':
+                return
+            if command == b'STAT':
+                info = device.stat(path) or (0, 0, 0)
+                writer.write(b'STAT' + struct.pack('<III', *info))
+            elif command == b'LIST':
+                for name in device.listdir(path):
+                    mode, size, mtime = device.stat(posixpath.join(path, name))
+                    data = name.encode()
+                    writer.write(b'DENT' + struct.pack('<IIII', mode, size, mtime, len(data)) + data)
+                writer.write(b'DONE' + struct.pack('<IIII', 0, 0, 0, 0))
+            elif command == b'RECV':
+                entry = device.files.get(posixpath.normpath(path))
+                if entry is None:
+                    message = b'No such file or directory'
+                    writer.write(b'FAIL' + struct.pack('<I', len(message)) + message)
+                else:
+                    data = entry.read()
+                    for offset in range(0, len(data), SYNC_DATA_MAX):
+                        chunk = data[offset:offset + SYNC_DATA_MAX]
+                        writer.write(b'DATA' + struct.pack('<I', len(chunk)) + chunk)
+                        await writer.drain()
+                    writer.write(b'DONE' + struct.pack('<I', 0))
+            elif command == b'SEND':
+                target = path.rsplit(',', 1)[0]
+                chunks = []
+                while True:
+                    chunk_id, size = struct.unpack('<4sI', await reader.readexactly(8))
+                    if chunk_id == b'DONE':
+                        device.add_file(target, 0, size, b''.join(chunks))
+                        break
+                    chunks.append(await reader.readexactly(size))
+                writer.write(b'OKAY' + struct.pack('<I', 0))
+            else:
+                message = f"unknown sync command {command!r}".encode()
+                writer.write(b'FAIL' + struct.pack('<I', len(message)) + message)
+                return
+            await writer.drain()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated ADB device farm")
+    parser.add_argument('--devices', type=int, default=10)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5038)
+    parser.add_argument('--serial-prefix', default='farm-')
+    parser.add_argument('--packages', type=int, default=300)
+    parser.add_argument('--processes', type=int, default=500)
+    parser.add_argument('--files', type=int, default=2000, help="files in /sdcard/DCIM/Camera")
+    parser.add_argument('--logcat-rate', type=int, default=5000, help="lines per second")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds per device request")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    farm = DeviceFarm(parse_args(argv))
+    try:
+        asyncio.run(farm.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
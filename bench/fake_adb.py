@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Stand-in for the `adb` binary used by the benchmark suite.
+
+Output is synthetic (see synth.py) or replayed from recordings, and is sized
+and paced through environment variables so the GUI can be driven without a
+device:
+
+    FAKE_ADB_PACKAGES      packages reported by `pm list packages` (1000)
+    FAKE_ADB_PROCESSES     processes reported by `ps` (2000)
+    FAKE_ADB_LOGCAT_RATE   logcat lines per second (10000)
+    FAKE_ADB_LOGCAT_LINES  logcat lines before the stream ends (50000)
+    FAKE_ADB_LATENCY       seconds added to every invocation (0)
+    FAKE_ADB_JVM_DELAY     extra seconds for pm/am/settings calls (0)
+    FAKE_ADB_PULL_SIZE     bytes written by `pull` (1048576)
+    FAKE_ADB_APK_SIZE      bytes of every APK served by `cat` (4194304)
+    FAKE_ADB_REPLAY_DIR    directory of recorded outputs, see record_key()
+"""
+import hashlib
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synth  # noqa: E402
+
+JVM_TOOLS = ('pm', 'am', 'settings')
+CMD_SERVICES = ('activity', 'appops', 'battery', 'package', 'power', 'settings', 'uimode', 'window')
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+def record_key(args):
+    """Map a command line to the file name of its recording"""
+    return re.sub(r'[^A-Za-z0-9.,-]+', '_', ' '.join(args)).strip('_') + '.txt'
+
+
+def replay(args):
+    """Return recorded output for a command, if any"""
+    directory = os.environ.get('FAKE_ADB_REPLAY_DIR')
+    if not directory:
+        return None
+    path = os.path.join(directory, record_key(args))
+    if os.path.exists(path):
+        with open(path) as f:
+            return f.read()
+    return None
+
+
+def recorded_logcat():
+    """Yield recorded logcat lines endlessly, if a recording exists"""
+    directory = os.environ.get('FAKE_ADB_REPLAY_DIR')
+    path = os.path.join(directory, 'logcat.txt') if directory else None
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        lines = f.readlines()
+    if not lines:
+        return None
+
+    def cycle():
+        while True:
+            yield from lines
+    return cycle()
+
+
+def stream_logcat():
+    """Write logcat lines at the configured rate until the line budget is spent"""
+    rate = env_int('FAKE_ADB_LOGCAT_RATE', 10000)
+    total = env_int('FAKE_ADB_LOGCAT_LINES', 50000)
+    source = recorded_logcat() or synth.logcat_lines()
+    tick = 0.01
+    per_tick = max(1, int(rate * tick))
+    start = time.perf_counter()
+    written = 0
+    out = sys.stdout
+    try:
+        while written < total:
+            count = min(per_tick, total - written)
+            out.write(''.join(next(source) for _ in range(count)))
+            out.flush()
+            written += count
+            delay = start + written / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    except BrokenPipeError:
+        pass
+
+
+def file_content(path):
+    """Return deterministic content for a device file"""
+    seed = hashlib.sha256(path.encode()).digest()
+    size = env_int('FAKE_ADB_APK_SIZE', 4 << 20)
+    return (seed * (size // len(seed) + 1))[:size]
+
+
+def shell(command):
+    """Answer a shell command with synthetic output"""
+    words = command.split()
+    if not words:
+        return ''
+    if words[0] in JVM_TOOLS:
+        time.sleep(env_float('FAKE_ADB_JVM_DELAY', 0))
+    if words[:2] == ['cmd', '-l']:
+        return "Currently running services:\n" + ''.join(f"  {name}\n" for name in CMD_SERVICES)
+    if 'install-create' in words:
+        return "Success: created install session [1000]\n"
+    if 'install-write' in words:
+        size = int(words[words.index('-S') + 1])
+        remaining = size
+        while remaining > 0:
+            chunk = sys.stdin.buffer.read(min(remaining, 1 << 20))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        return f"Success: streamed {size - remaining} bytes\n"
+    if 'install-commit' in words:
+        return "Success\n"
+    if words[0] in ('pm', 'cmd') and 'path' in words:
+        base = f"/data/app/{words[-1]}-1"
+        return f"package:{base}/base.apk\npackage:{base}/split_config.arm64_v8a.apk\n"
+    if words[:2] == ['dumpsys', 'package'] and len(words) > 2:
+        return f"Packages:\n  Package [{words[2]}]\n    versionCode=42 minSdk=24 targetSdk=34\n    versionName=1.2.3\n"
+    if words[0] == 'sha256sum':
+        return ''.join(f"{hashlib.sha256(file_content(path)).hexdigest()}  {path}\n" for path in words[1:])
+    if words[0] in ('pm', 'cmd') and 'list' in words and 'packages' in words:
+        return synth.package_list(env_int('FAKE_ADB_PACKAGES', 1000))
+    if words[0] == 'ps':
+        return synth.ps_output(env_int('FAKE_ADB_PROCESSES', 2000))
+    if words[0] == 'getprop':
+        return synth.getprop_output(os.environ.get('ANDROID_SERIAL', 'emulator-5554'))
+    if words[0] == 'ls':
+        return synth.file_listing(env_int('FAKE_ADB_FILES', 200))
+    if words[0] == 'echo':
+        return ' '.join(words[1:]) + '\n'
+    return ''
+
+
+def main(argv):
+    time.sleep(env_float('FAKE_ADB_LATENCY', 0))
+    args = list(argv)
+    while args and args[0] in ('-s', '-H', '-P', '-t', '-d', '-e'):
+        args = args[2:] if args[0] in ('-s', '-H', '-P', '-t') else args[1:]
+    if not args:
+        return 1
+
+    recorded = replay(args)
+    if recorded is not None:
+        sys.stdout.write(recorded)
+        return 0
+
+    command = args[0]
+    if command in ('--version', 'version'):
+        print("Android Debug Bridge version 1.0.41\nVersion 35.0.0-fake")
+    elif command == 'devices':
+        print("List of devices attached\nemulator-5554\tdevice\n")
+    elif command == 'track-devices':
+        payload = "emulator-5554\tdevice\n"
+        sys.stdout.write(f"{len(payload):04x}{payload}")
+        sys.stdout.flush()
+        while True:
+            time.sleep(3600)
+    elif command in ('start-server', 'kill-server', 'disconnect', 'reboot'):
+        pass
+    elif command == 'connect':
+        print(f"connected to {args[1] if len(args) > 1 else ''}")
+    elif command == 'logcat':
+        stream_logcat()
+    elif command == 'exec-out' and args[1:2] == ['cat']:
+        for path in args[2:]:
+            sys.stdout.buffer.write(file_content(path))
+    elif command in ('shell', 'exec-out'):
+        sys.stdout.write(shell(' '.join(args[1:])))
+    elif command == 'push':
+        if len(args) < 3:
+            sys.stderr.write("adb: error: push requires an argument\n")
+            return 1
+        if not os.path.isfile(args[1]):
+            sys.stderr.write(f"adb: error: cannot stat '{args[1]}': No such file or directory\n")
+            return 1
+        size = os.path.getsize(args[1])
+        with open(args[1], 'rb') as f:
+            while f.read(1 << 20):
+                pass
+        print(f"{args[1]}: 1 file pushed, 0 skipped. ({size} bytes)")
+    elif command == 'pull':
+        target = args[2] if len(args) > 2 else '.'
+        if os.path.isdir(target):
+            target = os.path.join(target, os.path.basename(args[1]) or 'pulled')
+        size = env_int('FAKE_ADB_PULL_SIZE', 1 << 20)
+        with open(target, 'wb') as f:
+            f.write(b'\0' * size)
+        print(f"{args[1]}: 1 file pulled, 0 skipped. ({size} bytes)")
+    else:
+        sys.stderr.write(f"adb: unknown command {command}\n")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""Benchmark suite for ADB Helper.
+
+Replaces `adb` with fake_adb.py, drives the GUI subsystems against it and
+stores throughput, UI event-loop latency and memory figures as JSON:
+
+    python bench/run_bench.py                      # full run, writes bench/results/<commit>.json
+    python bench/run_bench.py --quick --only logcat
+    python bench/run_bench.py --compare bench/results/old.json
+    python bench/run_bench.py --farm 40            # real adb client against bench/adbfarm.py
+
+Needs a display for Tk (use xvfb-run on headless machines).
+"""
+import argparse
+import json
+import os
+import platform
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+BENCHMARKS = []
+
+FULL_CONFIG = {
+    'FAKE_ADB_PACKAGES': 1000,
+    'FAKE_ADB_PROCESSES': 2000,
+    'FAKE_ADB_LOGCAT_RATE': 10000,
+    'FAKE_ADB_LOGCAT_LINES': 50000,
+    'FAKE_ADB_PULL_SIZE': 1 << 20,
+    'batch_files': 50,
+    'batch_file_size': 1 << 20,
+    'repeat': 5,
+    'jvm_delay': 0.25,
+}
+QUICK_CONFIG = dict(FULL_CONFIG, FAKE_ADB_LOGCAT_LINES=10000, batch_files=10, repeat=2)
+
+
+def benchmark(name):
+    """Register a benchmark function under the given subsystem name"""
+    def register(func):
+        BENCHMARKS.append((name, func))
+        return func
+    return register
+
+
+def install_fake_adb(config):
+    """Put an `adb` shim in front of PATH and export the fake's settings"""
+    bin_dir = tempfile.mkdtemp(prefix='fake-adb-')
+    fake = os.path.join(BENCH_DIR, 'fake_adb.py')
+    if sys.platform == 'win32':
+        shim = os.path.join(bin_dir, 'adb.bat')
+        with open(shim, 'w') as f:
+            f.write(f'@"{sys.executable}" "{fake}" %*\n')
+    else:
+        shim = os.path.join(bin_dir, 'adb')
+        with open(shim, 'w') as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{fake}" "$@"\n')
+        os.chmod(shim, os.stat(shim).st_mode | stat.S_IEXEC)
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+    for key, value in config.items():
+        if key.startswith('FAKE_ADB_'):
+            os.environ[key] = str(value)
+    return bin_dir
+
+
+def start_farm(devices, config):
+    """Serve a simulated device farm and point adb at it (needs a real adb client)"""
+    port = 5038
+    farm = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, 'adbfarm.py'), '--devices', str(devices),
+        '--port', str(port), '--packages', str(config['FAKE_ADB_PACKAGES']),
+        '--processes', str(config['FAKE_ADB_PROCESSES']),
+        '--logcat-rate', str(config['FAKE_ADB_LOGCAT_RATE']),
+    ], stdout=subprocess.PIPE, text=True)
+    farm.stdout.readline()
+    os.environ['ADB_SERVER_SOCKET'] = f"tcp:127.0.0.1:{port}"
+    os.environ['ANDROID_SERIAL'] = 'farm-000'
+    return farm
+
+
+def rss_kb():
+    """Return the resident set size of this process in kB, if known"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class LatencyProbe:
+    """Measures how late Tk `after` callbacks fire while a workload runs"""
+
+    def __init__(self, root, interval_ms=10):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.delays = []
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self._schedule()
+
+    def _schedule(self):
+        expected = time.perf_counter() + self.interval_ms / 1000
+        self.root.after(self.interval_ms, self._tick, expected)
+
+    def _tick(self, expected):
+        self.delays.append(max(0.0, time.perf_counter() - expected) * 1000)
+        if self.running:
+            self._schedule()
+
+    def stop(self):
+        self.running = False
+        return {
+            'latency_p50_ms': round(percentile(self.delays, 50), 3),
+            'latency_p99_ms': round(percentile(self.delays, 99), 3),
+            'latency_max_ms': round(max(self.delays, default=0.0), 3),
+        }
+
+
+def pump(root, seconds=0.05):
+    """Process Tk events for a short while"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        root.update()
+
+
+def blocking_calls(ctx, func, repeat):
+    """Time repeated UI-thread calls, letting the event loop run in between"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+        pump(ctx['root'])
+    return {
+        'calls': repeat,
+        'call_mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+        'call_max_ms': round(max(timings) * 1000, 3),
+    }
+
+
+@benchmark('logcat')
+def bench_logcat(ctx):
+    """Stream logcat through _read_logcat/_update_logcat until the fake ends it"""
+    app, root = ctx['app'], ctx['root']
+    app.clear_logcat()
+    app.logcat_filter.delete(0, 'end')
+    config = ctx['config']
+    deadline = time.perf_counter() + config['FAKE_ADB_LOGCAT_LINES'] / config['FAKE_ADB_LOGCAT_RATE'] + 5
+    start = time.perf_counter()
+    app.start_logcat()
+    while app.logcat_process.poll() is None or app.logcat_thread.is_alive():
+        root.update()
+        if time.perf_counter() > deadline:
+            app.stop_logcat()
+    pump(root, 0.2)
+    elapsed = time.perf_counter() - start
+    lines = int(app.logcat_output.index('end-1c').split('.')[0]) - 1
+    return {
+        'lines': lines,
+        'seconds': round(elapsed, 3),
+        'lines_per_s': round(lines / elapsed, 1),
+        'source_rate': ctx['config']['FAKE_ADB_LOGCAT_RATE'],
+    }
+
+
+@benchmark('processes')
+def bench_processes(ctx):
+    """Refresh the process list"""
+    result = blocking_calls(ctx, ctx['app'].refresh_processes, ctx['config']['repeat'])
+    result['rows'] = ctx['app'].process_listbox.size()
+    return result
+
+
+def wait_for(root, future):
+    """Run the Tk loop until a scheduled job is done and its UI callback has run"""
+    while not future.done():
+        root.update()
+    pump(root, 0.01)
+    return future.result()
+
+
+@benchmark('filter_apps')
+def bench_filter_apps(ctx):
+    """Filter the app list with a handful of search terms, until the list is refilled"""
+    app, root = ctx['app'], ctx['root']
+    terms = iter(['app0', 'example', 'app01', 'acme', 'zzz'] * ctx['config']['repeat'])
+    futures = []
+
+    def run():
+        app.app_filter.delete(0, 'end')
+        app.app_filter.insert(0, next(terms))
+        futures.append(app.filter_apps(None))
+    result = blocking_calls(ctx, run, ctx['config']['repeat'])
+    for future in futures:
+        wait_for(root, future)
+    completions = []
+    for _ in range(ctx['config']['repeat']):
+        start = time.perf_counter()
+        run()
+        wait_for(root, futures[-1])
+        completions.append((time.perf_counter() - start) * 1000)
+    result['complete_mean_ms'] = round(sum(completions) / len(completions), 3)
+    result['complete_max_ms'] = round(max(completions), 3)
+    result['rows'] = app.app_list.size()
+    return result
+
+
+@benchmark('execute_batch')
+def bench_execute_batch(ctx):
+    """Push a batch of local files"""
+    app, config = ctx['app'], ctx['config']
+    work_dir = tempfile.mkdtemp(prefix='adbhelper-batch-')
+    for i in range(config['batch_files']):
+        path = os.path.join(work_dir, f"file_{i:03d}.bin")
+        with open(path, 'wb') as f:
+            f.write(os.urandom(config['batch_file_size']))
+        app.batch_operations.append(('push', path, '/sdcard/'))
+        app.batch_listbox.insert('end', f"Push: {path} → /sdcard/")
+    total = config['batch_files'] * config['batch_file_size']
+    start = time.perf_counter()
+    futures = app.execute_batch()
+    queued = time.perf_counter() - start
+    for future in futures:
+        wait_for(ctx['root'], future)
+    elapsed = time.perf_counter() - start
+    return {
+        'files': config['batch_files'],
+        'queue_ms': round(queued * 1000, 3),
+        'seconds': round(elapsed, 3),
+        'mb_per_s': round(total / elapsed / (1 << 20), 2),
+    }
+
+
+@benchmark('install')
+def bench_install(ctx):
+    """Stream a base APK and two splits into one install session"""
+    import adbhelper
+    work_dir = tempfile.mkdtemp(prefix='adbhelper-apks-')
+    apks = []
+    for name, size in (('base.apk', 8 << 20), ('split_config.arm64_v8a.apk', 4 << 20),
+                       ('split_config.xxhdpi.apk', 2 << 20)):
+        apks.append(os.path.join(work_dir, name))
+        with open(apks[-1], 'wb') as f:
+            f.write(os.urandom(size))
+    timings = adbhelper.install_apk_session(apks)
+    return {
+        'create_s': round(timings['create'], 3),
+        'write_s': round(timings['write'], 3),
+        'commit_s': round(timings['commit'], 3),
+        'total_s': round(timings['total'], 3),
+        'mb_per_s': round(timings['bytes'] / timings['write'] / (1 << 20), 2),
+    }
+
+
+@benchmark('logcat_rules')
+def bench_logcat_rules(ctx):
+    """Match 60 rules of every kind against synthetic logcat lines"""
+    import itertools
+    import adbhelper
+    import synth
+    rules = [{'name': f"word{i}", 'type': 'substring', 'pattern': f"{word} {i}"}
+             for i, word in enumerate(synth.LOG_WORDS * 2)]
+    rules += [{'name': 'crash', 'type': 'substring', 'pattern': 'FATAL EXCEPTION'},
+              {'name': 'strictmode', 'type': 'tag', 'pattern': 'StrictMode'},
+              {'name': 'errors', 'type': 'level', 'pattern': 'E'},
+              {'name': 'pid', 'type': 'pid', 'pattern': '1234'},
+              {'name': 'skipped', 'type': 'regex', 'pattern': r'skipped \w+ frames'},
+              {'name': 'timeout', 'type': 'regex', 'pattern': r'timeout (?:binder|service)'}]
+    rules += [{'name': f"tag{i}", 'type': 'tag', 'pattern': tag} for i, tag in enumerate(synth.LOG_TAGS)]
+    engine = adbhelper.LogcatRuleEngine(rules)
+    lines = list(itertools.islice(synth.logcat_lines(), 100000))
+    start = time.perf_counter()
+    for line in lines:
+        engine.process(line)
+    elapsed = time.perf_counter() - start
+    return {
+        'rules': len(rules),
+        'lines': len(lines),
+        'lines_per_s': round(len(lines) / elapsed, 1),
+        'matches': sum(engine.counts.values()),
+    }
+
+
+@benchmark('scheduler')
+def bench_scheduler(ctx):
+    """Time interactive adb calls queued behind background polling and transfers"""
+    from concurrent.futures import ThreadPoolExecutor
+    import adbhelper
+
+    def poll():
+        subprocess.run(['adb', 'shell', 'ps'], stdout=subprocess.DEVNULL)
+
+    def transfer():
+        subprocess.run(['adb', 'shell', 'ls'], stdout=subprocess.DEVNULL)
+        time.sleep(0.2)
+
+    def click():
+        subprocess.run(['adb', 'shell', 'getprop'], stdout=subprocess.DEVNULL)
+
+    def measure(submit):
+        waits = []
+        for _ in range(ctx['config']['repeat']):
+            background = [submit(poll, adbhelper.PRIORITY_BACKGROUND) for _ in range(12)]
+            background += [submit(transfer, adbhelper.PRIORITY_TRANSFER) for _ in range(3)]
+            start = time.perf_counter()
+            submit(click, adbhelper.PRIORITY_INTERACTIVE).result()
+            waits.append((time.perf_counter() - start) * 1000)
+            for future in background:
+                future.result()
+        return waits
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        fifo = measure(lambda func, priority: pool.submit(func))
+    scheduler = adbhelper.DeviceScheduler()
+    scheduled = measure(lambda func, priority: scheduler.submit(func, priority=priority))
+    return {
+        'fifo_click_p50_ms': round(percentile(fifo, 50), 1),
+        'fifo_click_max_ms': round(max(fifo), 1),
+        'scheduled_click_p50_ms': round(percentile(scheduled, 50), 1),
+        'scheduled_click_max_ms': round(max(scheduled), 1),
+    }
+
+
+@benchmark('shell_tools')
+def bench_shell_tools(ctx):
+    """Per-call latency of pm/am/settings against their `cmd` equivalents, per tab.
+
+    fake_adb has no JVM: the app_process start-up cost of pm/am/settings is
+    simulated with FAKE_ADB_JVM_DELAY, so the gap between the two columns is
+    that injected delay, not a measured saving.
+    """
+    import adbhelper
+    calls = {
+        'apps': ["pm list packages -3", "pm clear com.example.app0001"],
+        'app_manager': ["pm disable-user --user 0 com.example.app0001", "settings put secure ui_night_mode 2"],
+        'permissions': ["pm list packages -3", "pm revoke com.example.app0001 android.permission.CAMERA"],
+    }
+    previous = os.environ.get('FAKE_ADB_JVM_DELAY')
+    os.environ['FAKE_ADB_JVM_DELAY'] = str(ctx['config']['jvm_delay'])
+    adbhelper._shell_tools.clear()
+    try:
+        result = {'simulated_jvm_delay_ms': round(ctx['config']['jvm_delay'] * 1000, 1)}
+        for tab, commands in calls.items():
+            legacy, fast = [], []
+            for _ in range(ctx['config']['repeat']):
+                for command in commands:
+                    for variant, timings in ((command, legacy), (adbhelper.fast_command(command), fast)):
+                        start = time.perf_counter()
+                        subprocess.run(['adb', 'shell', variant], stdout=subprocess.DEVNULL)
+                        timings.append((time.perf_counter() - start) * 1000)
+            result[f"{tab}_legacy_ms"] = round(sum(legacy) / len(legacy), 1)
+            result[f"{tab}_cmd_ms"] = round(sum(fast) / len(fast), 1)
+        return result
+    finally:
+        if previous is None:
+            os.environ.pop('FAKE_ADB_JVM_DELAY', None)
+        else:
+            os.environ['FAKE_ADB_JVM_DELAY'] = previous
+
+
+def run_benchmark(ctx, name, func):
+    """Run one benchmark with memory and latency instrumentation"""
+    root = ctx['root']
+    pump(root)
+    rss_before = rss_kb()
+    tracemalloc.start()
+    probe = LatencyProbe(root)
+    probe.start()
+    started = time.perf_counter()
+    metrics = func(ctx)
+    metrics['wall_s'] = round(time.perf_counter() - started, 3)
+    metrics.update(probe.stop())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    metrics['py_peak_kb'] = peak // 1024
+    rss_after = rss_kb()
+    if rss_before is not None and rss_after is not None:
+        metrics['rss_delta_kb'] = rss_after - rss_before
+    return metrics
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return 'unknown'
+
+
+def compare(base_path, results):
+    """Print relative change of every numeric metric against a previous run"""
+    with open(base_path) as f:
+        base = json.load(f)
+    print(f"\nCompared with {base.get('commit', base_path)}:")
+    for name, metrics in results['results'].items():
+        old = base.get('results', {}).get(name, {})
+        for key, value in metrics.items():
+            if isinstance(value, (int, float)) and isinstance(old.get(key), (int, float)) and old[key]:
+                change = (value - old[key]) / old[key] * 100
+                print(f"  {name}.{key}: {old[key]} -> {value} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quick', action='store_true', help="smaller workloads")
+    parser.add_argument('--only', help="comma separated subsystem names")
+    parser.add_argument('--output', help="result file (default: bench/results/<commit>.json)")
+    parser.add_argument('--compare', help="previous result file to compare against")
+    parser.add_argument('--farm', type=int, metavar='DEVICES',
+                        help="run against bench/adbfarm.py with this many devices instead of the fake adb")
+    args = parser.parse_args()
+
+    config = dict(QUICK_CONFIG if args.quick else FULL_CONFIG)
+    farm = start_farm(args.farm, config) if args.farm else None
+    if not farm:
+        install_fake_adb(config)
+    sys.path.insert(0, REPO_DIR)
+    sys.path.insert(0, BENCH_DIR)
+    import tkinter as tk
+    import adbhelper
+
+    root = tk.Tk()
+    app = adbhelper.ADBHelperGUI(root)
+    ctx = {'root': root, 'app': app, 'config': config}
+
+    selected = set(args.only.split(',')) if args.only else None
+    results = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': dict(config, farm_devices=args.farm or 0),
+        'results': {},
+    }
+    for name, func in BENCHMARKS:
+        if selected and name not in selected:
+            continue
+        print(f"Running {name}...", flush=True)
+        results['results'][name] = run_benchmark(ctx, name, func)
+        print(f"  {results['results'][name]}")
+    root.destroy()
+    if farm:
+        farm.terminate()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Synthetic device output shared by the fake adb binary and the device farm"""
+import random
+from datetime import datetime, timedelta
+
+LOG_TAGS = ['ActivityManager', 'PackageManager', 'WindowManager', 'InputDispatcher',
+            'chatty', 'SurfaceFlinger', 'StrictMode', 'AndroidRuntime', 'DEBUG',
+            'ConnectivityService', 'BluetoothAdapter', 'Choreographer', 'OpenGLRenderer',
+            'WifiStateMachine', 'AudioFlinger', 'dex2oat', 'System.err', 'Zygote']
+LOG_LEVELS = 'VDIIIIWWEF'
+LOG_WORDS = ['start', 'stop', 'binder', 'transaction', 'failed', 'resumed', 'paused',
+             'intent', 'service', 'bound', 'frames', 'skipped', 'window', 'focus',
+             'package', 'com.example.app', 'surface', 'buffer', 'timeout', 'connected']
+PROCESS_NAMES = ['init', 'logd', 'servicemanager', 'surfaceflinger', 'zygote64',
+                 'system_server', 'media.codec', 'adbd', 'netd', 'vold', 'installd',
+                 'com.android.systemui', 'com.android.phone', 'com.google.android.gms']
+
+
+def package_names(count, seed=0):
+    """Return a reproducible list of package names"""
+    rng = random.Random(seed)
+    vendors = ['com.example', 'org.sample', 'net.demo', 'io.test', 'com.acme']
+    return [f"{rng.choice(vendors)}.app{i:04d}" for i in range(count)]
+
+
+def package_list(count, seed=0):
+    """Return `pm list packages` output for the given number of packages"""
+    return ''.join(f"package:{name}\n" for name in package_names(count, seed))
+
+
+def ps_output(count, seed=0):
+    """Return `ps -A -o PID,NAME,USER,%CPU,%MEM` output for the given number of processes"""
+    rng = random.Random(seed)
+    lines = [f"{'PID':>5} {'NAME':<40} {'USER':<12} {'%CPU':>5} {'%MEM':>5}"]
+    packages = package_names(max(count, 1), seed)
+    for i in range(count):
+        pid = 1 + i * 3
+        if i < len(PROCESS_NAMES):
+            name, user = PROCESS_NAMES[i], 'root' if i < 10 else 'system'
+        else:
+            name, user = packages[i], f"u0_a{100 + i % 400}"
+        lines.append(f"{pid:>5} {name:<40} {user:<12} {rng.random() * 20:>5.1f} {rng.random() * 5:>5.1f}")
+    return '\n'.join(lines) + '\n'
+
+
+def getprop_output(serial='emulator-5554'):
+    """Return `getprop` output for a synthetic device"""
+    props = {
+        'ro.product.model': 'Synthetic Device',
+        'ro.product.manufacturer': 'ADBHelper',
+        'ro.build.version.release': '14',
+        'ro.build.version.sdk': '34',
+        'ro.serialno': serial,
+        'ro.build.fingerprint': 'adbhelper/synthetic/generic:14/UP1A/1:userdebug/test-keys',
+        'sys.boot_completed': '1',
+        'persist.sys.locale': 'en-US',
+    }
+    return ''.join(f"[{key}]: [{value}]\n" for key, value in sorted(props.items()))
+
+
+def logcat_lines(seed=0, start=None):
+    """Yield an endless stream of logcat lines in threadtime format"""
+    rng = random.Random(seed)
+    now = start or datetime(2024, 1, 1, 12, 0, 0)
+    while True:
+        now += timedelta(microseconds=rng.randint(50, 5000))
+        pid = rng.randint(100, 30000)
+        tid = pid + rng.randint(0, 40)
+        message = ' '.join(rng.choice(LOG_WORDS) for _ in range(rng.randint(3, 14)))
+        yield (f"{now.strftime('%m-%d %H:%M:%S.%f')[:-3]} {pid:>5} {tid:>5} "
+               f"{rng.choice(LOG_LEVELS)} {rng.choice(LOG_TAGS)}: {message}\n")
+
+
+def file_listing(count, seed=0):
+    """Return `ls` output for a synthetic directory"""
+    rng = random.Random(seed)
+    extensions = ['.jpg', '.png', '.mp4', '.txt', '.log', '.db', '.apk']
+    return ''.join(f"file_{i:05d}{rng.choice(extensions)}\n" for i in range(count))
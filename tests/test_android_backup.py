@@ -0,0 +1,62 @@
+import io
+import tarfile
+import zlib
+
+import pytest
+
+from adbhelper import AndroidBackupReader, ab_members, ab_package_of
+
+
+def make_tar(files):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode='w') as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+
+def make_backup(payload, compressed=True, encryption='none'):
+    header = f"ANDROID BACKUP\n5\n{1 if compressed else 0}\n{encryption}\n".encode()
+    return header + (zlib.compress(payload) if compressed else payload)
+
+
+FILES = {'apps/com.example/_manifest': b'manifest', 'apps/com.example/f/data.bin': bytes(300000),
+         'apps/com.other/db/main.db': b'sqlite'}
+
+
+@pytest.mark.parametrize('compressed', [True, False])
+def test_reader_streams_tar_payload(compressed):
+    payload = make_tar(FILES)
+    reader = AndroidBackupReader(io.BytesIO(make_backup(payload, compressed)), chunk_size=4096)
+    assert reader.version == 5 and reader.compressed == compressed
+    assert [member.name for _, member in ab_members(reader)] == list(FILES)
+    assert reader.complete()
+
+
+def test_small_reads_reassemble_payload():
+    payload = make_tar(FILES)
+    reader = AndroidBackupReader(io.BytesIO(make_backup(payload)), chunk_size=1024)
+    pieces = iter(lambda: reader.read(777), b'')
+    assert b''.join(pieces) == payload
+
+
+def test_truncated_backup_is_incomplete():
+    data = make_backup(make_tar(FILES))
+    reader = AndroidBackupReader(io.BytesIO(data[:len(data) - 10]))
+    reader.read()
+    assert not reader.complete()
+
+
+def test_rejects_foreign_and_encrypted_files():
+    with pytest.raises(ValueError):
+        AndroidBackupReader(io.BytesIO(b"PK\x03\x04 not a backup"))
+    with pytest.raises(ValueError):
+        AndroidBackupReader(io.BytesIO(make_backup(b'', encryption='AES-256')))
+
+
+def test_package_of_member():
+    assert ab_package_of('apps/com.example/f/data.bin') == 'com.example'
+    assert ab_package_of('apps/com.example') is None
+    assert ab_package_of('shared/0/DCIM/a.jpg') is None
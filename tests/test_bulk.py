@@ -0,0 +1,43 @@
+from adbhelper import BULK_MARKER, build_bulk_script, bulk_chunks, bulk_succeeded, parse_bulk_output
+
+
+def test_parse_bulk_output_statuses_and_missing_commands():
+    output = "\n".join([
+        f"{BULK_MARKER} begin 0", "Success", f"{BULK_MARKER} end 0 0",
+        f"{BULK_MARKER} begin 1", "Failure [DELETE_FAILED_INTERNAL_ERROR]", "second line", f"{BULK_MARKER} end 1 1",
+        f"{BULK_MARKER} begin 2", "killed mid-way",
+    ])
+    assert parse_bulk_output(output, 4) == [(0, "Success"), (1, "Failure [DELETE_FAILED_INTERNAL_ERROR]\nsecond line"),
+                                            (None, ''), (None, '')]
+
+
+def test_bulk_succeeded_checks_output_too():
+    assert bulk_succeeded(0, "Success")
+    assert not bulk_succeeded(0, "Failure [not installed for 0]")
+    assert not bulk_succeeded(0, "java.lang.SecurityException: denied")
+    assert not bulk_succeeded(1, "")
+    assert not bulk_succeeded(None, "")
+
+
+def test_bulk_chunks_stay_under_limit_and_keep_order():
+    commands = [f"pm uninstall com.example.app{index:05d}" for index in range(2000)]
+    chunks = bulk_chunks(commands, limit=4096)
+    assert len(chunks) > 1
+    assert [command for chunk in chunks for command in chunk] == commands
+    # Indices restart in every chunk, so the marker digits are counted per chunk
+    assert all(len(build_bulk_script(chunk).encode()) <= 4096 for chunk in chunks)
+
+
+def test_oversized_command_gets_its_own_chunk():
+    assert bulk_chunks(['a', 'x' * 5000, 'b'], limit=4096) == [['a'], ['x' * 5000], ['b']]
+    assert bulk_chunks([]) == []
+
+
+def test_chunked_results_line_up_with_commands():
+    commands = [f"echo {index}" for index in range(300)]
+    results = []
+    for chunk in bulk_chunks(commands, limit=2048):
+        script_output = "".join(f"{BULK_MARKER} begin {index}\n{command[5:]}\n{BULK_MARKER} end {index} 0\n"
+                                for index, command in enumerate(chunk))
+        results += parse_bulk_output(script_output, len(chunk))
+    assert results == [(0, str(index)) for index in range(300)]
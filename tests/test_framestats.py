@@ -0,0 +1,32 @@
+from adbhelper import FRAME_DEADLINE_NS, FrameStats, parse_framestats
+
+HEADER = "Flags,IntendedVsync,Vsync,OldestInputEvent,NewestInputEvent,HandleInputStart,FrameCompleted,"
+
+
+def dump(*frames, deadline=False):
+    header = HEADER + ("FrameDeadline," if deadline else "")
+    rows = []
+    for flags, intended, completed, *extra in frames:
+        rows.append(f"{flags},{intended},{intended},0,0,{intended},{completed}," + "".join(f"{value}," for value in extra))
+    return "\n".join(["---PROFILEDATA---", header] + rows + ["---PROFILEDATA---"])
+
+
+def test_parse_framestats_skips_flagged_and_incomplete_rows():
+    output = dump((0, 1000, 9000), (1, 2000, 90000000), (0, 3000, 3000))
+    assert list(parse_framestats(output)) == [(1000, 8000, FRAME_DEADLINE_NS)]
+
+
+def test_parse_framestats_uses_frame_deadline_column():
+    output = dump((0, 1000, 20001000, 8334333), deadline=True)
+    assert list(parse_framestats(output)) == [(1000, 20000000, 8333333)]
+
+
+def test_frame_stats_deduplicates_repeated_dumps():
+    stats = FrameStats(window=3)
+    first = dump((0, 100, 100 + 5000000), (0, 200, 200 + 20000000))
+    assert stats.feed(first) == 2
+    # gfxinfo returns the same frames again plus newer ones
+    assert stats.feed(dump((0, 200, 200 + 20000000), (0, 300, 300 + 1000000), (0, 400, 400 + 30000000))) == 2
+    assert (stats.frames, stats.janky) == (4, 2)
+    assert len(stats.times) == 3 and stats.window_jank() == 2
+    assert stats.percentiles((50,))[50] == 20.0
@@ -0,0 +1,52 @@
+from adbhelper import FtraceSummary
+
+
+def switch(ts, prev, prev_pid, state, nxt, next_pid, cpu=0):
+    return (f"  {prev}-{prev_pid} ( {prev_pid}) [{cpu:03d}] d..3 {ts:.6f}: sched_switch: prev_comm={prev} "
+            f"prev_pid={prev_pid} prev_prio=120 prev_state={state} ==> next_comm={nxt} next_pid={next_pid} "
+            f"next_prio=120").encode()
+
+
+def wakeup(ts, pid, comm='worker'):
+    return f"  <idle>-0 (-----) [000] d..3 {ts:.6f}: sched_wakeup: comm={comm} pid={pid} prio=120 target_cpu=000".encode()
+
+
+def mark(ts, pid, text):
+    return f"  app-{pid} ( 100) [001] ...1 {ts:.6f}: tracing_mark_write: {text}".encode()
+
+
+def test_cpu_time_latency_and_slices():
+    summary = FtraceSummary(worst=2)
+    for line in [
+        switch(1.000, 'swapper', 0, 'R', 'app', 100),
+        wakeup(1.001, 200),
+        switch(1.004, 'app', 100, 'S', 'worker', 200),     # worker waited 3 ms
+        wakeup(1.005, 100, 'app'),
+        switch(1.006, 'worker', 200, 'R', 'app', 100),     # app waited 1 ms, worker preempted
+        switch(1.016, 'app', 100, 'S', 'worker', 200),     # worker waited 10 ms
+        mark(1.007, 101, 'B|100|inflate'),
+        mark(1.009, 101, 'E|100'),
+        b"not a trace line",
+    ]:
+        summary.feed(line)
+    assert summary.lines == 9
+    assert round(summary.cpu_time[100] * 1000, 3) == 14.0
+    assert round(summary.cpu_time[200] * 1000, 3) == 2.0
+    assert sum(summary.latency_buckets) == 3
+    assert {pid: round(value * 1000, 3) for pid, value in summary.latency_max.items()} == {200: 10.0, 100: 1.0}
+    assert [pid for _, _, pid in sorted(summary.worst, reverse=True)] == [200, 200]
+    assert summary.slices['inflate'][0] == 1 and round(summary.slices['inflate'][1] * 1000, 3) == 2.0
+    report = summary.report()
+    assert "Worst wakeup latency by thread:" in report
+    per_thread = report.split("Worst wakeup latency by thread:")[1].strip().splitlines()
+    assert per_thread[0].split()[0] == '10.00' and 'worker (200)' in per_thread[0]
+    assert 'app (100)' in per_thread[1]
+
+
+def test_slice_names_are_bounded():
+    summary = FtraceSummary(max_slices=1)
+    for index, name in enumerate(['a', 'b', 'c']):
+        summary.feed(mark(1.0 + index, 101, f'B|100|{name}'))
+        summary.feed(mark(1.5 + index, 101, 'E|100'))
+    assert sorted(summary.slices) == ['(other)', 'a']
+    assert summary.slices['(other)'][0] == 2
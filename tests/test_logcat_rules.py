@@ -0,0 +1,39 @@
+from adbhelper import LogcatRuleEngine
+
+LINE = "01-01 12:00:00.000  1234  1234 E AndroidRuntime: FATAL EXCEPTION: main NullPointerException"
+
+
+def test_overlapping_rules_all_match():
+    engine = LogcatRuleEngine([
+        {'name': 'fatal', 'pattern': 'FATAL'},
+        {'name': 'fatal exception', 'pattern': 'FATAL EXCEPTION'},
+        {'name': 'exception', 'pattern': 'EXCEPTION'},
+        {'name': 'null any', 'type': 'regex', 'pattern': r'Null\w+'},
+        {'name': 'npe', 'type': 'regex', 'pattern': 'NullPointer'},
+        {'name': 'absent', 'pattern': 'ANR in'},
+    ])
+    assert engine.match(LINE) == [0, 1, 2, 3, 4]
+
+
+def test_rule_reported_once_per_line():
+    engine = LogcatRuleEngine([{'name': 'a', 'pattern': 'ab'}, {'name': 'tag', 'type': 'tag', 'pattern': 'AndroidRuntime'}])
+    assert engine.process("abab ab") == [0]
+    assert engine.process(LINE) == [1]
+    assert engine.summary() == [('a', 1), ('tag', 1)]
+
+
+def test_regexes_with_groups_and_flags_stay_independent():
+    engine = LogcatRuleEngine([
+        {'name': 'start', 'type': 'regex', 'pattern': r'Start proc \d+:(?P<pkg>[\w.]+)'},
+        {'name': 'died', 'type': 'regex', 'pattern': r'Process (?P<pkg>[\w.]+) .*has died'},
+        {'name': 'anr', 'type': 'regex', 'pattern': r'(?i)anr in'},
+        {'name': 'slow', 'type': 'regex', 'pattern': r'(\d+) ms'},
+        {'name': 'double', 'type': 'regex', 'pattern': r'(x)\1'},
+        {'name': 'plain', 'type': 'regex', 'pattern': r'got'},
+    ])
+    assert engine.match('Start proc 123:com.example/u0a1') == [0]
+    assert engine.match('Process com.example (pid 1) has died') == [1]
+    assert engine.match('ANR in com.example') == [2]
+    assert engine.match('took 250 ms') == [3]
+    assert engine.match('got xx here') == [4, 5]
+    assert engine.match('got x here') == [5]
@@ -0,0 +1,30 @@
+from adbhelper import MemoryHistory, parse_meminfo_compact
+
+MEMINFO = """time,12345,67890
+proc,fore,com.example.app,1234,52000,1200,88000,a
+proc,cached,com.example.old,2345,8000,N/A,e
+proc,native,surfaceflinger,600,30000
+proc,native,broken,notapid,100,0,e
+ram,4000000,2000000,1000000
+"""
+
+
+def test_parse_meminfo_compact():
+    processes = parse_meminfo_compact(MEMINFO)
+    assert sorted(processes) == [600, 1234, 2345]
+    assert processes[1234] == {'name': 'com.example.app', 'category': 'fore', 'pss': 52000, 'swap': 1200, 'rss': 88000}
+    # N/A swap and the missing rss column of older releases
+    assert processes[2345]['swap'] is None and processes[2345]['rss'] is None
+    assert processes[600] == {'name': 'surfaceflinger', 'category': 'native', 'pss': 30000, 'swap': None, 'rss': None}
+
+
+def test_memory_history_trend_and_pid_reuse():
+    history = MemoryHistory(samples=5)
+    for minute in range(6):
+        history.add({10: {'name': 'app', 'pss': 1000 + 100 * minute, 'rss': None}}, timestamp=minute * 60)
+    assert len(history.series[(10, 'app')]) == 5
+    assert abs(history.trend(10, 'app') - 100) < 1e-6
+    # A reused pid with another name starts a new series and drops the old one
+    history.add({10: {'name': 'other', 'pss': None, 'rss': 500}}, timestamp=400)
+    assert (10, 'app') not in history.series
+    assert history.trend(10, 'other') is None
@@ -0,0 +1,50 @@
+from adbhelper import NetworkMonitor, parse_network_counters, parse_package_uids
+
+QTAGUID = """qtaguid
+idx iface acct_tag_hex uid_tag_int cnt_set rx_bytes rx_packets tx_bytes tx_packets
+2 wlan0 0x0 10050 0 1000 10 200 2
+3 wlan0 0x0 10050 1 500 5 100 1
+4 wlan0 0x2a00000000 10050 0 999 9 999 9
+5 rmnet0 0x0 1000 0 300 3 400 4
+"""
+
+NETSTATS = """Active interfaces:
+  iface=wlan0 ident=[{type=WIFI}]
+UID stats:
+  ident=[{type=WIFI}] uid=10050 set=DEFAULT tag=0x0
+    NetworkStatsHistory: bucketDuration=7200
+      st=1600000000 rb=1000 rp=10 tb=200 tp=2 op=0
+      st=1600007200 rb=500 rp=5 tb=100 tp=1 op=0
+  ident=[{type=WIFI}] uid=10050 set=DEFAULT tag=0x1
+    NetworkStatsHistory: bucketDuration=7200
+      st=1600000000 rb=777 rp=7 tb=777 tp=7 op=0
+  ident=[{type=MOBILE}] uid=-5 set=DEFAULT tag=0x0
+    NetworkStatsHistory: bucketDuration=7200
+      st=1600000000 rb=300 rp=3 tb=400 tp=4 op=0
+UID tag stats:
+  ident=[{type=WIFI}] uid=10050 set=DEFAULT tag=0x0
+      st=1600000000 rb=99999 rp=1 tb=99999 tp=1 op=0
+"""
+
+
+def test_parse_qtaguid_sums_sets_and_skips_tagged_rows():
+    assert parse_network_counters(QTAGUID) == {10050: [1500, 300], 1000: [300, 400]}
+
+
+def test_parse_netstats_uid_section_only():
+    assert parse_network_counters("netstats\n" + NETSTATS) == {10050: [1500, 300], -5: [300, 400]}
+
+
+def test_parse_package_uids_joins_shared_uids():
+    output = "package:com.b uid:10050\npackage:com.a uid:10050\npackage:android uid:1000\n"
+    assert parse_package_uids(output) == {10050: 'com.a,com.b', 1000: 'android'}
+
+
+def test_peaks_and_names():
+    monitor = NetworkMonitor()
+    monitor.history.append((1.0, [(10050, 'app', 4096.0, 1024.0, 0, 0)]))
+    monitor.history.append((2.0, [(10050, 'app', 1024.0, 0.0, 0, 0), (1000, 'system', 10.0, 10.0, 0, 0)]))
+    assert monitor.peaks() == {10050: 5120.0, 1000: 20.0}
+    monitor.names = {10050: 'com.example'}
+    assert monitor.name(1010050) == 'com.example (user 10)'
+    assert monitor.name(-5) == 'tethering'
@@ -0,0 +1,47 @@
+import subprocess
+
+import pytest
+
+import adbhelper
+from adbhelper import diff_settings, snapshot_settings
+
+
+def test_diff_settings_only_touches_keys_the_target_sets():
+    current = {'system': {'font_scale': '1.0', 'screen_brightness': '100'},
+               'secure': {'android_id': 'aaaa', 'ui_night_mode': '1'},
+               'global': {}, 'props': {'ro.product.model': 'A'}}
+    target = {'system': {'font_scale': '1.3', 'screen_brightness': '100'},
+              'secure': {'android_id': 'bbbb', 'ui_night_mode': '2', 'new_key': 'x'},
+              'global': {'adb_enabled': '0', 'stay_on_while_plugged_in': 'null'},
+              'props': {'ro.product.model': 'B'}}
+    assert diff_settings(current, target) == [
+        ('system', 'font_scale', '1.0', '1.3'),
+        ('secure', 'new_key', None, 'x'),
+        ('secure', 'ui_night_mode', '1', '2'),
+        ('props', 'ro.product.model', 'A', 'B'),
+    ]
+
+
+def fake_bulk(results):
+    return lambda commands, serial=None: results[:len(commands)]
+
+
+def test_snapshot_settings_parses_namespaces(monkeypatch):
+    monkeypatch.setattr(adbhelper, 'shell_tools', lambda serial=None: {'settings': 'cmd settings'})
+    monkeypatch.setattr(adbhelper, 'run_bulk_script', fake_bulk([
+        (0, "font_scale=1.0\nvolume_music=7"), (0, "ui_night_mode=2\nmultiline=a\n  continued"), (0, ""),
+        (0, "[ro.product.model]: [Pixel]\n[ro.secret]: [x]")]))
+    snapshot = snapshot_settings('S1')
+    assert snapshot['system'] == {'font_scale': '1.0', 'volume_music': '7'}
+    assert snapshot['secure'] == {'ui_night_mode': '2', 'multiline': 'a'}
+    assert snapshot['global'] == {}
+    assert snapshot['props'] == {'ro.product.model': 'Pixel'}
+
+
+@pytest.mark.parametrize('failed', [(None, ''), (255, 'cmd: Failure calling service settings'),
+                                    (0, 'Exception occurred while executing:\njava.lang.SecurityException')])
+def test_snapshot_settings_fails_instead_of_dropping_a_namespace(monkeypatch, failed):
+    monkeypatch.setattr(adbhelper, 'shell_tools', lambda serial=None: {'settings': 'settings'})
+    monkeypatch.setattr(adbhelper, 'run_bulk_script', fake_bulk([(0, "a=1"), failed, (0, "b=2"), (0, "")]))
+    with pytest.raises(subprocess.CalledProcessError):
+        snapshot_settings('S1')